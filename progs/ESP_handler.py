@@ -1,21 +1,50 @@
+import asyncio
 import logging 
 from pathlib import Path
 import os
 
-from html_parser import parse_ESP
+from html_parser import HostFileWriter, fetch_ESP
+from runtime import get_runtime
+from tracing import span, traced
 
 logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT = 16       # gleichzeitige ESP-Abfragen
+
 class ESPHandler():
-    def __init__(self, cfg, devs, service):
+    def __init__(self, cfg, devs, service, write_hostfiles: bool = False):
         self.cfg = cfg  
         self.regfile = Path(os.path.join(self.cfg['REGPath'], "regfile.yml"))        
         self.devs = devs
         self.service = service
+        self.hostfiles = HostFileWriter(self.cfg['REGPath']) if write_hostfiles else None
+
+    async def _query_one(self, sem, dev, ip):
+        async with sem:
+            try:
+                with span("esp.query", ip=ip):
+                    status = await fetch_ESP(ip)
+            except Exception as exc:
+                logger.error("Fehler beim Abrufen der HTML-Seite von %s: %s", ip, exc)
+                status = None
+        if status is None:
+            return dev, {}
+        if self.hostfiles is not None:
+            self.hostfiles.add(status)
+        logger.debug("ESP data for %s: %s", dev, status)
+        return dev, status.as_dict()
+
+    @traced("esp.query_all")
+    async def aquery_esp(self):
+        """Alle ESPs nebenläufig abfragen, Host-Dateien danach gebündelt schreiben."""
+        sem = asyncio.Semaphore(MAX_CONCURRENT)
+        tasks = [self._query_one(sem, dev, key[0])
+                 for dev, key in self.devs.items() if "shelly" not in dev.lower()]
+        data = dict(await asyncio.gather(*tasks))
+        if self.hostfiles is not None:
+            with span("esp.hostfiles"):
+                await asyncio.to_thread(self.hostfiles.flush)
+        return data
 
     def query_esp(self):
-        data = {}
-        for dev, key in self.devs.items():
-            if "shelly" not in dev.lower():
-                data[dev] = parse_ESP(key[0])
-                logger.debug("ESP data for %s: %s", dev, data[dev])
-        return data
\ No newline at end of file
+        return get_runtime().run(self.aquery_esp())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARP-Sweep mit asyncio über einen AF_PACKET-Socket, ohne scapy und fping.
+
+- ARP-Requests für alle Adressen des Netzes, gedrosselt auf RATE Pakete/s
+- Antworten werden nebenher eingesammelt (loop.sock_recv)
+- weitere Durchläufe nur für Adressen ohne Antwort; Schluss, sobald ein
+  Durchlauf nichts Neues mehr bringt (oder nach MAX_PASSES)
+- zum Schluss die Nachbartabelle des Kernels (/proc/net/arp) dazunehmen
+
+Braucht CAP_NET_RAW. Für Tests ersetzt FakeArpSocket den Raw-Socket:
+    sock = FakeArpSocket({"192.168.2.47": "aa:bb:cc:dd:ee:ff"})
+    found = asyncio.run(ArpScanner("192.168.2.0/24", sock=sock).scan())
+"""
+
+import asyncio
+import fcntl
+import ipaddress
+import logging
+import socket
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+RATE = 500                # ARP-Requests pro Sekunde
+SETTLE_TIME = 0.3         # Durchlauf ist fertig, wenn so lange keine Antwort mehr kam
+PASS_TIMEOUT = 1.5        # max. Wartezeit auf Antworten nach dem letzten Request
+MAX_PASSES = 3
+PROC_ARP = "/proc/net/arp"
+
+ETH_P_ARP = 0x0806
+SIOCGIFADDR = 0x8915
+SIOCGIFHWADDR = 0x8927
+BROADCAST = b"\xff" * 6
+
+# Ethernet-Header + ARP (IPv4 über Ethernet), auf 60 Byte aufgefüllt
+_FRAME = struct.Struct("!6s6sH HHBBH6s4s6s4s")
+
+# ---------------------------------------------------------------------------
+# Pakete
+# ---------------------------------------------------------------------------
+
+def mac_str(raw: bytes) -> str:
+    return ":".join(f"{b:02x}" for b in raw)
+
+
+def mac_bytes(mac: str) -> bytes:
+    return bytes.fromhex(mac.replace(":", "").replace("-", ""))
+
+
+def build_frame(op: int, src_mac: bytes, src_ip: str, dst_mac: bytes, dst_ip: str) -> bytes:
+    eth_dst = BROADCAST if op == 1 else dst_mac
+    frame = _FRAME.pack(eth_dst, src_mac, ETH_P_ARP, 1, 0x0800, 6, 4, op,
+                        src_mac, socket.inet_aton(src_ip),
+                        b"\0" * 6 if op == 1 else dst_mac, socket.inet_aton(dst_ip))
+    return frame.ljust(60, b"\0")
+
+
+def parse_frame(frame: bytes):
+    """(op, Absender-IP, Absender-MAC, Ziel-IP) oder None, wenn es kein ARP-Paket ist."""
+    if len(frame) < _FRAME.size:
+        return None
+    (_, _, ethertype, _, ptype, _, _, op, sha, spa, _, tpa) = _FRAME.unpack_from(frame)
+    if ethertype != ETH_P_ARP or ptype != 0x0800:
+        return None
+    return op, socket.inet_ntoa(spa), mac_str(sha), socket.inet_ntoa(tpa)
+
+# ---------------------------------------------------------------------------
+# Interface und Kernel-Tabelle
+# ---------------------------------------------------------------------------
+
+def default_interface() -> str | None:
+    """Interface der Default-Route aus /proc/net/route."""
+    try:
+        with open("/proc/net/route") as f:
+            for line in f.readlines()[1:]:
+                parts = line.split()
+                if len(parts) > 1 and parts[1] == "00000000":
+                    return parts[0]
+    except OSError:
+        pass
+    return None
+
+
+def interface_address(iface: str):
+    """(MAC als Bytes, IPv4) des Interfaces über ioctl."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        req = struct.pack("256s", iface.encode()[:15])
+        mac = fcntl.ioctl(s.fileno(), SIOCGIFHWADDR, req)[18:24]
+        ip = socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFADDR, req)[20:24])
+    return mac, ip
+
+
+def read_proc_arp(network=None, path: str = PROC_ARP) -> dict:
+    """{ip: mac} der vollständigen Einträge (Flag 0x2), optional auf ein Netz beschränkt."""
+    net = ipaddress.ip_network(network, strict=False) if network else None
+    found = {}
+    try:
+        with open(path) as f:
+            lines = f.readlines()[1:]
+    except OSError as exc:
+        logger.debug("Could not read %s: %s", path, exc)
+        return found
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 4 or not int(parts[2], 16) & 0x2 or parts[3] == "00:00:00:00:00:00":
+            continue
+        if net is None or ipaddress.ip_address(parts[0]) in net:
+            found[parts[0]] = parts[3].lower()
+    return found
+
+# ---------------------------------------------------------------------------
+# Scanner
+# ---------------------------------------------------------------------------
+
+class ArpScanner:
+    def __init__(self, network: str, iface: str = None, rate: float = RATE,
+                 settle: float = SETTLE_TIME, pass_timeout: float = PASS_TIMEOUT,
+                 max_passes: int = MAX_PASSES, sock=None, proc_arp: str = PROC_ARP):
+        self.network = ipaddress.ip_network(network, strict=False)
+        self.iface = iface
+        self.rate = rate
+        self.settle = settle
+        self.pass_timeout = pass_timeout
+        self.max_passes = max_passes
+        self.proc_arp = proc_arp
+        self._sock = sock
+        self.found = {}               # ip -> mac
+        self.sent = 0
+        self.passes = 0
+        self._last_reply = 0.0
+
+    def _open(self):
+        """Raw-Socket und eigene Adresse; mit einem Fake-Socket dessen Adresse."""
+        if self._sock is not None:
+            return self._sock, self._sock.mac, self._sock.ip
+        iface = self.iface or default_interface()
+        if iface is None:
+            raise OSError("no network interface for the ARP sweep")
+        mac, ip = interface_address(iface)
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+        sock.bind((iface, 0))
+        return sock, mac, ip
+
+    async def _receive(self, sock, own_ip: str) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            reply = parse_frame(await loop.sock_recv(sock, 2048))
+            if reply is None:
+                continue
+            op, ip, mac, target = reply
+            if op != 2 or target != own_ip or ip in self.found:
+                continue
+            if ipaddress.ip_address(ip) in self.network:
+                self.found[ip] = mac
+                self._last_reply = time.monotonic()
+
+    async def _send(self, sock, mac: bytes, own_ip: str, targets) -> None:
+        interval = 1.0 / self.rate
+        start = time.monotonic()
+        for n, ip in enumerate(targets):
+            frame = build_frame(1, mac, own_ip, BROADCAST, ip)
+            while True:
+                try:
+                    sock.send(frame)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(interval)
+            self.sent += 1
+            # Drosselung: Sollzeit des nächsten Pakets abwarten
+            delay = start + (n + 1) * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _wait_settled(self) -> None:
+        # das Ende des Sendens zählt wie eine Antwort: mindestens settle warten
+        self._last_reply = time.monotonic()
+        deadline = self._last_reply + self.pass_timeout
+        while True:
+            now = time.monotonic()
+            if now >= deadline or now - self._last_reply >= self.settle:
+                return
+            await asyncio.sleep(min(self.settle, deadline - now, 0.05))
+
+    async def scan(self) -> dict:
+        """{ip: mac} aller antwortenden Hosts plus der Kernel-Nachbartabelle."""
+        sock, mac, own_ip = self._open()
+        sock.setblocking(False)
+        receiver = asyncio.create_task(self._receive(sock, own_ip))
+        try:
+            hosts = [str(ip) for ip in self.network.hosts() if str(ip) != own_ip]
+            while self.passes < self.max_passes:
+                targets = [ip for ip in hosts if ip not in self.found]
+                if not targets:
+                    break
+                before = len(self.found)
+                self.passes += 1
+                await self._send(sock, mac, own_ip, targets)
+                await self._wait_settled()
+                logger.debug("ARP pass %d: %d requests, %d new replies",
+                             self.passes, len(targets), len(self.found) - before)
+                # Antwortzahl stabil -> weitere Durchläufe bringen nichts
+                if self.passes > 1 and len(self.found) == before:
+                    break
+        finally:
+            receiver.cancel()
+            await asyncio.gather(receiver, return_exceptions=True)
+            if self._sock is None:
+                sock.close()
+
+        for ip, hw in read_proc_arp(self.network, self.proc_arp).items():
+            self.found.setdefault(ip, hw)
+        logger.info("ARP sweep: %d hosts in %d passes (%d requests)",
+                    len(self.found), self.passes, self.sent)
+        return self.found
+
+# ---------------------------------------------------------------------------
+# Fake-Socket für Tests
+# ---------------------------------------------------------------------------
+
+class FakeArpSocket:
+    """
+    Verhält sich wie der Raw-Socket: send() nimmt ARP-Requests an, Antworten
+    der simulierten Hosts kommen über ein echtes socketpair zurück (nach
+    delay Sekunden, mit Verlustrate loss), so dass loop.sock_recv funktioniert.
+    replay(frames) spielt aufgezeichnete Pakete unverändert ein.
+    """
+
+    def __init__(self, hosts: dict, mac: str = "02:00:00:00:00:01", ip: str = None,
+                 delay: float = 0.0, loss: float = 0.0, seed: int = 0):
+        import random
+        self.hosts = {ip_: mac_bytes(hw) for ip_, hw in hosts.items()}
+        self.mac = mac_bytes(mac)
+        self.ip = ip or "192.168.2.2"
+        self.delay = delay
+        self.loss = loss
+        self.requests = []
+        self._rng = random.Random(seed)
+        self._rx, self._tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def fileno(self):
+        return self._rx.fileno()
+
+    def setblocking(self, flag):
+        self._rx.setblocking(flag)
+
+    def recv(self, size):
+        return self._rx.recv(size)
+
+    def recv_into(self, buf, size=0):
+        return self._rx.recv_into(buf, size)
+
+    def send(self, frame: bytes) -> int:
+        request = parse_frame(frame)
+        if request is not None and request[0] == 1:
+            target = request[3]
+            self.requests.append(target)
+            hw = self.hosts.get(target)
+            if hw is not None and self._rng.random() >= self.loss:
+                reply = build_frame(2, hw, target, self.mac, request[1])
+                if self.delay:
+                    asyncio.get_running_loop().call_later(self.delay, self._tx.send, reply)
+                else:
+                    self._tx.send(reply)
+        return len(frame)
+
+    def replay(self, frames) -> None:
+        for frame in frames:
+            self._tx.send(frame)
+
+    def close(self):
+        self._rx.close()
+        self._tx.close()
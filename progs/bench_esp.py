@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-Benchmark: ESP-Statusseite parsen.
+
+Vergleicht den früheren Parser (re.search/re.findall mit Laufzeit-Patterns,
+zwei Dicts, Split pro Schlüssel) mit html_parser.parse_ESP_page auf den
+aufgezeichneten Seiten in bench_data/esp_*.html.
+
+    python bench_esp.py [--number 20000]
+"""
+
+import argparse
+import re
+import timeit
+from pathlib import Path
+
+from html_parser import parse_ESP_page
+
+DATA = Path(__file__).resolve().parent / "bench_data"
+
+
+def legacy_parse(html: str) -> dict:
+    """Der frühere parse_ESP ohne HTTP und Dateischreiben."""
+    div1_content = re.search(r'<div1>(.*?)</div1>', html, re.DOTALL).group(1)
+    matches2 = re.findall(r'([^:<]+):\s*([^<]+)', div1_content)
+    data = {key: value for key, value in matches2}
+    data_dict = {}
+    for key, value in data.items():
+        if key.startswith("/h3>\r\n-----> "):
+            cleaned_key = key.split("V", 1)[-1]
+            version = cleaned_key.split(" ", 1)[0]
+            data_dict["Version"] = f"V{version}"
+        else:
+            data_dict[key.split(">")[-1]] = value.strip()
+    data_dict.setdefault("Hostname", "ESP_Device ohne Hostname")
+    return data_dict
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'page':22} {'legacy us':>10} {'new us':>10} {'speedup':>8}")
+    for path in sorted(DATA.glob("esp_*.html")):
+        raw = path.read_bytes()
+        text = raw.decode("utf-8")
+        status = parse_ESP_page(raw)
+        assert status is not None and status.hostname == legacy_parse(text)["Hostname"]
+
+        # legacy bekam Text (requests .text), der neue Parser rohe Bytes
+        t_old = min(timeit.repeat(lambda: legacy_parse(text), number=args.number, repeat=3))
+        t_new = min(timeit.repeat(lambda: parse_ESP_page(raw), number=args.number, repeat=3))
+        us_old = 1e6 * t_old / args.number
+        us_new = 1e6 * t_new / args.number
+        print(f"{path.name:22} {us_old:>10.2f} {us_new:>10.2f} {us_old / us_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import-Zeit der Einstiegsmodule mit python -X importtime.
+
+Jedes Modul wird in einem frischen Interpreter importiert; gemessen wird die
+kumulierte Zeit des Moduls (bester von --repeat Läufen). Der Lauf schlägt
+fehl (Exit-Code 1), wenn ein Modul das Budget überschreitet oder eines der
+schweren Backends (scapy, zeroconf, httpx, requests) schon beim Import lädt.
+
+    python bench_import.py [--budget 150] [--top 8] [deco main network_scanner]
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+
+MODULES = ("deco", "main", "network_scanner", "scheduler")
+BUDGET_MS = 150.0
+FORBIDDEN = ("scapy", "zeroconf", "httpx", "requests")
+
+
+def importtime(module: str):
+    """({Modul: kumulierte µs}, Gesamtzeit von module in µs) aus einem frischen Prozess."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=HERE, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    times = {}
+    total = None
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue                          # Kopfzeile
+        times[name.strip()] = int(cumulative)
+        if name == f" {module}":                  # oberste Ebene, nicht verschachtelt
+            total = int(cumulative)
+    return times, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--budget", type=float, default=BUDGET_MS, help="ms pro Modul")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=0, help="die teuersten Importe zeigen")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':20} {'ms':>8} {'budget':>8}  status")
+    for module in args.modules:
+        runs = [importtime(module) for _ in range(args.repeat)]
+        times, total = min(runs, key=lambda run: run[1])
+        ms = total / 1000
+        heavy = sorted({name.split(".")[0] for name in times} & set(FORBIDDEN))
+        status = "ok"
+        if heavy:
+            status = f"FAIL: lädt {', '.join(heavy)}"
+        elif ms > args.budget:
+            status = "FAIL: über Budget"
+        failed |= status != "ok"
+        print(f"{module:20} {ms:>8.1f} {args.budget:>8.0f}  {status}")
+        if args.top:
+            top = sorted(((us, name) for name, us in times.items() if name != module), reverse=True)
+            for us, name in top[:args.top]:
+                print(f"    {name:40} {us / 1000:>8.1f} ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
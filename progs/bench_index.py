@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: Abfragen auf der Registry, Dict-Scan gegen RegistryIndex.
+
+Synthetische Geräte (Shelly-Modelle, Kategorien, Fähigkeiten, ein Teil
+offline). Gemessen werden typische Abfragen, einmal wie bisher als
+Schleife über das Registry-Dict, einmal über die Indizes:
+
+    ip        Gerät an einer IP
+    mac       Gerät zu einer MAC
+    plugs     alle Plugs, die offline sind
+    meter     alle Geräte mit Fähigkeit "meter", die online sind
+    offline   mark_offline_devices (nur wenige sind veraltet)
+
+    python bench_index.py [--devices 10000] [--queries 200]
+"""
+
+import argparse
+import random
+import time
+
+from registry_index import RegistryIndex
+
+MODELS = {
+    "SNSW-001X16EU": ("Switch", ["switch", "input"]),
+    "SNPL-00112EU": ("PowerSwitch", ["switch", "meter"]),
+    "S4PL-00416EU": ("PowerSwitch", ["switch", "meter", "input"]),
+    "SNDM-0013US": ("Light", ["light", "input"]),
+    "ESP32": ("Generic", []),
+}
+
+
+def make_registry(count: int, offline: float, rnd: random.Random) -> dict:
+    now = time.time()
+    devices = {}
+    for i in range(count):
+        model = rnd.choice(list(MODELS))
+        category, caps = MODELS[model]
+        mac = f"c8f09e{i:06x}"
+        present = rnd.random() >= offline
+        devices[mac] = {
+            "mac": mac,
+            "ip": f"10.{i // 65536}.{i // 256 % 256}.{i % 256}",
+            "name": f"device-{i:06d}",
+            "model": model,
+            "category": category,
+            "capabilities": list(caps),
+            "present": present,
+            # wenige Online-Geräte sind veraltet, die übrigen frisch
+            "last_seen": now - (120 if present and rnd.random() < 0.01 else 5),
+        }
+    return devices
+
+# ---------------------------------------------------------------------------
+# Bisher: Schleifen über das Dict
+# ---------------------------------------------------------------------------
+
+def scan_ip(reg: dict, ip):
+    return next((d for d in reg.values() if d.get("ip") == ip), None)
+
+
+def scan_mac(reg: dict, mac):
+    return next((d for d in reg.values() if d.get("mac") == mac), None)
+
+
+def scan_plugs_offline(reg: dict):
+    return [d for d in reg.values() if d.get("model") == "SNPL-00112EU" and not d.get("present")]
+
+
+def scan_meter_online(reg: dict):
+    return [d for d in reg.values() if "meter" in d.get("capabilities", []) and d.get("present")]
+
+
+def scan_mark_offline(reg: dict, now: float, max_age: float = 30):
+    stale = []
+    for device_id, dev in reg.items():
+        if dev.get("present") and now - dev.get("last_seen", 0) > max_age:
+            dev["present"] = False
+            stale.append(device_id)
+    return stale
+
+# ---------------------------------------------------------------------------
+# Ablauf
+# ---------------------------------------------------------------------------
+
+def timed(fn, args_list) -> float:
+    """Mittlere Zeit pro Aufruf in Mikrosekunden."""
+    t0 = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return 1e6 * (time.perf_counter() - t0) / len(args_list)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--offline", type=float, default=0.1)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    devices = make_registry(args.devices, args.offline, rnd)
+    t0 = time.perf_counter()
+    index = RegistryIndex(devices)
+    build = time.perf_counter() - t0
+
+    picks = [devices[k] for k in rnd.sample(list(devices), min(args.queries, len(devices)))]
+    ips = [(d["ip"],) for d in picks]
+    macs = [(d["mac"],) for d in picks]
+    repeat = [()] * max(1, args.queries // 10)
+    now = time.time()
+
+    # gleiche Ergebnisse, sonst ist der Vergleich wertlos
+    assert len(scan_plugs_offline(devices)) == index.count(model="SNPL-00112EU", present=False)
+    assert len(scan_meter_online(devices)) == index.count(capability="meter", present=True)
+
+    rows = [
+        ("ip", timed(lambda ip: scan_ip(devices, ip), ips), timed(index.by_ip, ips)),
+        ("mac", timed(lambda mac: scan_mac(devices, mac), macs), timed(index.by_mac, macs)),
+        ("plugs", timed(lambda: scan_plugs_offline(devices), repeat),
+         timed(lambda: index.find(model="SNPL-00112EU", present=False), repeat)),
+        ("meter", timed(lambda: scan_meter_online(devices), repeat),
+         timed(lambda: index.find(capability="meter", present=True), repeat)),
+        # der erste Aufruf setzt die veralteten Geräte offline, danach nur noch Prüfung
+        ("offline", timed(lambda: scan_mark_offline(devices, now), repeat),
+         timed(lambda: index.mark_offline(30, now), repeat)),
+    ]
+
+    print(f"{args.devices} devices, index built in {1000 * build:.1f} ms")
+    print(f"{'query':10} {'scan us':>12} {'index us':>12} {'speedup':>10}")
+    for name, scan, indexed in rows:
+        print(f"{name:10} {scan:>12.1f} {indexed:>12.1f} {scan / max(indexed, 1e-9):>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
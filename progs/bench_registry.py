@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: Registry-Update mit synthetischen Geräten.
+
+Vergleicht das frühere Verfahren (regfile.yml komplett laden, ändern und
+mit yaml.safe_dump komplett neu schreiben) mit registry.update_registry
+auf Basis von RegistryStore. Pro Durchlauf werden alle Geräte gesehen,
+ein kleiner Teil ändert IP/Name, einige fehlen.
+
+    python bench_registry.py [--devices 5000] [--passes 5] [--churn 0.01]
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+from registry import registry
+
+
+def make_scan(count: int, churn: float, rnd: random.Random) -> dict:
+    devs = {}
+    for i in range(count):
+        if rnd.random() < churn / 2:
+            continue                                    # Gerät diesmal nicht gefunden
+        ip = f"10.{i // 65536}.{i // 256 % 256}.{i % 256}"
+        if rnd.random() < churn:
+            ip = f"10.99.{rnd.randrange(256)}.{rnd.randrange(256)}"   # neue DHCP-Adresse
+        devs[f"device-{i:06d}"] = (ip, f"device-{i:06d}._http._tcp.local.")
+    return devs
+
+
+def legacy_update(regfile: Path, devs: dict) -> None:
+    """Das bisherige registry.update_registry/save_registry (YAML komplett)."""
+    previous = {}
+    if regfile.exists():
+        with regfile.open("r", encoding="utf-8") as f:
+            previous = yaml.safe_load(f) or {}
+    updated = previous.copy()
+    for dev in updated.values():
+        dev["present"] = False
+    for device_id, data in devs.items():
+        entry = updated.setdefault(device_id, {})
+        entry["data"] = list(data)
+        entry["model"] = data[1]
+        entry["present"] = True
+        entry["last_seen"] = int(time.time())
+    with regfile.open("w", encoding="utf-8") as f:
+        yaml.safe_dump(updated, f, sort_keys=True, default_flow_style=False, allow_unicode=True)
+
+
+def bench(fn, scans) -> list:
+    times = []
+    for devs in scans:
+        t0 = time.perf_counter()
+        fn(devs)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--passes", type=int, default=5)
+    parser.add_argument("--churn", type=float, default=0.01)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    scans = [make_scan(args.devices, args.churn, rnd) for _ in range(args.passes + 1)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_file = Path(tmp) / "legacy.yml"
+        legacy_update(legacy_file, scans[0])             # Ausgangszustand
+        legacy = bench(lambda d: legacy_update(legacy_file, d), scans[1:])
+
+        reg = registry({"REGPath": tmp})
+        reg.update_registry(scans[0], None)
+        store = bench(lambda d: reg.update_registry(d, None), scans[1:])
+        reg.close()
+
+    print(f"{args.devices} devices, {args.passes} passes, churn {args.churn:.1%}")
+    print(f"{'':10} {'mean ms':>10} {'max ms':>10}")
+    for name, times in (("yaml", legacy), ("store", store)):
+        print(f"{name:10} {1000 * sum(times) / len(times):>10.1f} {1000 * max(times):>10.1f}")
+    print(f"speedup    {sum(legacy) / sum(store):>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: Scan-Dauer (identify_all) über die Anzahl der Hosts.
+
+Die Geräte werden lokal simuliert (simulator.FakeFleet), jedes mit einer
+künstlichen Antwortzeit. Aufruf:
+
+    python bench_scan.py [--hosts 16,64,256,1024] [--latency 0.05]
+"""
+
+import argparse
+import asyncio
+import logging
+import resource
+import time
+
+from network_scanner import NetworkScanner
+from simulator import make_fleet
+
+logger = logging.getLogger(__name__)
+
+
+def raise_fd_limit(needed: int) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+
+def run(count: int, latency: float, concurrency: int) -> tuple[float, int]:
+    cfg = {"TargetNet": "", "ScanConcurrency": concurrency}
+    with make_fleet(count, latency) as fleet:
+        scanner = NetworkScanner(cfg)
+        t0 = time.perf_counter()
+        devices = asyncio.run(scanner.identify_all(fleet.hosts))
+        elapsed = time.perf_counter() - t0
+    known = sum(1 for d in devices if d["Device"] != "unknown")
+    return elapsed, known
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hosts", default="16,64,256,1024")
+    parser.add_argument("--latency", type=float, default=0.05, help="Antwortzeit je Request in s")
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    sizes = [int(n) for n in args.hosts.split(",")]
+    raise_fd_limit(4 * max(sizes) + 256)
+
+    print(f"latency={args.latency}s  concurrency={args.concurrency}")
+    print(f"{'hosts':>7} {'seconds':>9} {'hosts/s':>9} {'identified':>11}")
+    for count in sizes:
+        elapsed, known = run(count, args.latency, args.concurrency)
+        print(f"{count:>7} {elapsed:>9.3f} {count / elapsed:>9.1f} {known:>11}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark-Suite für die Funktionen, die in jedem Zyklus laufen.
+
+Eingaben sind fest aufgezeichnet (bench_data/): ESP-Statusseiten
+(esp_*.html), Shelly.GetStatus dreier Geräte (shelly_status.json) und ein
+mDNS-Scan (scan.json, für die Registry auf --devices vervielfacht).
+Netzwerkpfade laufen gegen simulator.FakeFleet im selben Prozess.
+
+    parse_ESP_page             ESP-Seite parsen (ohne Netz)
+    parse_ESP                  GET + parsen über den Transport
+    update_registry            registry.update_registry, unveränderter Scan
+    update_registry_churn      dito, 1% der Geräte mit neuer IP
+    save_registry              registry.save_registry mit komplettem Stand
+    caps_from_components       Fähigkeiten aus einem GetStatus
+    detect_capabilities        ShellyHandler.detect_capabilities (RPC, ohne Cache)
+    derive_category_from_caps  ShellyHandler.derive_category_from_caps
+    identify_device            NetworkScanner.identify_device, je Profil ein Gerät
+    print_registry             shelly_lastreg.print_registry (Ausgabe verworfen)
+
+Die Netzwerk-Benchmarks streuen stärker und gelten erst ab NETWORK_THRESHOLD
+als Regression.
+
+Jeder Benchmark wird kalibriert (ein Durchlauf >= --min-time), dann --repeat
+mal gemessen. Verglichen wird das Minimum pro Aufruf (wie timeit: Störungen
+durch andere Prozesse machen nur langsamer); der Median steht mit im JSON.
+
+    python bench_suite.py                              # messen, Tabelle
+    python bench_suite.py --save results.json          # Ergebnis als JSON
+    python bench_suite.py --update-baseline            # bench_data/baseline.json schreiben
+    python bench_suite.py --baseline bench_data/baseline.json --threshold 0.2
+                                                       # Exit 1 bei > 20% langsamer
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DATA = Path(__file__).resolve().parent / "bench_data"
+BASELINE = DATA / "baseline.json"
+THRESHOLD = 0.2           # erlaubte Verlangsamung gegenüber der Baseline
+NETWORK_THRESHOLD = 0.5   # mindestens so viel für Benchmarks über Sockets (Verbindungsaufbau streut)
+MIN_TIME = 0.2            # Sekunden pro Messdurchlauf mindestens
+REPEAT = 5
+REGISTRY_DEVICES = 1000
+
+BENCHMARKS = {}           # name -> setup(ctx), liefert die zu messende Funktion
+NETWORK = set()           # Benchmarks gegen die simulierte Flotte
+
+
+def benchmark(name: str, network: bool = False):
+    """Registriert setup(ctx); setup liefert die zu messende Funktion ohne Argumente."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        if network:
+            NETWORK.add(name)
+        return setup
+    return register
+
+# ---------------------------------------------------------------------------
+# Eingaben
+# ---------------------------------------------------------------------------
+
+class Context:
+    """Gemeinsame Eingaben und Ressourcen, erst bei Bedarf angelegt."""
+
+    def __init__(self, devices: int):
+        self.devices = devices
+        self.tmp = tempfile.TemporaryDirectory()
+        self._fleet = None
+        self.closers = []
+
+    def esp_pages(self) -> list:
+        return [p.read_bytes() for p in sorted(DATA.glob("esp_*.html"))]
+
+    def shelly_status(self) -> dict:
+        with open(DATA / "shelly_status.json", encoding="utf-8") as f:
+            return json.load(f)
+
+    def scan(self, devices: int = None) -> dict:
+        """Aufgezeichneter Scan, vervielfacht auf devices Einträge (gleiche Reihenfolge bei jedem Lauf)."""
+        with open(DATA / "scan.json", encoding="utf-8") as f:
+            recorded = list(json.load(f).items())
+        devices = devices or self.devices
+        result = {}
+        for i in range(devices):
+            host, (ip, name) = recorded[i % len(recorded)]
+            n = i // len(recorded)
+            result[f"{host}-{n}"] = (f"10.{n // 256}.{n % 256}.{ip.rsplit('.', 1)[1]}", name)
+        return result
+
+    def cfg(self, sub: str) -> dict:
+        path = Path(self.tmp.name) / sub
+        path.mkdir(exist_ok=True)
+        return {"REGPath": str(path), "TargetNet": "127.0.0.1/32"}
+
+    def fleet(self):
+        """Je ein simuliertes Gerät pro Profil; Gen2 mit dem aufgezeichneten Status."""
+        if self._fleet is None:
+            from simulator import FakeDevice, FakeFleet, PROFILES
+            devices = [FakeDevice(p, f"bench-{i:012X}") for i, p in enumerate(PROFILES)]
+            devices[0].status = self.shelly_status()["shellyplusplugs-80646fe1d2c8"]
+            self._fleet = FakeFleet(devices).start()
+        return self._fleet
+
+    def close(self) -> None:
+        for close in self.closers:
+            close()
+        if self._fleet is not None:
+            self._fleet.stop()
+        self.tmp.cleanup()
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+@benchmark("parse_ESP_page")
+def _parse_esp_page(ctx):
+    from html_parser import parse_ESP_page
+    pages = ctx.esp_pages()
+
+    def run():
+        for page in pages:
+            parse_ESP_page(page)
+    return run
+
+
+@benchmark("parse_ESP", network=True)
+def _parse_esp(ctx):
+    from html_parser import parse_ESP
+    ip = next(d.ip for d in ctx.fleet().devices if d.profile == "esp")
+    return lambda: parse_ESP(ip)
+
+
+@benchmark("update_registry")
+def _update_registry(ctx):
+    from registry import registry
+    reg = registry(ctx.cfg("update"))
+    scan = ctx.scan()
+    reg.update_registry(scan, None)
+    return lambda: reg.update_registry(scan, None)
+
+
+@benchmark("update_registry_churn")
+def _update_registry_churn(ctx):
+    from registry import registry
+    reg = registry(ctx.cfg("churn"))
+    base = ctx.scan()
+    reg.update_registry(base, None)
+    keys = list(base)
+    step = max(1, len(keys) // 100)
+    scans = []
+    for k in range(4):
+        scan = dict(base)
+        for host in keys[k::step]:
+            ip, name = scan[host]
+            scan[host] = (f"172.16.{k}.{ip.rsplit('.', 1)[1]}", name)
+        scans.append(scan)
+    state = {"i": 0}
+
+    def run():
+        state["i"] += 1
+        reg.update_registry(scans[state["i"] % len(scans)], None)
+    return run
+
+
+@benchmark("save_registry")
+def _save_registry(ctx):
+    from registry import registry
+    reg = registry(ctx.cfg("save"))
+    reg.update_registry(ctx.scan(), None)
+    snapshot = {k: dict(v) for k, v in reg.store.devices.items()}
+    return lambda: reg.save_registry(snapshot)
+
+
+@benchmark("caps_from_components")
+def _caps_from_components(ctx):
+    from shelly_handler import caps_from_components
+    statuses = list(ctx.shelly_status().values())
+
+    def run():
+        for status in statuses:
+            caps_from_components(status)
+    return run
+
+
+@benchmark("detect_capabilities", network=True)
+def _detect_capabilities(ctx):
+    from shelly_handler import ShellyHandler
+    handler = ShellyHandler({})
+    ip = next(d.ip for d in ctx.fleet().devices if d.profile == "shelly2")
+    # ohne device_id/firmware_id -> kein Cache, jedes Mal ein RPC
+    return lambda: handler.detect_capabilities(ip)
+
+
+@benchmark("derive_category_from_caps")
+def _derive_category(ctx):
+    from shelly_handler import ShellyHandler, caps_from_components
+    handler = ShellyHandler({})
+    caps = [caps_from_components(s) for s in ctx.shelly_status().values()]
+    caps += [["cover", "input"], ["em"], ["generic"]]
+
+    def run():
+        for c in caps:
+            handler.derive_category_from_caps(c)
+    return run
+
+
+@benchmark("identify_device", network=True)
+def _identify_device(ctx):
+    from network_scanner import NetworkScanner
+    from runtime import get_runtime
+    hosts = ctx.fleet().hosts
+    scanner = NetworkScanner(ctx.cfg("scan"), method="STATIC", hosts=hosts)
+    rt = get_runtime()
+    # ein Client über die ganze Messung: identify_all legt pro Aufruf Clients
+    # und SSL-Kontext an, das würde die Identifikation selbst überdecken
+    client = rt.run(_make_client())
+    ctx.closers.append(lambda: rt.run(client.aclose()))
+    # alle Profile einmal, inkl. eines Hosts ohne Profil
+    return lambda: rt.run(scanner.identify_all(hosts, client))
+
+
+async def _make_client():
+    import httpx
+    return httpx.AsyncClient()
+
+
+@benchmark("print_registry")
+def _print_registry(ctx):
+    from registry_index import RegistryIndex
+    from shelly_handler import caps_from_components
+    from shelly_lastreg import categorize_device, print_registry
+    statuses = list(ctx.shelly_status().values())
+    index = RegistryIndex()
+    for i, (host, (ip, _)) in enumerate(ctx.scan().items()):
+        caps = caps_from_components(statuses[i % len(statuses)])
+        index.put(host, ip=ip, name=host, model=host.split("-", 1)[0], capabilities=caps,
+                  category=categorize_device(caps), present=i % 7 != 0)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            print_registry(index)
+    return run
+
+# ---------------------------------------------------------------------------
+# Messung
+# ---------------------------------------------------------------------------
+
+def measure(fn, min_time: float, repeat: int) -> dict:
+    """Median und Minimum pro Aufruf in Mikrosekunden."""
+    fn()                                        # aufwärmen (Verbindungen, Caches)
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 2 if elapsed * 4 >= min_time else 10
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append(1e6 * (time.perf_counter() - t0) / number)
+    return {"us": round(statistics.median(runs), 3), "min_us": round(min(runs), 3),
+            "number": number, "repeat": repeat}
+
+
+def run_suite(names, devices: int, min_time: float, repeat: int) -> dict:
+    ctx = Context(devices)
+    results = {}
+    try:
+        for name in names:
+            fn = BENCHMARKS[name](ctx)
+            results[name] = measure(fn, min_time, repeat)
+            print(f"  {name:28} {results[name]['us']:>12.1f} us", file=sys.stderr)
+    finally:
+        ctx.close()
+        from runtime import get_runtime
+        get_runtime().stop()
+    return {"meta": {"python": platform.python_version(), "machine": platform.machine(),
+                     "node": platform.node(), "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                     "devices": devices},
+            "results": results}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """[(name, baseline us, current us, Änderung)] und die Namen der Regressionen."""
+    rows, regressions = [], []
+    for name, res in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            rows.append((name, None, res["min_us"], None))
+            continue
+        change = res["min_us"] / base["min_us"] - 1 if base["min_us"] else 0.0
+        rows.append((name, base["min_us"], res["min_us"], change))
+        if change > (max(threshold, NETWORK_THRESHOLD) if name in NETWORK else threshold):
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", "--filter", help="nur Benchmarks, deren Name das enthält")
+    parser.add_argument("--devices", type=int, default=REGISTRY_DEVICES)
+    parser.add_argument("--min-time", type=float, default=MIN_TIME)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--save", type=Path, help="Ergebnis als JSON schreiben")
+    parser.add_argument("--baseline", type=Path, help=f"vergleichen, z.B. {BASELINE.relative_to(DATA.parent)}")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--update-baseline", action="store_true", help=f"Ergebnis als {BASELINE.name} ablegen")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    names = [n for n in BENCHMARKS if not args.filter or args.filter in n]
+    current = run_suite(names, args.devices, args.min_time, args.repeat)
+    current["meta"]["threshold"] = args.threshold
+
+    for path in filter(None, (args.save, BASELINE if args.update_baseline else None)):
+        path.write_text(json.dumps(current, indent=2) + "\n", encoding="utf-8")
+        print(f"written {path}", file=sys.stderr)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    rows, regressions = compare(current, baseline, args.threshold)
+
+    print(f"{'benchmark':28} {'baseline us':>12} {'current us':>12} {'change':>8}")
+    for name, base, cur, change in rows:
+        mark = "  REGRESSION" if name in regressions else ""
+        base_s = f"{base:>12.1f}" if base is not None else f"{'-':>12}"
+        change_s = f"{change:>+8.1%}" if change is not None else f"{'':>8}"
+        print(f"{name:28} {base_s} {cur:>12.1f} {change_s}{mark}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
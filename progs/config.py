@@ -13,9 +13,40 @@ from threadmanager import ThreadManager
 
 logger = logging.getLogger(__name__)
 
+class LazyConfig(dict):
+    """
+    dict, dessen netzabhängige Werte (z.B. My_IP) erst beim ersten Zugriff
+    ermittelt werden. Einmal aufgelöst, steht der Wert ganz normal im dict.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._resolvers = {}
+
+    def lazy(self, key, resolver):
+        self._resolvers[key] = resolver
+
+    def __missing__(self, key):
+        resolver = self._resolvers.pop(key, None)
+        if resolver is None:
+            raise KeyError(key)
+        value = self[key] = resolver()
+        return value
+
+    def get(self, key, default=None):
+        # dict.get ruft __missing__ nicht auf
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self._resolvers
+
+
 class InitManager:
     def __init__(self, progname: str):
-        self.ini = {}
+        self.ini = LazyConfig()
         self.progname = progname
         self.load_init()
         
@@ -60,12 +91,14 @@ class InitManager:
         ini['test_webserver'] = confyml['misc']['test_webserver']
         ini['Mailing'] = confyml['debug']['Mailing']
         ini['MyName'] = socket.gethostname()
-        ini['My_IP'] = self.get_external_ip()
+        ini.lazy('My_IP', self.get_external_ip)     # UDP-Socket erst, wenn jemand die IP braucht
         system = platform.system()
         ini['System'] = system
         ini['ProgramName'] = self.progname
         ini['Tasks'] = confyml['DeSeTask'][system]
         ini['TargetNet'] = confyml['Communication']['TargetNet']
+        # Modul-Einstellungen (ScanConcurrency, PresenceMissed, MetricsPort, ...), siehe config.yml
+        ini.update({k: v for k, v in (confyml.get('Tuning') or {}).items() if v is not None})
         
         logging.basicConfig(
             level=getattr(logging, confyml['misc']["loglevel"].upper(), logging.INFO), # INFO is default  
@@ -144,6 +144,10 @@ class InitManager:
             raise RuntimeError("Config key 'DeSeTask' must be a mapping.")
         ini["Tasks"] = tasks_by_system.get(ini["System"], [])
         ini["TargetNet"] = self._safe_get(confyml, ["Communication", "TargetNet"], "")
+        tuning = self._safe_get(confyml, ["Tuning"], {}) or {}
+        if not isinstance(tuning, dict):
+            raise RuntimeError("Config key 'Tuning' must be a mapping.")
+        ini.update({k: v for k, v in tuning.items() if v is not None})
 
         self._setup_logging(ini, confyml)
         logger.info("")
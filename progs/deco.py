@@ -1,20 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 ###############################################################
-from zeroconf import Zeroconf, ServiceBrowser, ServiceListener
-import time
 import logging 
 import os
-import threading
-import asyncio
 from network_scanner import NetworkScanner
-import httpx
 
 import config as config
-from shelly_handler import ShellyHandler
-from ESP_handler import ESPHandler
+import tracing
+from discovery import get_discovery_service, running_discovery_service
+from metrics import start_metrics_server
 from registry import registry
-from html_parser import parse_ESP
+from runtime import get_runtime
 
 logger = logging.getLogger(__name__)
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -24,80 +20,30 @@ logging.getLogger("httpcore").setLevel(logging.WARNING)
 # Konfiguration
 # ---------------------------------------------------------------------------
 
-DISCOVERY_TIME = 5.0      # Sekunden für mDNS-Sammlung
 HTTP_TIMEOUT = 5.0       # HTTP-Timeout pro Gerät
 
-# ---------------------------------------------------------------------------
-# mDNS Listener
-# ---------------------------------------------------------------------------
-
-class DevListener(ServiceListener):
-    def __init__(self):
-        self.devinfo = {}
-        self.service = {}
-        self._lock = threading.Lock()
-
-    def add_service(self, zeroconf, service_type, name):
-        info = zeroconf.get_service_info(service_type, name)
-        if info:
-            if not info:
-                logger.debug("mDNS service without info: %s", name)
-                return
-
-            addresses = info.parsed_addresses()
-            if not addresses:
-                logger.debug("mDNS service without address: %s", name)
-                return
-
-            with self._lock:
-                ip = addresses[0]
-                self.devinfo[info.server.replace(".local.", "")] = (ip, info.name)
-                self.service[info.server.replace(".local.", "")] = info
-                logger.debug("mDNS found device at %s (%s)", ip, name)
-
-    def update_service(self, zeroconf, service_type, name):
-        logger.debug("### mDNS service updated: ### %s", name)
-        pass
-
-    def remove_service(self, zeroconf, service_type, name):
-        logger.debug("### mDNS service removed ###: %s", name)
-        pass
-
 # ---------------------------------------------------------------------------
 # Discovery
 # ---------------------------------------------------------------------------
 
-def discover_devices() -> dict:
-    logger.debug("Starting mDNS discovery")
-
-    zeroconf = Zeroconf()
-    listener = DevListener()
-
-    ServiceBrowser(zeroconf, "_http._tcp.local.", listener)
-    time.sleep(DISCOVERY_TIME)
-    zeroconf.close()
-
-    logger.info(f"Discovery complete: {len(listener.devinfo)} devices found.")
-    return listener.devinfo, listener.service
+def discover_devices() -> tuple[dict, dict]:
+    """Aktueller Stand des laufenden mDNS-Dienstes (wartet nur beim ersten Aufruf)."""
+    devinfo, service = get_discovery_service().snapshot()
+    logger.info(f"Discovery complete: {len(devinfo)} devices found.")
+    return devinfo, service
 
-    found = {}
 
-    for ip in listener.ips:
-        result = sh._query_shelly(ip)
-        if result:
-            device_id, data = result
-            found[device_id] = data
-
-    logger.info("Discovery complete: %d devices found.", len(found))
-    return found
-
-
-async def main(cfg):
+async def main(cfg, reg):
+    """reg: registry(cfg); der Aufrufer schließt sie (close), damit last_seen-Änderungen gespeichert werden."""
+    rt = get_runtime()
     scanner = NetworkScanner(cfg)
+
+    # mDNS-Meldungen gebündelt in die Registry, im Loop statt im zeroconf-Thread
+    get_discovery_service().subscribe_batched(reg.apply_discoveries, rt)
     
-    # 1. Nur die IPs holen
+    # 1. Nur die IPs holen (blockiert -> Executor, nicht der Loop)
     logger.info(f"--- Starte Discovery in 192.168.2.0/24 ---") #{self.target_network} 
-    ips = scanner.discover_network()
+    ips = await rt.to_thread(scanner.discover_network)
     #print(f"Gefundene IPs: {ips}")
 
     # Hier könntest du jetzt manuell IPs hinzufügen oder entfernen
@@ -105,13 +51,12 @@ async def main(cfg):
 
     # 2. Die Liste abarbeiten
     if ips:
-        async with httpx.AsyncClient() as client:
-            tasks = [scanner.identify_device(ip, client) for ip in ips]
-            devices = await asyncio.gather(*tasks)
-            
-            logger.debug("     Device discovery scan")
-            for d in devices:
-                logger.debug(f"{d['ip']:<15} | {d['Device']:<10} | {d['model']}")
+        # unveränderte Hosts (gleiche MAC, IP, mDNS-Name) kommen aus dem Identitäts-Cache
+        devices = await scanner.identify_changed(ips)
+
+        logger.debug("     Device discovery scan")
+        for d in devices:
+            logger.debug(f"{d['ip']:<15} | {d['Device']:<10} | {d['model']}")
         logger.info(f"dicovered devices: {len(ips)}")
 
 # ---------------------------------------------------------------------------
@@ -123,8 +68,23 @@ if __name__ == "__main__":
     current_file_name = os.path.basename(current_file_path)
 
     cfg = config.InitManager(current_file_name).ini
+    start_metrics_server(cfg)
+    tracing.from_cfg(cfg)
 
-    asyncio.run(main(cfg))
+    rt = get_runtime()
+    reg = registry(cfg)
+    try:
+        rt.run(main(cfg, reg))
+    finally:
+        svc = running_discovery_service()
+        if svc is not None:
+            svc.stop()                  # keine neuen mDNS-Meldungen mehr
+        rt.stop()                       # leert den Discovery-Channel in die Registry
+        reg.close()                     # schreibt auch reine last_seen-Änderungen
+        cfg['ThreadManager'].stop_all()
+        if tracing.enabled():
+            tracing.export_chrome(os.path.join(cfg['LogPath'], "deco_trace.json"))
+            tracing.export_folded(os.path.join(cfg['LogPath'], "deco_trace.folded"))
     
 """    
     devs, service = discover_devices()
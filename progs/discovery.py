@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dauerhafter mDNS-Discovery-Dienst.
+
+Ein gemeinsamer Zeroconf mit einem ServiceBrowser läuft im Hintergrund.
+add/update/remove-Meldungen landen sofort in einer Tabelle
+(hostname -> (ip, service name)) und werden an Abonnenten, z.B. die
+Registry, weitergereicht. Abfragen lesen nur die Tabelle, es gibt keine
+Wartezeit pro Scan.
+
+Für Tests ohne Netzwerk ersetzt SimulatedBrowser den ServiceBrowser:
+    svc = DiscoveryService(browser_factory=SimulatedBrowser)
+    svc.start()
+    svc.browser.add("shellyplus1-aabbcc", "192.168.2.47")
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+SERVICE_TYPE = "_http._tcp.local."
+DISCOVERY_TIME = 5.0      # max. Wartezeit für den ersten Durchlauf nach dem Start
+SETTLE_TIME = 0.5         # erster Durchlauf ist fertig, wenn so lange nichts Neues kam ...
+MIN_WAIT = 2.0            # ... frühestens aber nach der ersten Query-Wiederholung des Browsers (~1 s)
+
+ADD, UPDATE, REMOVE = "add", "update", "remove"
+
+
+class DiscoveryEvent:
+    __slots__ = ("kind", "host", "ip", "name", "info")
+
+    def __init__(self, kind, host, ip, name, info=None):
+        self.kind = kind
+        self.host = host
+        self.ip = ip
+        self.name = name
+        self.info = info
+
+    def __repr__(self):
+        return f"DiscoveryEvent({self.kind}, {self.host}, {self.ip})"
+
+# ---------------------------------------------------------------------------
+# mDNS Listener
+# ---------------------------------------------------------------------------
+
+class DiscoveryListener:
+    """ServiceListener für zeroconf; reicht alle drei Callbacks an den Dienst weiter."""
+
+    def __init__(self, service):
+        self._service = service
+
+    def _resolve(self, zeroconf, service_type, name, kind):
+        info = zeroconf.get_service_info(service_type, name)
+        if not info:
+            logger.debug("mDNS service without info: %s", name)
+            return
+        addresses = info.parsed_addresses()
+        if not addresses:
+            logger.debug("mDNS service without address: %s", name)
+            return
+        host = info.server.replace(".local.", "")
+        self._service._apply(DiscoveryEvent(kind, host, addresses[0], info.name, info))
+
+    def add_service(self, zeroconf, service_type, name):
+        self._resolve(zeroconf, service_type, name, ADD)
+
+    def update_service(self, zeroconf, service_type, name):
+        self._resolve(zeroconf, service_type, name, UPDATE)
+
+    def remove_service(self, zeroconf, service_type, name):
+        # nach dem Abmelden gibt es keine ServiceInfo mehr -> Host über den Namen finden
+        self._service._remove_by_name(name)
+
+# ---------------------------------------------------------------------------
+# Dienst
+# ---------------------------------------------------------------------------
+
+class DiscoveryService:
+    def __init__(self, service_type: str = SERVICE_TYPE, browser_factory=None):
+        self.service_type = service_type
+        self.browser_factory = browser_factory
+        self.devinfo = {}         # host -> (ip, service name)
+        self.service = {}         # host -> ServiceInfo
+        self._by_name = {}        # service name -> host
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._zeroconf = None
+        self.browser = None
+        self._started = None
+        self._last_event = None   # monotonic der letzten Meldung, None bis zur ersten
+
+    # -- Lebenszyklus -------------------------------------------------------
+
+    def start(self):
+        if self._started is not None:
+            return self
+        listener = DiscoveryListener(self)
+        if self.browser_factory is None:
+            from zeroconf import Zeroconf, ServiceBrowser
+            self._zeroconf = Zeroconf()
+            self.browser = ServiceBrowser(self._zeroconf, self.service_type, listener)
+        else:
+            self.browser = self.browser_factory(self.service_type, listener)
+        self._started = time.monotonic()
+        self._last_event = None
+        logger.debug("mDNS discovery service started for %s", self.service_type)
+        return self
+
+    def stop(self):
+        if self.browser is not None and hasattr(self.browser, "cancel"):
+            self.browser.cancel()
+        if self._zeroconf is not None:
+            self._zeroconf.close()
+            self._zeroconf = None
+        self._started = None
+
+    def wait_settled(self, timeout: float = DISCOVERY_TIME, quiet: float = SETTLE_TIME,
+                     minimum: float = MIN_WAIT) -> None:
+        """
+        Nur direkt nach dem Start sinnvoll: wartet, bis keine neuen Meldungen
+        mehr kommen. Die Ruhezeit zählt erst nach minimum Sekunden und erst,
+        wenn überhaupt eine Meldung kam; ohne Meldung bis timeout.
+        """
+        deadline = self._started + timeout
+        earliest = self._started + minimum
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            last = self._last_event
+            if now >= earliest and last is not None and now - last >= quiet:
+                return
+            time.sleep(min(quiet, deadline - now, 0.05))
+
+    # -- Ereignisse ---------------------------------------------------------
+
+    def subscribe(self, callback) -> None:
+        """callback(DiscoveryEvent) wird im zeroconf-Thread aufgerufen."""
+        self._subscribers.append(callback)
+
+    def subscribe_batched(self, handler, runtime=None):
+        """
+        handler([DiscoveryEvent, ...]) läuft gebündelt im Loop der Runtime
+        statt einzeln im zeroconf-Thread. Liefert den runtime.Channel.
+        """
+        if runtime is None:
+            from runtime import get_runtime
+            runtime = get_runtime()
+        channel = runtime.channel(handler, name=f"discovery:{getattr(handler, '__qualname__', handler)}")
+        self.subscribe(channel.put)
+        return channel
+
+    def _apply(self, event: DiscoveryEvent) -> None:
+        with self._lock:
+            old = self.devinfo.get(event.host)
+            if event.kind == ADD and old is not None:
+                event.kind = UPDATE
+            self.devinfo[event.host] = (event.ip, event.name)
+            self.service[event.host] = event.info
+            self._by_name[event.name] = event.host
+            self._last_event = time.monotonic()
+        if event.kind == UPDATE and old == (event.ip, event.name):
+            return
+        logger.info("mDNS %s device %s at %s", event.kind, event.host, event.ip)
+        self._publish(event)
+
+    def _remove_by_name(self, name: str) -> None:
+        with self._lock:
+            host = self._by_name.pop(name, None)
+            if host is None:
+                return
+            ip, _ = self.devinfo.pop(host, (None, None))
+            info = self.service.pop(host, None)
+            self._last_event = time.monotonic()
+        logger.info("mDNS remove device %s (%s)", host, name)
+        self._publish(DiscoveryEvent(REMOVE, host, ip, name, info))
+
+    def _publish(self, event: DiscoveryEvent) -> None:
+        for callback in self._subscribers:
+            try:
+                callback(event)
+            except Exception as exc:
+                logger.error("Discovery subscriber failed on %s: %s", event, exc)
+
+    # -- Abfragen -----------------------------------------------------------
+
+    def lookup(self, host: str):
+        """(ip, service name) oder None."""
+        return self.devinfo.get(host)
+
+    def ips(self) -> set:
+        with self._lock:
+            return {ip for ip, _ in self.devinfo.values()}
+
+    def names_by_ip(self) -> dict:
+        with self._lock:
+            return {ip: host for host, (ip, _) in self.devinfo.items()}
+
+    def snapshot(self):
+        """Kopie im Format der alten discover_devices(): (devinfo, service)."""
+        with self._lock:
+            return dict(self.devinfo), dict(self.service)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_discovery_service() -> DiscoveryService:
+    """Gemeinsamer, laufender Dienst; der erste Aufruf wartet den ersten Durchlauf ab."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = DiscoveryService().start()
+            _service.wait_settled()
+    return _service
+
+
+def running_discovery_service() -> DiscoveryService | None:
+    """Der gemeinsame Dienst, falls er schon läuft; startet ihn nicht."""
+    return _service
+
+# ---------------------------------------------------------------------------
+# Simulation für Tests
+# ---------------------------------------------------------------------------
+
+class _FakeInfo:
+    def __init__(self, host, ip, name):
+        self.server = f"{host}.local."
+        self.name = name
+        self._ip = ip
+
+    def parsed_addresses(self):
+        return [self._ip]
+
+
+class SimulatedBrowser:
+    """
+    Ersetzt ServiceBrowser + Zeroconf. add/update/remove rufen den Listener
+    synchron auf, so wie es der zeroconf-Thread tun würde.
+    """
+
+    def __init__(self, service_type, listener):
+        self.service_type = service_type
+        self.listener = listener
+        self._infos = {}
+
+    def get_service_info(self, service_type, name):
+        return self._infos.get(name)
+
+    def _name(self, host):
+        return f"{host}.{self.service_type}"
+
+    def add(self, host: str, ip: str):
+        name = self._name(host)
+        self._infos[name] = _FakeInfo(host, ip, name)
+        self.listener.add_service(self, self.service_type, name)
+
+    def update(self, host: str, ip: str):
+        name = self._name(host)
+        self._infos[name] = _FakeInfo(host, ip, name)
+        self.listener.update_service(self, self.service_type, name)
+
+    def remove(self, host: str):
+        name = self._name(host)
+        self._infos.pop(name, None)
+        self.listener.remove_service(self, self.service_type, name)
+
+    def cancel(self):
+        pass
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Treiber-Registry für Gen2-Shellys (RPC API).
+
+Statt einer Klasse pro Modell beschreibt ein ModelSpec, welche Komponenten
+(switch:N, pm1:N, ...) und Felder ein Modell liefert und wie der Datensatz
+aussieht. Die Zuordnung Modell -> Spec ist ein Dict-Zugriff über "model"
+aus GetDeviceInfo bzw. /shelly; unbekannte Modelle bekommen GENERIC.
+
+Pro Gerät gibt es nur einen DeviceState (IP, Cache, Zähler); das Modell
+wird beim ersten Poll aus GetDeviceInfo gelernt. Alle Geräte teilen sich
+den Transport aus transport.py:
+
+    states = [DeviceState(ip) for ip in ips]
+    records = await poll_all(states)
+
+Neues Modell: register_model(ModelSpec("SNSW-102P16EU", "Shelly Plus 2PM", ...)).
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+
+from threadtools import Counters
+from transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Modellbeschreibung
+# ---------------------------------------------------------------------------
+
+SWITCH_FIELDS = ("output", "apower", "voltage", "current", "temperature")
+METER_FIELDS = SWITCH_FIELDS[:4] + ("aenergy",) + SWITCH_FIELDS[4:]
+
+
+@dataclass(frozen=True, slots=True)
+class ModelSpec:
+    model: str
+    name: str
+    components: tuple             # ((Komponente, Schlüssel im Datensatz), ...)
+    fields: tuple                 # Felder, die pro Komponente übernommen werden
+    single: bool = False          # nur Kanal 0, als Dict statt {idx: {...}}
+    extras: tuple = ()            # ((Schlüssel im Datensatz, Schlüssel im Status), ...)
+    raw_key: str | None = "status"   # vollständiger Status im Datensatz, None = weglassen
+    plug: bool = False            # Zwischenstecker (Kategorie "Plug" statt "PowerSwitch")
+
+
+MODELS = {}
+
+
+def register_model(spec: ModelSpec) -> ModelSpec:
+    MODELS[spec.model] = spec
+    return spec
+
+
+PLUS_1 = register_model(ModelSpec(
+    "SNSW-001X16EU", "Shelly Plus 1",
+    components=(("switch", "switch"),), fields=SWITCH_FIELDS,
+    single=True, raw_key="status_raw"))
+
+PLUS_PLUG = register_model(ModelSpec(
+    "SNPL-00112EU", "Shelly Plus Plug",
+    components=(("switch", "switch"),), fields=METER_FIELDS,
+    single=True, extras=(("wifi", "wifi"), ("cloud", "cloud"), ("system", "sys")),
+    raw_key=None, plug=True))
+
+PLUS_4PM = register_model(ModelSpec(
+    "S4PL-00416EU", "Shelly Plus 4PM",
+    components=(("switch", "switches"), ("pm1", "meters")), fields=METER_FIELDS))
+
+# unbekannte Gen2-Modelle: alle üblichen Komponenten, mehrkanalig
+GENERIC = ModelSpec(
+    "generic", "Shelly (Gen2)",
+    components=(("switch", "switches"), ("cover", "covers"), ("light", "lights"),
+                ("pm1", "meters"), ("em", "meters")),
+    fields=METER_FIELDS + ("state", "current_pos", "brightness"))
+
+
+def spec_for(model: str | None) -> ModelSpec:
+    return MODELS.get(model, GENERIC)
+
+
+def build_record(spec: ModelSpec, status: dict, device_info: dict, config: dict) -> dict:
+    """Datensatz im Format der früheren read_all()-Methoden."""
+    data = {"device_info": device_info}
+    for component, key in spec.components:
+        if spec.single:
+            values = status.get(f"{component}:0", {})
+            data[key] = {f: values.get(f) for f in spec.fields}
+            continue
+        channels = data.setdefault(key, {})
+        prefix = component + ":"
+        for name, values in status.items():
+            if name.startswith(prefix):
+                channels[name[len(prefix):]] = {f: values.get(f) for f in spec.fields}
+    for key, source in spec.extras:
+        data[key] = status.get(source)
+    if spec.raw_key:
+        data[spec.raw_key] = status
+    data["config"] = config
+    return data
+
+# ---------------------------------------------------------------------------
+# Zustand pro Gerät
+# ---------------------------------------------------------------------------
+
+class PollStats(Counters):
+    """Zähler pro Gerät: was der Status-Pfad gegenüber dem Voll-Abruf einspart."""
+    __slots__ = ("polls", "requests", "bytes", "saved_requests", "saved_bytes", "refreshes")
+
+
+class DeviceState:
+    """
+    Alles, was pro Gerät gehalten wird. Device-Info und Config sind gecacht
+    und werden nur neu gelesen, wenn sich sys.cfg_rev ändert (fast=True).
+    """
+    __slots__ = ("ip", "spec", "fast", "stats", "cfg_rev", "device_info", "config", "cached_bytes")
+
+    def __init__(self, ip: str, model: str | None = None, fast: bool = True):
+        self.ip = ip
+        self.spec = spec_for(model) if model else None
+        self.fast = fast
+        self.stats = PollStats()
+        self.cfg_rev = None
+        self.device_info = None
+        self.config = None
+        self.cached_bytes = 0     # Größe der gecachten Antworten (Info + Config)
+
+    def url(self, method: str) -> str:
+        return f"http://{self.ip}/rpc/{method}"
+
+    def count(self, resp) -> None:
+        self.stats.requests += 1
+        self.stats.bytes += len(resp.content)
+
+    def cached(self, status: dict) -> bool:
+        """True, wenn Info und Config aus dem Cache genommen werden können."""
+        self.stats.polls += 1
+        cfg_rev = (status.get("sys") or {}).get("cfg_rev")
+        if self.fast and self.device_info is not None and cfg_rev is not None and cfg_rev == self.cfg_rev:
+            self.stats.saved_requests += 2
+            self.stats.saved_bytes += self.cached_bytes
+            return True
+        if self.cfg_rev is not None and cfg_rev != self.cfg_rev:
+            self.stats.refreshes += 1
+        self.cfg_rev = cfg_rev
+        return False
+
+    def refreshed(self, info_resp, config_resp) -> None:
+        self.device_info = info_resp.json()
+        self.config = config_resp.json()
+        self.cached_bytes = len(info_resp.content) + len(config_resp.content)
+        if self.spec is None or self.spec is GENERIC:
+            self.spec = spec_for(self.device_info.get("model"))
+
+    def record(self, status: dict) -> dict:
+        return build_record(self.spec or GENERIC, status, self.device_info, self.config)
+
+# ---------------------------------------------------------------------------
+# Abfrage
+# ---------------------------------------------------------------------------
+
+def _checked(state: DeviceState, resp):
+    resp.raise_for_status()
+    state.count(resp)
+    return resp
+
+
+def read(state: DeviceState, timeout: float = None) -> dict:
+    """Ein Poll, blockierend."""
+    transport = get_transport()
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    status = _checked(state, transport.get(state.url("Shelly.GetStatus"), **kwargs)).json()
+    if not state.cached(status):
+        state.refreshed(_checked(state, transport.get(state.url("Shelly.GetDeviceInfo"), **kwargs)),
+                        _checked(state, transport.get(state.url("Shelly.GetConfig"), **kwargs)))
+    return state.record(status)
+
+
+async def aread(state: DeviceState, timeout: float = None) -> dict:
+    """Ein Poll über den gemeinsamen AsyncClient."""
+    transport = get_transport()
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    status = _checked(state, await transport.aget(state.url("Shelly.GetStatus"), **kwargs)).json()
+    if not state.cached(status):
+        info, config = await asyncio.gather(
+            transport.aget(state.url("Shelly.GetDeviceInfo"), **kwargs),
+            transport.aget(state.url("Shelly.GetConfig"), **kwargs))
+        state.refreshed(_checked(state, info), _checked(state, config))
+    return state.record(status)
+
+
+async def poll_all(states, timeout: float = None) -> dict:
+    """{ip: Datensatz} für alle Geräte; fehlgeschlagene fehlen im Ergebnis."""
+    states = list(states)
+    results = await asyncio.gather(*(aread(s, timeout) for s in states), return_exceptions=True)
+    records = {}
+    for state, result in zip(states, results):
+        if isinstance(result, Exception):
+            logger.warning("Poll of %s failed: %s", state.ip, result)
+        else:
+            records[state.ip] = result
+    return records
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Negativ-Cache und Circuit Breaker für Hosts, die nichts Brauchbares liefern.
+
+Zwei Fälle:
+
+- UNKNOWN: der Host antwortet, ist aber kein bekanntes Gerät (Handy,
+  Router, Drucker). identify_device hat kein Profil gefunden.
+- DEAD: der Host antwortet nicht (Timeouts, Verbindungsfehler), z.B. ein
+  Shelly ohne Strom bei ShellyHandler._has_rpc.
+
+Pro Host (Schlüssel MAC, sonst IP, damit ein neuer DHCP-Lease den Eintrag
+nicht entwertet) ein Breaker. MACs werden normalisiert, "C8:F0:9E:8A:1B:2C"
+vom ARP-Scan und "C8F09E8A1B2C" aus /shelly treffen denselben Eintrag:
+
+    closed     normal, Fehler werden gezählt
+    open       nach THRESHOLD[grund] Fehlern in Folge; der Host wird bis
+               retry_at übersprungen
+    half_open  nach Ablauf ein einzelner Versuch: Erfolg schließt den
+               Breaker, ein Fehler öffnet ihn mit doppelter Wartezeit
+               (OPEN_MIN[grund] ... OPEN_MAX)
+
+Gespeichert wird als JSON unter REGPath, der Zustand überlebt also den
+Neustart.
+
+    guard = get_host_guard(cfg)
+    if guard.allow(mac or ip):
+        ...
+        guard.success(key)   bzw.   guard.failure(key, UNKNOWN, ip=ip)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from metrics import HOSTS_SKIPPED
+from threadtools import Counters
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+GUARD_FILE = "host_guard.json"
+UNKNOWN, DEAD = "unknown", "dead"
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+THRESHOLD = {UNKNOWN: 1, DEAD: 3}        # Fehler in Folge bis zum Öffnen
+OPEN_MIN = {UNKNOWN: 3600.0, DEAD: 60.0}  # erste Wartezeit in Sekunden (cfg GuardUnknownMin/GuardDeadMin)
+OPEN_MAX = 86400.0        # Obergrenze der Wartezeit (cfg GuardMax)
+TRIAL_TIMEOUT = 60.0      # ein half_open-Versuch ohne Ergebnis gilt danach als verloren
+TTL = 7 * 86400           # Einträge ohne Änderung so lange behalten
+
+
+def host_key(key: str) -> str:
+    """MAC in beliebiger Schreibweise -> "c8f09e8a1b2c"; IPs bleiben unverändert."""
+    if not key:
+        return key
+    mac = str(key).replace(":", "").replace("-", "").lower()
+    return mac if len(mac) == 12 and all(c in "0123456789abcdef" for c in mac) else key
+
+
+class GuardStats(Counters):
+    __slots__ = ("allowed", "skipped", "trials", "opened", "closed")
+
+# ---------------------------------------------------------------------------
+# Breaker pro Host
+# ---------------------------------------------------------------------------
+
+class HostGuard:
+    def __init__(self, path=None, open_min: dict = None, open_max: float = OPEN_MAX,
+                 threshold: dict = None, ttl: float = TTL, clock=time.time):
+        self.path = path
+        self.open_min = dict(OPEN_MIN, **(open_min or {}))
+        self.open_max = open_max
+        self.threshold = dict(THRESHOLD, **(threshold or {}))
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}         # key -> {"state", "reason", "failures", "backoff", "retry_at", "ip", "updated"}
+        self.stats = GuardStats()
+        self._lock = threading.Lock()
+        self._dirty = False
+        if path:
+            self.load()
+
+    @classmethod
+    def from_cfg(cls, cfg, **kwargs) -> "HostGuard":
+        path = os.path.join(cfg['REGPath'], GUARD_FILE) if cfg.get('REGPath') else None
+        open_min = {UNKNOWN: cfg.get('GuardUnknownMin', OPEN_MIN[UNKNOWN]),
+                    DEAD: cfg.get('GuardDeadMin', OPEN_MIN[DEAD])}
+        kwargs.setdefault("open_min", open_min)
+        kwargs.setdefault("open_max", cfg.get('GuardMax', OPEN_MAX))
+        return cls(path, **kwargs)
+
+    # -- Persistenz ---------------------------------------------------------
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            logger.warning("Ignoring host guard %s: %s", self.path, exc)
+            return
+        self.entries = {host_key(k): v for k, v in data.items()} if isinstance(data, dict) else {}
+        self.expire()
+
+    def save(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            text = json.dumps(self.entries, indent=1, sort_keys=True)
+            self._dirty = False
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, self.path)
+        except OSError as exc:
+            self._dirty = True
+            logger.error("Could not write host guard %s: %s", self.path, exc)
+
+    # -- Abfrage ------------------------------------------------------------
+
+    def allow(self, key: str, now: float = None) -> bool:
+        """True, wenn der Host abgefragt werden darf; nach Ablauf der Wartezeit genau ein Versuch."""
+        key = host_key(key)
+        entry = self.entries.get(key)
+        if entry is None or entry["state"] == CLOSED:
+            self.stats.allowed += 1
+            return True
+        now = self.clock() if now is None else now
+        with self._lock:
+            if now < entry["retry_at"]:
+                self.stats.skipped += 1
+                HOSTS_SKIPPED.labels(entry["reason"]).inc()
+                return False
+            # Wartezeit um (oder half_open-Versuch verloren): ein neuer Versuch
+            entry["state"] = HALF_OPEN
+            entry["retry_at"] = now + TRIAL_TIMEOUT
+            self._dirty = True
+            self.stats.trials += 1
+        logger.debug("Host %s half-open, trying again", key)
+        return True
+
+    def state(self, key: str) -> str:
+        entry = self.entries.get(host_key(key))
+        return entry["state"] if entry is not None else CLOSED
+
+    # -- Ergebnisse ---------------------------------------------------------
+
+    def success(self, key: str) -> None:
+        key = host_key(key)
+        if key not in self.entries:
+            return
+        with self._lock:
+            entry = self.entries.pop(key, None)
+            self._dirty = True
+        if entry is not None and entry["state"] != CLOSED:
+            self.stats.closed += 1
+            logger.info("Host %s responds again, circuit closed", key)
+
+    def failure(self, key: str, reason: str = DEAD, ip: str = None, now: float = None) -> bool:
+        """Fehler verbuchen; True, wenn der Breaker dadurch (wieder) geöffnet wurde."""
+        key = host_key(key)
+        now = self.clock() if now is None else now
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = {"state": CLOSED, "reason": reason, "failures": 0,
+                                             "backoff": 0.0, "retry_at": 0.0, "ip": ip}
+            entry["failures"] += 1
+            entry["reason"] = reason
+            entry["updated"] = now
+            if ip is not None:
+                entry["ip"] = ip
+            self._dirty = True
+            if entry["state"] == HALF_OPEN:
+                backoff = min(max(entry["backoff"], self.open_min[reason]) * 2, self.open_max)
+            elif entry["state"] == CLOSED and entry["failures"] >= self.threshold[reason]:
+                backoff = self.open_min[reason]
+            else:
+                return False
+            entry["state"] = OPEN
+            entry["backoff"] = backoff
+            entry["retry_at"] = now + backoff
+            self.stats.opened += 1
+        logger.debug("Host %s (%s) %s, skipped for %.0f s", key, ip, reason, backoff)
+        return True
+
+    # -- Verwaltung ---------------------------------------------------------
+
+    def expire(self, now: float = None) -> int:
+        """Einträge ohne Änderung seit TTL vergessen."""
+        now = self.clock() if now is None else now
+        with self._lock:
+            stale = [k for k, e in self.entries.items() if now - e.get("updated", 0) > self.ttl]
+            for key in stale:
+                del self.entries[key]
+            if stale:
+                self._dirty = True
+        return len(stale)
+
+    def blocked(self, now: float = None) -> dict:
+        """{key: Eintrag} aller Hosts, die gerade übersprungen werden."""
+        now = self.clock() if now is None else now
+        return {k: dict(e) for k, e in list(self.entries.items())
+                if e["state"] != CLOSED and now < e["retry_at"]}
+
+
+_guards = {}              # Dateipfad -> HostGuard, damit Scanner und Handler denselben Stand teilen
+_guards_lock = threading.Lock()
+
+
+def get_host_guard(cfg) -> HostGuard:
+    """Gemeinsamer HostGuard für den REGPath aus cfg."""
+    key = cfg.get('REGPath')
+    guard = _guards.get(key)
+    if guard is None:
+        with _guards_lock:
+            guard = _guards.get(key)
+            if guard is None:
+                guard = _guards[key] = HostGuard.from_cfg(cfg)
+    return guard
@@ -1,43 +1,130 @@
-import requests
-import re
 import logging
-from pathlib import Path
 import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from tracing import span
+from transport import get_transport
 
 logger = logging.getLogger(__name__)
 
-def parse_ESP(ip):    
+# ---------------------------------------------------------------------------
+# Statusseite der ESPs
+#
+#   <div1><h3>Name</h3>\r\n-----> ESPDevice V3.14 (build ...): ...<br>
+#   Hostname: esp-keller<br>Type: Temperature<br>Hardw: ESP8266<br>...</div1>
+# ---------------------------------------------------------------------------
+
+NO_HOSTNAME = "ESP_Device ohne Hostname"
+
+
+@dataclass(slots=True)
+class ESPStatus:
+    hostname: str
+    version: str | None = None
+    type: str | None = None
+    hardw: str | None = None
+    uptime: str | None = None
+    good: str | None = None
+    bad: str | None = None
+    fields: dict = field(default_factory=dict)
+
+    def get(self, key, default=None):
+        """Zugriff mit den Schlüsseln der Seite, wie beim früheren Dict."""
+        return self.fields.get(key, default)
+
+    def as_dict(self) -> dict:
+        return dict(self.fields)
+
+
+def parse_ESP_page(page: bytes | str) -> ESPStatus | None:
+    """
+    Zerlegt die Statusseite eines ESP (rohe Bytes oder Text) in einem Durchlauf.
+    Kein Netzwerk- und kein Dateizugriff; None, wenn kein <div1>-Block da ist.
+    """
+    if isinstance(page, str):
+        page = page.encode("utf-8", "replace")
+    start = page.find(b"<div1>")
+    end = page.find(b"</div1>", start)
+    if start < 0 or end < 0:
+        return None
+
+    # ein Durchlauf über die Textstücke zwischen den Tags ("br>Hostname: esp-keller")
+    fields = {}
+    for chunk in page[start + 6:end].decode("utf-8", "replace").split("<"):
+        key, sep, value = chunk.partition(":")
+        if not sep:
+            continue
+        if "----->" in key:
+            version = key.split("V", 1)[-1].split(" ", 1)[0]
+            fields["Version"] = f"V{version}"
+        else:
+            fields[key.rpartition(">")[2].strip()] = value.strip()
+
+    hostname = fields.setdefault("Hostname", NO_HOSTNAME)
+    return ESPStatus(
+        hostname=hostname,
+        version=fields.get("Version"),
+        type=fields.get("Type"),
+        hardw=fields.get("Hardw"),
+        uptime=fields.get("uptime"),
+        good=fields.get("good Transmissions"),
+        bad=fields.get("bad Transmissions"),
+        fields=fields,
+    )
+
+
+async def fetch_ESP(ip) -> ESPStatus | None:
+    resp = await get_transport().aget(f"http://{ip}")
+    resp.raise_for_status()
+    with span("esp.parse"):
+        return parse_ESP_page(resp.content)
+
+
+def parse_ESP(ip):
     try:
-        html = requests.get(f"http://{ip}").text
+        with span("esp.fetch", ip=ip):
+            page = get_transport().get(f"http://{ip}").content
     except Exception as exc:
         logger.error("Fehler beim Abrufen der HTML-Seite von %s: %s", ip, exc)
         return {}
 
-    # Extrahiere nur den Inhalt zwischen <div1> und </div1>
-    div1_content = re.search(r'<div1>(.*?)</div1>', html, re.DOTALL).group(1)
+    with span("esp.parse"):
+        status = parse_ESP_page(page)
+    if status is None:
+        logger.warning("Keine <div1>-Daten von %s erhalten", ip)
+        return {}
+    return status.as_dict()
 
-    # Extrahiere alle Schlüssel-Wert-Paare, ignoriere leere Zeilen und <br>-Tags
-    matches2 = re.findall(r'([^:<]+):\s*([^<]+)', div1_content)
-    data = {key: value for key, value in matches2}
+# ---------------------------------------------------------------------------
+# Optionale Ablage pro Host (REGPath/<Hostname>.yml)
+# ---------------------------------------------------------------------------
 
-    data_dict = {}
-    for key, value in data.items():
-        if key.startswith("/h3>\r\n-----> "):
-            cleaned_key = key.split("V", 1)[-1]
-            version = cleaned_key.split(" ", 1)[0]
-            data_dict["Version"] = f"V{version}"
-        else:
-            data_dict[key.split(">")[-1]] = value.strip()
+class HostFileWriter:
+    """
+    Sammelt Statusdaten und schreibt sie gebündelt mit flush(); pro Host
+    zählt nur der letzte Stand. Blockierend, aus async-Code per
+    asyncio.to_thread(writer.flush) aufrufen.
+    """
 
-    try:
-        data_dict["Hostname"]
-    except KeyError:
-        data_dict["Hostname"] = "ESP_Device ohne Hostname"
+    def __init__(self, path):
+        self.path = Path(path)
+        self._pending = {}
 
-    hostfile = Path(os.path.join("/Users/ralphfollrichs/Projects/DeCo/progs/../reg/", f"{data_dict['Hostname']}.yml"))
-    with open(hostfile, 'w') as f:
-        for key, value in data_dict.items():
-            f.write(f"{key}: {value}\n")
+    def add(self, status: ESPStatus) -> None:
+        self._pending[status.hostname] = status
 
-    logger.debug(f"Daten wurden in {hostfile} geschrieben.")
-    return data_dict
+    def flush(self) -> int:
+        pending, self._pending = self._pending, {}
+        for hostname, status in pending.items():
+            hostfile = self.path / f"{hostname}.yml"
+            tmp = hostfile.with_name(hostfile.name + ".tmp")
+            try:
+                with open(tmp, "w") as f:
+                    f.write("".join(f"{key}: {value}\n" for key, value in status.fields.items()))
+                os.replace(tmp, hostfile)
+            except OSError as exc:
+                logger.error("Could not write %s: %s", hostfile, exc)
+        if pending:
+            logger.debug(f"Daten von {len(pending)} ESPs nach {self.path} geschrieben.")
+        return len(pending)
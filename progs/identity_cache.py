@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Identitäts-Cache für den Netzwerk-Scan, Schlüssel ist die MAC-Adresse.
+
+Pro MAC: IP, mDNS-Name, Profil (Device), Modell, Firmware-Hash und das
+letzte Identifizierungsergebnis. Ein erneuter Scan fragt per HTTP nur
+Hosts ab, die
+
+- neu sind (MAC unbekannt),
+- umgezogen sind (andere IP oder anderer mDNS-Name),
+- länger als TTL nicht mehr gesehen wurden (Eintrag verfällt),
+- oder seit REFRESH nicht mehr identifiziert wurden (erzwungene Auffrischung).
+
+Alle anderen Ergebnisse kommen aus dem Cache; der Scan kostet dann nur
+noch den ARP-Sweep. Gespeichert wird als JSON unter REGPath. Hosts ohne
+erkanntes Profil landen nicht hier, sondern im host_guard.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+CACHE_FILE = "identity_cache.json"
+TTL = 7 * 86400           # Sekunden ohne Sichtung, bis ein Eintrag verfällt
+REFRESH = 86400           # Sekunden, nach denen ein Host trotzdem neu identifiziert wird
+
+
+def firmware_hash(result: dict) -> str:
+    """Kurzer Hash über Modell und Firmware eines Identifizierungsergebnisses."""
+    key = "|".join(str(result.get(k)) for k in ("Device", "model", "Type", "fw"))
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+class IdentityCache:
+    def __init__(self, path=None, ttl: float = TTL, refresh: float = REFRESH):
+        self.path = path
+        self.ttl = ttl
+        self.refresh = refresh
+        self.entries = {}         # mac -> dict
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        if path:
+            self.load()
+
+    @classmethod
+    def from_cfg(cls, cfg):
+        path = os.path.join(cfg['REGPath'], CACHE_FILE) if cfg.get('REGPath') else None
+        return cls(path,
+                   ttl=cfg.get('IdentityTTL', TTL),
+                   refresh=cfg.get('IdentityRefresh', REFRESH))
+
+    # -- Persistenz ---------------------------------------------------------
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            logger.warning("Ignoring identity cache %s: %s", self.path, exc)
+            return
+        self.entries = data if isinstance(data, dict) else {}
+
+    def save(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+            self._dirty = False
+        except OSError as exc:
+            logger.error("Could not write identity cache %s: %s", self.path, exc)
+
+    # -- Abgleich -----------------------------------------------------------
+
+    def lookup(self, mac: str, ip: str, name: str = None, now: float = None):
+        """Gecachtes Ergebnis, wenn sich der Host nicht verändert hat, sonst None."""
+        now = time.time() if now is None else now
+        entry = self.entries.get(mac)
+        if (entry is None
+                or entry["ip"] != ip
+                or (name is not None and entry.get("name") != name)
+                or now - entry["seen"] > self.ttl
+                or now - entry["checked"] > self.refresh):
+            self.misses += 1
+            return None
+        entry["seen"] = now
+        self._dirty = True
+        self.hits += 1
+        return dict(entry["result"], ip=ip)
+
+    def store(self, mac: str, ip: str, result: dict, name: str = None, now: float = None) -> None:
+        if result.get("Device") == "unknown":
+            # kein Profil erkannt (evtl. nur gerade nicht erreichbar): nicht
+            # cachen, sonst gilt ein echtes Gerät bis REFRESH als unbekannt
+            if self.entries.pop(mac, None) is not None:
+                self._dirty = True
+            return
+        now = time.time() if now is None else now
+        old = self.entries.get(mac)
+        fw = firmware_hash(result)
+        if old is not None and old["fw_hash"] != fw:
+            logger.info("Host %s (%s) changed: %s -> %s", mac, ip, old.get("model"), result.get("model"))
+        self.entries[mac] = {
+            "ip": ip,
+            "name": name,
+            "profile": result.get("Device"),
+            "model": result.get("model"),
+            "fw_hash": fw,
+            "seen": now,
+            "checked": now,
+            "result": result,
+        }
+        self._dirty = True
+
+    def partition(self, ips, macs: dict, names: dict = None, now: float = None):
+        """
+        Teilt ips in (zu identifizierende IPs, {ip: gecachtes Ergebnis}).
+        Hosts ohne bekannte MAC werden immer identifiziert.
+        """
+        names = names or {}
+        probe, cached = [], {}
+        for ip in ips:
+            mac = macs.get(ip)
+            result = self.lookup(mac, ip, names.get(ip), now) if mac else None
+            if result is None:
+                probe.append(ip)
+            else:
+                cached[ip] = result
+        return probe, cached
+
+    def expire(self, now: float = None) -> int:
+        now = time.time() if now is None else now
+        stale = [mac for mac, e in self.entries.items() if now - e["seen"] > self.ttl]
+        for mac in stale:
+            del self.entries[mac]
+        if stale:
+            self._dirty = True
+        return len(stale)
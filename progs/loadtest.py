@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lasttest Ende zu Ende gegen eine simulierte Flotte (simulator.make_fleet).
+
+Ablauf, alles im gemeinsamen Loop (runtime.get_runtime()):
+    scan      NetworkScanner.run_full_scan (Methode STATIC auf die Flotte, force)
+    registry  registry.update_registry mit den erkannten Geräten (2 Durchläufe)
+    poll      --polls Runden über alle erkannten Geräte:
+              Gen2 drivers.aread, Gen1 /status, WLED /json/state, ESP fetch_ESP
+
+Ausgabe pro Phase: Operationen, Fehler, Durchsatz, p50/p99 Latenz; am Ende
+die maximale RSS des Prozesses (Flotte und Client im selben Prozess).
+Hosts mit dem Profil "none" sind absichtlich unbekannt: im Scan zählen sie
+als "unknown", nicht als Fehler.
+Mit --trace PREFIX zusätzlich PREFIX.json (Chrome-Trace) und PREFIX.folded.
+
+    python loadtest.py [--devices 1000] [--latency 0.005] [--failure-rate 0.01]
+                       [--slow-rate 0.01] [--slow-latency 2.0] [--polls 3] [--json]
+                       [--trace PREFIX]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import sys
+import tempfile
+import time
+
+import drivers
+import tracing
+from html_parser import fetch_ESP
+from network_scanner import NetworkScanner
+from registry import registry
+from runtime import get_runtime
+from simulator import make_fleet
+from transport import get_transport
+
+POLL_TIMEOUT = 5.0
+NOFILE_MAX = 65536        # höchstens so viele Datei-Deskriptoren anfordern
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Phase:
+    __slots__ = ("name", "latencies", "errors", "elapsed")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def as_dict(self) -> dict:
+        ops = len(self.latencies) + self.errors
+        return {"ops": ops, "errors": self.errors, "seconds": round(self.elapsed, 3),
+                "ops_per_s": round(ops / self.elapsed, 1) if self.elapsed else 0.0,
+                "p50_ms": round(1000 * percentile(self.latencies, 0.50), 2),
+                "p99_ms": round(1000 * percentile(self.latencies, 0.99), 2)}
+
+
+async def _timed(phase: Phase, coro):
+    start = time.perf_counter()
+    try:
+        result = await coro
+    except Exception:
+        phase.errors += 1
+        return None
+    phase.latencies.append(time.perf_counter() - start)
+    return result
+
+# ---------------------------------------------------------------------------
+# Phasen
+# ---------------------------------------------------------------------------
+
+def run_scan(cfg, hosts, unknown_hosts=()) -> tuple:
+    """
+    (Phase, erkannte Geräte, Anzahl unknown). Ein "unknown" für einen Host
+    aus unknown_hosts ist richtig erkannt, für alle anderen ein Fehler.
+    """
+    phase = Phase("scan")
+    scanner = NetworkScanner(cfg, method="STATIC", hosts=hosts)
+    identify = scanner.identify_device
+    unknown_hosts = set(unknown_hosts)
+    unknown = 0
+
+    async def timed_identify(ip, client):
+        nonlocal unknown
+        start = time.perf_counter()
+        result = await identify(ip, client)
+        if result.get("Device") != "unknown":
+            phase.latencies.append(time.perf_counter() - start)
+        elif ip in unknown_hosts:
+            unknown += 1
+            phase.latencies.append(time.perf_counter() - start)
+        else:
+            phase.errors += 1
+        return result
+
+    # nur für die Messung: identify_all ruft self.identify_device
+    scanner.identify_device = timed_identify
+    start = time.perf_counter()
+    devices = get_runtime().run(scanner.run_full_scan(force=True))
+    phase.elapsed = time.perf_counter() - start
+    return phase, [d for d in devices if d.get("Device") != "unknown"], unknown
+
+
+def run_registry(cfg, devices) -> Phase:
+    phase = Phase("registry")
+    devs = {f"{d['Device'].lower()}-{d['ip']}": (d["ip"], d.get("model")) for d in devices}
+    reg = registry(cfg)
+    start = time.perf_counter()
+    for _ in range(2):                # neu, dann unverändert
+        t0 = time.perf_counter()
+        reg.update_registry(devs, None)
+        phase.latencies.append(time.perf_counter() - t0)
+    phase.elapsed = time.perf_counter() - start
+    reg.close()
+    return phase
+
+
+async def _poll_round(phase: Phase, devices, states: dict) -> None:
+    transport = get_transport()
+    tasks = []
+    for d in devices:
+        ip = d["ip"]
+        if d["Device"] == "Shelly" and ip in states:
+            coro = drivers.aread(states[ip], timeout=POLL_TIMEOUT)
+        elif d["Device"] == "Shelly":
+            coro = transport.aget_json(f"http://{ip}/status", timeout=POLL_TIMEOUT)
+        elif d["Device"] == "WLED":
+            coro = transport.aget_json(f"http://{ip}/json/state", timeout=POLL_TIMEOUT)
+        else:
+            coro = fetch_ESP(ip)
+        tasks.append(_timed(phase, coro))
+    await asyncio.gather(*tasks)
+
+
+def run_poll(devices, rounds: int) -> Phase:
+    phase = Phase("poll")
+    # Gen2 (über die Modellnummer aus GetDeviceInfo) -> Treiber mit cfg_rev-Cache
+    states = {d["ip"]: drivers.DeviceState(d["ip"], d.get("model"))
+              for d in devices if d["Device"] == "Shelly" and d.get("model") in drivers.MODELS}
+    start = time.perf_counter()
+    for _ in range(rounds):
+        get_runtime().run(_poll_round(phase, devices, states))
+    phase.elapsed = time.perf_counter() - start
+    return phase
+
+# ---------------------------------------------------------------------------
+# Ablauf
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--failure-rate", type=float, default=0.01)
+    parser.add_argument("--slow-rate", type=float, default=0.01)
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    parser.add_argument("--polls", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON")
+    parser.add_argument("--trace", metavar="PREFIX", help="Spans als PREFIX.json und PREFIX.folded")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if args.trace:
+        tracing.enable()
+
+    # jedes Gerät braucht einen Listen-Socket plus Verbindungen
+    # (macOS meldet hard = RLIM_INFINITY, lehnt so hohe Werte aber ab)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = NOFILE_MAX if hard == resource.RLIM_INFINITY else min(hard, NOFILE_MAX)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+        except (ValueError, OSError) as exc:
+            logging.warning("Could not raise RLIMIT_NOFILE to %d: %s", wanted, exc)
+
+    fleet = make_fleet(args.devices, args.latency, args.failure_rate,
+                       args.slow_rate, args.slow_latency).start()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg = {"TargetNet": "127.0.0.1/32", "REGPath": tmp}
+            unknown_hosts = [d.ip for d in fleet.devices if d.profile == "none"]
+            scan, devices, unknown = run_scan(cfg, fleet.hosts, unknown_hosts)
+            results["scan"] = scan.as_dict()
+            results["scan"]["identified"] = len(devices)
+            results["scan"]["unknown"] = unknown
+            results["registry"] = run_registry(cfg, devices).as_dict()
+            results["poll"] = run_poll(devices, args.polls).as_dict()
+    finally:
+        fleet.stop()
+        get_runtime().stop()
+    if args.trace:
+        tracing.export_chrome(f"{args.trace}.json")
+        tracing.export_folded(f"{args.trace}.folded")
+
+    results["fleet"] = {"devices": args.devices,
+                        "requests": sum(d.requests for d in fleet.devices),
+                        "injected_failures": sum(d.failures for d in fleet.devices),
+                        "slow_responses": sum(d.slow for d in fleet.devices)}
+    # ru_maxrss: Kilobyte unter Linux, Byte unter macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results["peak_rss_mb"] = round(rss / (2**20 if sys.platform == "darwin" else 1024), 1)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    f = results["fleet"]
+    print(f"{args.devices} devices, latency {1000 * args.latency:.0f} ms, "
+          f"failures {args.failure_rate:.1%}, slow {args.slow_rate:.1%} ({args.slow_latency:.1f} s)")
+    print(f"{'phase':10} {'ops':>7} {'errors':>7} {'seconds':>8} {'ops/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for name in ("scan", "registry", "poll"):
+        r = results[name]
+        print(f"{name:10} {r['ops']:>7} {r['errors']:>7} {r['seconds']:>8.2f} "
+              f"{r['ops_per_s']:>9.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+    print(f"identified {results['scan']['identified']}, unknown {results['scan']['unknown']}, "
+          f"fleet requests {f['requests']}, "
+          f"injected failures {f['injected_failures']}, slow {f['slow_responses']}")
+    print(f"peak RSS {results['peak_rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,12 @@
-import asyncio
 from network_scanner import NetworkScanner
-import httpx
-import threading
+from runtime import get_runtime
 
 async def main():
     scanner = NetworkScanner(cfg, "192.168.2.0/24")
     
     # 1. Nur die IPs holen
     print(f"--- Starte Discovery in 192.168.2.0/24 ---") #{self.target_network} 
-    ips = scanner.discover_network()
+    ips = await get_runtime().to_thread(scanner.discover_network)
     #print(f"Gefundene IPs: {ips}")
 
     # Hier könntest du jetzt manuell IPs hinzufügen oder entfernen
@@ -16,13 +14,11 @@ async def main():
 
     # 2. Die Liste abarbeiten
     if ips:
-        async with httpx.AsyncClient() as client:
-            tasks = [scanner.identify_device(ip, client) for ip in ips]
-            devices = await asyncio.gather(*tasks)
-            
-            print("\nScan-Ergebnis:")
-            for d in devices:
-                print(f"{d['ip']:<15} | {d['type']:<10} | {d['model']}")
+        devices = await scanner.identify_all(ips)
+
+        print("\nScan-Ergebnis:")
+        for d in devices:
+            print(f"{d['ip']:<15} | {d['Device']:<10} | {d['model']}")
         print(f"dicovered devices: {len(ips)}")
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    get_runtime().run(main())
\ No newline at end of file
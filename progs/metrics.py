@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Metriken im Prometheus-Textformat (GET /metrics).
+
+Die Metriken sind Modulkonstanten und werden beim Import angelegt; die
+Kinder pro Label-Wert (z.B. pro Host) einmal beim ersten Zugriff. Danach
+ist ein Messpunkt ein Dict-Zugriff plus += ohne Sperre, wie bei
+transport.HostStats. Gleichzeitige += aus mehreren Threads können unter dem
+GIL selten ein Inkrement verlieren; für Raten und Latenzen reicht das.
+
+    from metrics import HTTP_REQUEST_SECONDS
+    HTTP_REQUEST_SECONDS.labels(host).observe(elapsed)
+
+Zählerstände, die ohnehin schon geführt werden (Transport pro Host,
+ThreadManager), liest ein Collector erst beim Abruf:
+
+    start_metrics_server(cfg)         # Port cfg MetricsPort, sonst DeSePort
+    curl http://localhost:<port>/metrics
+"""
+
+import bisect
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DISCOVERY_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+WRITE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+SERVE_POLL = 0.5          # Sekunden, nach denen der Server das Stop-Signal prüft
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ---------------------------------------------------------------------------
+# Metriktypen
+# ---------------------------------------------------------------------------
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class Histogram:
+    """Feste Bucket-Grenzen; observe() zählt nur den passenden Bucket, kumuliert wird beim Abruf."""
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)     # letzter Bucket: +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("hist", "start")
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start)
+        return False
+
+
+KINDS = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+
+
+class Family:
+    """Eine Metrik mit Labels; labels(...) liefert das (einmal angelegte) Kind."""
+
+    def __init__(self, name: str, kind: str, help: str, labelnames: tuple = (), buckets: tuple = None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets or LATENCY_BUCKETS)
+        self._children = {}       # (label-werte) -> Counter/Gauge/Histogram
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new(self):
+        return Histogram(self.buckets) if self.kind == "histogram" else KINDS[self.kind]()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: erwartet Labels {self.labelnames}, bekommen {values}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new()
+        return child
+
+    # ohne Labels direkt benutzbar
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def remove(self, *values) -> None:
+        with self._lock:
+            self._children.pop(values, None)
+
+    def samples(self):
+        """(Name, Labels, Wert) in Prometheus-Form."""
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            if self.kind != "histogram":
+                yield self.name, labels, child.value
+                continue
+            cumulative = 0
+            for bound, count in zip(child.bounds + (math.inf,), list(child.counts)):
+                cumulative += count
+                yield f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative
+            yield f"{self.name}_sum", labels, child.sum
+            yield f"{self.name}_count", labels, cumulative
+
+# ---------------------------------------------------------------------------
+# Registry und Textformat
+# ---------------------------------------------------------------------------
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_sample(name: str, labels: dict, value) -> str:
+    if labels:
+        inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        return f"{name}{{{inner}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.families = {}        # name -> Family
+        self._collectors = {}     # key -> callable() -> [(name, kind, help, [(labels, wert)])]
+        self._lock = threading.Lock()
+
+    def family(self, name: str, kind: str, help: str, labelnames: tuple = (), buckets: tuple = None) -> Family:
+        with self._lock:
+            fam = self.families.get(name)
+            if fam is None:
+                fam = self.families[name] = Family(name, kind, help, labelnames, buckets)
+        return fam
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Family:
+        return self.family(name, "counter", help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: tuple = ()) -> Family:
+        return self.family(name, "gauge", help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Family:
+        return self.family(name, "histogram", help, labelnames, buckets)
+
+    def add_collector(self, key: str, collector) -> None:
+        """collector() läuft bei jedem Abruf; gleicher key ersetzt den alten."""
+        with self._lock:
+            self._collectors[key] = collector
+
+    def remove_collector(self, key: str) -> None:
+        with self._lock:
+            self._collectors.pop(key, None)
+
+    def render(self) -> str:
+        lines = []
+        for fam in list(self.families.values()):
+            lines.append(f"# HELP {fam.name} {fam.help}")
+            lines.append(f"# TYPE {fam.name} {fam.kind}")
+            lines.extend(_format_sample(*s) for s in fam.samples())
+        for key, collector in list(self._collectors.items()):
+            try:
+                collected = collector()
+            except Exception as exc:
+                logger.error("Metrics collector %s failed: %s", key, exc)
+                continue
+            for name, kind, help, samples in collected:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(_format_sample(name, labels, value) for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Prozessweit gemeinsame Metrik-Registry."""
+    return _registry
+
+# ---------------------------------------------------------------------------
+# Metriken
+# ---------------------------------------------------------------------------
+
+HTTP_REQUEST_SECONDS = _registry.histogram(
+    "deco_http_request_seconds", "Dauer je HTTP-Request an ein Gerät (ein Versuch)", ("host",))
+IDENTIFIED = _registry.counter(
+    "deco_identified_total", "identify_device-Ergebnisse nach Profil", ("profile",))
+DISCOVERY_SECONDS = _registry.histogram(
+    "deco_discovery_duration_seconds", "Dauer der Geräteerkennung (Schritt 1)", ("method",),
+    buckets=DISCOVERY_BUCKETS)
+HOSTS_SKIPPED = _registry.counter(
+    "deco_hosts_skipped_total", "vom HostGuard übersprungene Abfragen", ("reason",))
+REGISTRY_DEVICES = _registry.gauge(
+    "deco_registry_devices", "Geräte in der Registry", ("store",))
+REGISTRY_WRITE_SECONDS = _registry.histogram(
+    "deco_registry_write_seconds", "Schreiben ins Registry-Protokoll inkl. fsync", ("store",),
+    buckets=WRITE_BUCKETS)
+
+# ---------------------------------------------------------------------------
+# Collectors für vorhandene Statistiken
+# ---------------------------------------------------------------------------
+
+def transport_collector(transport=None):
+    """Zähler aus transport.HostStats pro Host; kostet im Request-Pfad nichts zusätzlich."""
+    def collect():
+        from transport import get_transport
+        stats = (transport or get_transport()).stats()
+        out = []
+        for key, help in (("requests", "HTTP-Versuche"), ("connections", "neu aufgebaute Verbindungen"),
+                          ("retries", "Wiederholungen"), ("timeouts", "Versuche mit Timeout"),
+                          ("errors", "endgültig fehlgeschlagene Requests")):
+            out.append((f"deco_http_{key}_total", "counter", help,
+                        [({"host": host}, st[key]) for host, st in stats.items()]))
+        return out
+    return collect
+
+
+def thread_collector(tm):
+    """Zustand, Neustarts und CPU-Zeit der ThreadManager-Threads, dazu der Worker-Pool."""
+    states = ("new", "running", "backoff", "finished", "failed")
+
+    def collect():
+        stats = tm.stats()
+        threads = stats["threads"]
+        pool = stats["pool"]
+        return [
+            ("deco_thread_state", "gauge", "1 für den aktuellen Zustand des Threads",
+             [({"thread": name, "state": s}, int(t["state"] == s))
+              for name, t in threads.items() for s in states]),
+            ("deco_thread_restarts_total", "counter", "Neustarts durch den ThreadManager",
+             [({"thread": name}, t["restarts"]) for name, t in threads.items()]),
+            ("deco_thread_cpu_seconds_total", "counter", "CPU-Zeit des Threads",
+             [({"thread": name}, t["cpu"]) for name, t in threads.items()]),
+            ("deco_pool_jobs_total", "counter", "Jobs im Worker-Pool",
+             [({"result": k}, pool[k]) for k in ("submitted", "completed", "failed")]),
+        ]
+    return collect
+
+# ---------------------------------------------------------------------------
+# HTTP-Server
+# ---------------------------------------------------------------------------
+
+def _make_server(port: int, registry: MetricsRegistry, host: str = ""):
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            logger.debug("metrics %s - %s", self.address_string(), fmt % args)
+
+    server = HTTPServer((host, port), Handler)
+    server.timeout = SERVE_POLL
+    return server
+
+
+def serve_metrics(stop_event, server) -> None:
+    """Thread-Ziel für den ThreadManager: beantwortet Abrufe, bis stop_event gesetzt ist."""
+    try:
+        while not stop_event.is_set():
+            server.handle_request()
+    finally:
+        server.server_close()
+
+
+def start_metrics_server(cfg, tm=None, registry: MetricsRegistry = None):
+    """
+    /metrics auf cfg MetricsPort (sonst DeSePort) als ThreadManager-Thread
+    "metrics". Registriert die Collectors für Transport und ThreadManager.
+    Liefert den Server oder None, wenn kein Port konfiguriert oder er belegt ist.
+    """
+    registry = registry or _registry
+    port = cfg.get("MetricsPort", cfg.get("DeSePort"))      # 0: freier Port
+    if port is None:
+        logger.info("No MetricsPort/DeSePort configured, metrics endpoint disabled")
+        return None
+    tm = tm or cfg.get("ThreadManager")
+    if tm is None:
+        from threadmanager import ThreadManager
+        tm = ThreadManager()
+    try:
+        server = _make_server(int(port), registry, cfg.get("MetricsHost", ""))
+    except OSError as exc:
+        logger.error(f"Metrics endpoint on port {port} not available: {exc}")
+        return None
+    registry.add_collector("transport", transport_collector())
+    registry.add_collector("threads", thread_collector(tm))
+    tm.start("metrics", serve_metrics, args=(server,))
+    logger.info(f"Metrics on http://{cfg.get('MyName', 'localhost')}:{server.server_port}/metrics")
+    return server
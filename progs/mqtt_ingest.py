@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MQTT-Eingang für Shelly-Telemetrie.
+
+Abonniert die Topics der Shellys am Broker (cfg MQTTServer, "host:port"):
+
+    Gen1  shellies/<id>/relay/<n>            on/off
+          shellies/<id>/relay/<n>/power      W
+          shellies/<id>/relay/<n>/energy     Wmin (Zähler)
+          shellies/<id>/temperature, voltage, online
+    Gen2  <id>/events/rpc                    NotifyStatus / NotifyFullStatus (JSON-RPC)
+          <id>/status/<komponente>           Status einer Komponente (JSON)
+          <id>/online                        true/false
+
+Alle Meldungen werden in Gen2-Komponenten (switch:<n>) übersetzt und im
+StateCache zusammengeführt. Ein Reader nimmt die Nachrichten nur entgegen;
+dekodiert wird gesammelt alle BATCH_INTERVAL Sekunden (oder bei BATCH_SIZE
+Nachrichten). Pro Batch entsteht je Gerät ein Datensatz im Format der
+HTTP-Treiber (drivers.build_record); er geht an den Zeitreihen-Speicher,
+die Anwesenheit aller Geräte des Batches in einem Schreibvorgang an die
+Registry.
+
+Für Tests ohne Broker: simulator.StubBroker (client_factory=broker.client).
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+import drivers
+from shelly_ws import StateCache
+from threadtools import Counters
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+MQTT_SERVER = "localhost:1883"
+TOPICS = ("shellies/#", "+/events/rpc", "+/status/+", "+/online")
+BATCH_SIZE = 2000         # Nachrichten pro Batch höchstens
+BATCH_INTERVAL = 0.5      # Sekunden zwischen zwei Batches
+RECONNECT_MAX = 60.0
+
+# ---------------------------------------------------------------------------
+# Dekodieren
+# ---------------------------------------------------------------------------
+
+FULL, DELTA, ONLINE = "full", "delta", "online"
+
+
+def _flag(payload: bytes) -> bool:
+    return payload.strip().lower() in (b"true", b"1", b"on")
+
+
+def decode(topic: str, payload: bytes):
+    """
+    (device_id, gen, kind, data) einer Nachricht oder None, wenn das Topic
+    nicht ausgewertet wird. kind: FULL (Status ersetzen), DELTA (einmischen),
+    ONLINE (data ist bool). Wirft ValueError bei kaputtem Inhalt.
+    """
+    parts = topic.split("/")
+    if parts[0] == "shellies" and len(parts) >= 3:
+        device, rest = parts[1], parts[2:]
+        if rest[0] == "relay" and len(rest) >= 2:
+            comp = f"switch:{int(rest[1])}"
+            if len(rest) == 2:
+                return device, 1, DELTA, {comp: {"output": payload.strip() == b"on"}}
+            if rest[2] == "power":
+                return device, 1, DELTA, {comp: {"apower": float(payload)}}
+            if rest[2] == "energy":
+                # Gen1 zählt Wattminuten, Gen2 Wh
+                return device, 1, DELTA, {comp: {"aenergy": {"total": float(payload) / 60}}}
+            return None
+        if rest == ["temperature"]:
+            return device, 1, DELTA, {"switch:0": {"temperature": {"tC": float(payload)}}}
+        if rest == ["voltage"]:
+            return device, 1, DELTA, {"switch:0": {"voltage": float(payload)}}
+        if rest == ["online"]:
+            return device, 1, ONLINE, _flag(payload)
+        return None
+
+    if len(parts) < 2:
+        return None
+    device, rest = parts[0], parts[1:]
+    if rest == ["events", "rpc"]:
+        msg = json.loads(payload)
+        params = dict(msg.get("params") or {})
+        params.pop("ts", None)
+        if msg.get("method") == "NotifyStatus":
+            return device, 2, DELTA, params
+        if msg.get("method") == "NotifyFullStatus":
+            return device, 2, FULL, params
+        return None
+    if len(rest) == 2 and rest[0] == "status":
+        return device, 2, DELTA, {rest[1]: json.loads(payload)}
+    if rest == ["online"]:
+        return device, 2, ONLINE, _flag(payload)
+    return None
+
+# ---------------------------------------------------------------------------
+# Ingest
+# ---------------------------------------------------------------------------
+
+class IngestStats(Counters):
+    __slots__ = ("messages", "batches", "records", "ignored", "errors", "batch_max", "decode_time")
+
+
+class MqttIngest:
+    def __init__(self, cfg=None, registry=None, store=None, server: str = None,
+                 client_factory=None, batch_size: int = BATCH_SIZE,
+                 batch_interval: float = BATCH_INTERVAL):
+        """
+        registry: registry.registry (mark_presence), store: tsdb.TimeSeriesStore
+        (record_reading); beide optional. client_factory() liefert einen
+        aiomqtt.Client-artigen Client, Default aiomqtt.Client am Broker.
+        """
+        cfg = cfg or {}
+        self.server = server or cfg.get("MQTTServer", MQTT_SERVER)
+        self.registry = registry
+        self.store = store
+        self.client_factory = client_factory
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.cache = StateCache()
+        self.gen = {}             # device -> 1 | 2
+        self.online = {}          # device -> bool
+        self.stats = IngestStats()
+        self._pending = []        # (topic, payload), vom Reader gefüllt
+        self._wakeup = None
+
+    def ingest(self, messages) -> dict:
+        """Einen Batch (topic, payload) verarbeiten; {device: Datensatz} der geänderten Geräte."""
+        start = time.perf_counter()
+        touched = set()
+        presence = {}
+        for topic, payload in messages:
+            self.stats.messages += 1
+            try:
+                decoded = decode(topic, payload)
+            except (ValueError, TypeError, AttributeError) as exc:
+                self.stats.errors += 1
+                logger.debug("Bad MQTT message on %s: %s", topic, exc)
+                continue
+            if decoded is None:
+                self.stats.ignored += 1
+                continue
+            device, gen, kind, data = decoded
+            self.gen[device] = gen
+            if kind == ONLINE:
+                if self.online.get(device) != data:
+                    presence[device] = data
+                self.online[device] = data
+                continue
+            if kind == FULL:
+                self.cache.replace(device, data)
+            else:
+                self.cache.apply(device, data)
+            touched.add(device)
+            if not self.online.get(device):
+                # wer Messwerte schickt, ist online
+                self.online[device] = presence[device] = True
+
+        records = {}
+        for device in touched:
+            spec = drivers.spec_for(self._model(device))
+            records[device] = drivers.build_record(
+                spec, self.cache.get(device), {"id": device, "gen": self.gen[device]}, None)
+            if self.store is not None:
+                self.store.record_reading(device, records[device])
+        if presence and self.registry is not None:
+            self.registry.mark_presence(presence, source="mqtt")
+
+        self.stats.batches += 1
+        self.stats.records += len(records)
+        self.stats.batch_max = max(self.stats.batch_max, len(messages))
+        self.stats.decode_time += time.perf_counter() - start
+        return records
+
+    def _model(self, device: str):
+        if self.registry is None:
+            return None
+        return (self.registry.store.devices.get(device) or {}).get("model")
+
+    # -- asyncio ------------------------------------------------------------
+
+    def _client(self):
+        if self.client_factory is not None:
+            return self.client_factory()
+        import aiomqtt
+        host, _, port = self.server.partition(":")
+        return aiomqtt.Client(host, int(port or 1883), identifier=f"deco-ingest-{id(self):x}")
+
+    async def _read(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                async with self._client() as client:
+                    for topic in TOPICS:
+                        await client.subscribe(topic)
+                    logger.info("MQTT ingest subscribed at %s", self.server)
+                    backoff = 1.0
+                    async for message in client.messages:
+                        self._pending.append((str(message.topic), message.payload))
+                        if len(self._pending) >= self.batch_size:
+                            self._wakeup.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("MQTT connection to %s failed: %s", self.server, exc)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RECONNECT_MAX)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.batch_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> dict:
+        pending, self._pending = self._pending, []
+        records = {}
+        for i in range(0, len(pending), self.batch_size):
+            records.update(self.ingest(pending[i:i + self.batch_size]))
+        return records
+
+    async def run(self, stop: asyncio.Event = None) -> None:
+        self._wakeup = asyncio.Event()
+        tasks = [asyncio.create_task(self._read()), asyncio.create_task(self._flush_loop())]
+        try:
+            if stop is None:
+                await asyncio.gather(*tasks)
+            else:
+                await stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.flush()
@@ -1,14 +1,17 @@
 import logging
 import asyncio
 import subprocess
-from scapy.all import ARP, Ether, srp
-from zeroconf import Zeroconf, ServiceBrowser, ServiceListener
-import httpx
-import threading
 import time
 
+from arp_scan import ArpScanner, read_proc_arp
 from shelly_handler import ShellyHandler
-from html_parser import parse_ESP
+from html_parser import parse_ESP_page
+from discovery import get_discovery_service, running_discovery_service
+from host_guard import DEAD, UNKNOWN, get_host_guard
+from identity_cache import IdentityCache
+from metrics import DISCOVERY_SECONDS, IDENTIFIED
+from runtime import get_runtime
+from tracing import span, traced
 
 logger = logging.getLogger(__name__)
 logging.getLogger("scapy.runtime").setLevel(logging.WARNING)
@@ -17,27 +20,54 @@ logging.getLogger("scapy.loading").setLevel(logging.WARNING)
 # Konfiguration
 # ---------------------------------------------------------------------------
 
-DISCOVERY_TIME = 5.0      # Sekunden für mDNS-Sammlung
 HTTP_TIMEOUT = 5.0       # HTTP-Timeout pro Gerät
+MAX_CONNECTIONS = 64      # gleichzeitige HTTP-Verbindungen insgesamt
+MAX_PER_HOST = 4          # gleichzeitige HTTP-Verbindungen pro Gerät
+ARP_RATE = 500            # ARP-Requests pro Sekunde beim Sweep (Methode "SWEEP")
 
 class NetworkScanner:
-    def __init__(self, cfg, method="ARP"):
+    def __init__(self, cfg, method="ARP", arp_socket=None, hosts=None):
         self.method = method
         self.cfg = cfg
         self.target_network = cfg['TargetNet']
         self.sh = ShellyHandler(cfg)
         self.active_ips = []
+        self.active_macs = {}
+        self.arp_socket = arp_socket      # z.B. arp_scan.FakeArpSocket für Tests
+        # Methode "STATIC": feste Hostliste statt Scan, z.B. simulator.FakeFleet.hosts
+        self.static_hosts = list(hosts if hosts is not None else cfg.get('ScanHosts') or [])
+        self.identity_cache = IdentityCache.from_cfg(cfg)
+        # unbekannte und tote Hosts (Schlüssel MAC) mit wachsendem Abstand überspringen
+        self.host_guard = get_host_guard(cfg)
+        self._answered = set()    # IPs, die bei der laufenden Identifizierung HTTP geantwortet haben
+        self.max_connections = cfg.get('ScanConcurrency', MAX_CONNECTIONS)
+        self.max_per_host = cfg.get('ScanPerHost', MAX_PER_HOST)
+        self._global_sem = None
+        self._host_sems = {}
+        # alle Profile werden gleichzeitig geprobt, der erste Treffer gewinnt
+        self.profiles = (self._probe_shelly_gen2, self._probe_shelly_gen1,
+                         self._probe_wled, self._probe_esp)
 
     def discover_network(self):
+        with DISCOVERY_SECONDS.labels(self.method).time(), span("discover", method=self.method):
+            return self._discover_network()
+
+    def _discover_network(self):
         if self.method == "ARP":
             return self.discover_ips()
+        elif self.method == "SWEEP":
+            # im gemeinsamen Loop; discover_network() selbst blockiert, aus Coroutinen also per to_thread
+            return get_runtime().run(self.discover_arp_sweep())
         elif self.method == "ZCP":
             return self.discover_zeroconf_ips()
+        elif self.method == "STATIC":
+            return self.discover_static()
         logger.error(f"Unbekannte Scan-Methode: {self.method}")
         return {}   
         
     def discover_ips(self):
-        from scapy.all import conf # Importiere die Config zum Prüfen
+        # scapy erst hier laden: der Import allein kostet fast eine Sekunde
+        from scapy.all import ARP, Ether, srp, conf
         logger.debug(f"DEBUG: Scapy nutzt Interface: {conf.iface}")
 
         arp = ARP(pdst=self.target_network)
@@ -45,19 +75,23 @@ class NetworkScanner:
         packet = ether/arp
 
         # 1. Warmup (fping) - Achte auf self.target_network!
-        subprocess.run(["fping", "-g", self.target_network, "-a", "-q", "-r", "0"], 
-                    capture_output=True)    
+        with span("discover.fping"):
+            subprocess.run(["fping", "-g", self.target_network, "-a", "-q", "-r", "0"], 
+                        capture_output=True)    
             
         found_ips = set()
+        self.active_macs = {}
         
         for i in range(3):
             try:
                 # Sende das Paket und achte auf die Statistik
-                ans, unans = srp(packet, timeout=2, verbose=False) # verbose=True zeigt Paket-Statistik!
+                with span("discover.srp", attempt=i + 1):
+                    ans, unans = srp(packet, timeout=2, verbose=False) # verbose=True zeigt Paket-Statistik!
                 logger.debug(f"Versuch {i+1}: {len(ans)} Antworten erhalten.")
                 
                 for _, received in ans:
                     found_ips.add(received.psrc)
+                    self.active_macs[received.psrc] = received.hwsrc.lower()
             except Exception as e:
                 logger.error(f"Fehler: {e}")
 
@@ -65,110 +99,213 @@ class NetworkScanner:
         #self.discover_devices(self.active_ips)
         return self.active_ips
     
-    def discover_zeroconf_ips(self) -> dict:
-        logger.debug("Starting mDNS discovery")
+    @traced("discover.arp_sweep")
+    async def discover_arp_sweep(self):
+        """ARP-Sweep ohne fping/scapy (arp_scan.ArpScanner), ergänzt um /proc/net/arp."""
+        scanner = ArpScanner(self.target_network,
+                             iface=self.cfg.get('ScanIface'),
+                             rate=self.cfg.get('ArpRate', ARP_RATE),
+                             sock=self.arp_socket)
+        try:
+            self.active_macs = await scanner.scan()
+        except OSError as exc:
+            # ohne CAP_NET_RAW bleibt nur die Nachbartabelle des Kernels
+            logger.error(f"ARP-Sweep nicht möglich ({exc}), nutze nur /proc/net/arp")
+            self.active_macs = read_proc_arp(self.target_network)
+        self.active_ips = list(self.active_macs)
+        return self.active_ips
+
+    def discover_static(self):
+        """Feste Hostliste (cfg ScanHosts oder hosts=...), ohne MACs."""
+        self.active_macs = {}
+        self.active_ips = list(self.static_hosts)
+        return self.active_ips
 
-        zeroconf = Zeroconf()
-        listener = DevListener()
+    def discover_zeroconf_ips(self) -> tuple[dict, dict]:
+        logger.debug("Reading mDNS discovery service")
+        devinfo, service = get_discovery_service().snapshot()
+        logger.info(f"Discovery complete: {len(devinfo)} devices found.")
+        return devinfo, service
 
-        ServiceBrowser(zeroconf, "_http._tcp.local.", listener)
-        time.sleep(DISCOVERY_TIME)
-        zeroconf.close()
+    # -----------------------------------------------------------------------
+    # Identifizierung (async, begrenzte Parallelität)
+    # -----------------------------------------------------------------------
 
-        logger.info(f"Discovery complete: {len(listener.devinfo)} devices found.")
-        return listener.devinfo, listener.service
+    def _host_semaphore(self, ip) -> asyncio.Semaphore:
+        sem = self._host_sems.get(ip)
+        if sem is None:
+            sem = self._host_sems[ip] = asyncio.Semaphore(self.max_per_host)
+        return sem
 
-        found = {}
+    async def _probe_get(self, client, ip, path, timeout):
+        """GET auf ein Gerät, begrenzt pro Host und global. None bei Fehler."""
+        import httpx
+        if self._global_sem is None:
+            self._global_sem = asyncio.Semaphore(self.max_connections)
+        try:
+            async with self._host_semaphore(ip), self._global_sem:
+                resp = await client.get(f"http://{ip}{path}", timeout=timeout)
+        except (httpx.HTTPError, OSError) as exc:
+            logger.debug("Probe %s%s failed: %s", ip, path, exc)
+            return None
+        if resp.status_code < 500:
+            self._answered.add(ip)        # 5xx zählt nicht: das Gerät ist evtl. nur überlastet
+        return resp if resp.status_code == 200 else None
+
+    @traced("probe.shelly_gen2")
+    async def _probe_shelly_gen2(self, ip, client):
+        resp = await self._probe_get(client, ip, "/rpc/Shelly.GetDeviceInfo", 1.2)
+        if resp is None:
+            return None
+        data = resp.json()
+        return {"ip": ip, "Device": "Shelly", "Type": "N/A", "model": data.get("model"),
+                "fw": data.get("fw_id")}
+
+    @traced("probe.shelly_gen1")
+    async def _probe_shelly_gen1(self, ip, client):
+        resp = await self._probe_get(client, ip, "/shelly", 1.0)
+        if resp is None:
+            return None
+        data = resp.json()
+        # Gen2+ beantworten /shelly ebenfalls, dort steht das Modell in "model"
+        model = data.get("model") if data.get("gen", 1) >= 2 else data.get("type")
+        return {"ip": ip, "Device": "Shelly", "Type": "N/A", "model": model,
+                "fw": data.get("fw_id") or data.get("fw")}
 
-        for ip in listener.ips:
-            result = sh._query_shelly(ip)
-            if result:
-                device_id, data = result
-                found[device_id] = data
+    @traced("probe.wled")
+    async def _probe_wled(self, ip, client):
+        resp = await self._probe_get(client, ip, "/json/state", 1.0)
+        if resp is None:
+            return None
+        return {"ip": ip, "Device": "WLED", "Type": "N/A", "model": "ESP-Light"}
+
+    @traced("probe.esp")
+    async def _probe_esp(self, ip, client):
+        if await self._probe_get(client, ip, "/status", 1.0) is None:
+            return None
+        # Shelly Gen1 hat ebenfalls /status (JSON) -> nur mit <div1>-Seite ein ESP
+        resp = await self._probe_get(client, ip, "/", HTTP_TIMEOUT)
+        if resp is None:
+            return None
+        info = parse_ESP_page(resp.content)
+        if info is None:
+            return None
+        logger.debug(f"ESP-Gerät gefunden: {info}")
+        return {"ip": ip,
+                "Hostname": info.get("Hostname"), 
+                "Device": "ESP", 
+                "Type": info.get("Type"), 
+                "model": info.get("Hardw"),
+                "fw": info.get("Version"),
+                "uptime": info.get("uptime"),
+                "good Transmissions": info.get("good Transmissions"),
+                "bad Transmissions": info.get("bad Transmissions")}
 
-        logger.info("Discovery complete: %d devices found.", len(found))
-        return found
     async def identify_device(self, ip, client):
-        """Schritt 2: Prüft eine einzelne IP auf bekannte Profile."""
-        # --- Profil: Shelly Gen 2/3 ---
-        try:
-            resp = await client.get(f"http://{ip}/rpc/Shelly.GetDeviceInfo", timeout=1.2)
-            if resp.status_code == 200:
-                data = resp.json()
-                return {"ip": ip, "Device": "Shelly", "Type": "N/A", "model": data.get("model")}
-        except: pass
+        """Schritt 2: Prüft eine einzelne IP parallel auf alle bekannten Profile.
 
-        # --- Profil: Shelly Gen 1 ---
-        try:
-            resp = await client.get(f"http://{ip}/shelly", timeout=1.0)
-            if resp.status_code == 200:
-                data = resp.json()
-                return {"ip": ip, "Device": "Shelly", "Type": "N/A", "model": data.get("type")}
-        except: pass
+        Der erste positive Treffer gewinnt, die übrigen Proben werden abgebrochen.
+        """
+        self._answered.discard(ip)
+        with span("identify", ip=ip) as sp:
+            probes = [asyncio.ensure_future(probe(ip, client)) for probe in self.profiles]
+            try:
+                for next_done in asyncio.as_completed(probes):
+                    try:
+                        result = await next_done
+                    except Exception as exc:
+                        logger.debug("Probe on %s raised: %s", ip, exc)
+                        continue
+                    if result:
+                        IDENTIFIED.labels(result.get("Device", "unknown")).inc()
+                        sp.set(device=result.get("Device"))
+                        return result
+            finally:
+                for task in probes:
+                    task.cancel()
 
-        # --- Profil: WLED ---
-        try:
-            resp = await client.get(f"http://{ip}/json/state", timeout=1.0)
-            if resp.status_code == 200:
-                return {"ip": ip, "Device": "WLED", "Type": "N/A", "model": "ESP-Light"}
-        except: pass
+        IDENTIFIED.labels("unknown").inc()
+        return self._unknown(ip)
+
+    @staticmethod
+    def _unknown(ip) -> dict:
+        return {"ip": ip, "Device": "unknown", "Type": "N/A", "model": "N/A"}
 
+    @traced("identify_all")
+    async def identify_all(self, ips, client=None):
+        """
+        Identifiziert alle IPs nebenläufig. Ohne client bekommt jeder Host einen
+        eigenen kleinen Client: ein gemeinsamer httpx-Pool über hunderte Hosts
+        sucht bei jedem Request über alle Verbindungen und wird quadratisch langsam.
+        """
+        if client is not None:
+            return await asyncio.gather(*(self.identify_device(ip, client) for ip in ips))
+        import httpx
+        import ssl
+        ctx = ssl.create_default_context()        # einmal statt pro Client
+        limits = httpx.Limits(max_connections=self.max_per_host)
+        clients = [httpx.AsyncClient(limits=limits, verify=ctx) for _ in ips]
         try:
-            resp = await client.get(f"http://{ip}/status", timeout=1.0)
-            if resp.status_code == 200:
-                info = parse_ESP(ip)
-                logger.debug(f"ESP-Gerät gefunden: {info}")
-                return {"ip": ip,
-                        "Hostname": info.get("Hostname"), 
-                        "Device": "ESP", 
-                        "Type": info.get("Type"), 
-                        "model": info.get("Hardw"),
-                        "uptime": info.get("uptime"),
-                        "good Transmissions": info.get("good Transmissions"),
-                        "bad Transmissions": info.get("bad Transmissions")}
-        except: pass
+            return await asyncio.gather(*(self.identify_device(ip, c) for ip, c in zip(ips, clients)))
+        finally:
+            await asyncio.gather(*(c.aclose() for c in clients))
 
-        return {"ip": ip, "Device": "unknown", "Type": "N/A", "model": "N/A"}
+    async def identify_changed(self, ips, force=False):
+        """
+        Wie identify_all, aber nur für neue, umgezogene oder abgelaufene Hosts
+        (IdentityCache, Schlüssel MAC). Hosts ohne Profil oder ohne Antwort
+        überspringt der HostGuard mit wachsendem Abstand. force=True
+        identifiziert alle neu.
+        """
+        svc = running_discovery_service()
+        names = svc.names_by_ip() if svc is not None else {}
+        cache = self.identity_cache
+        cache.expire()
+        guard = self.host_guard
+        if force:
+            probe, cached = list(ips), {}
+        else:
+            probe, cached = cache.partition(ips, self.active_macs, names)
+            # bekannte Nicht-Geräte und tote Hosts bis zum nächsten half_open-Versuch auslassen
+            skipped = [ip for ip in probe if not guard.allow(self.active_macs.get(ip) or ip)]
+            if skipped:
+                cached.update((ip, self._unknown(ip)) for ip in skipped)
+                probe = [ip for ip in probe if ip not in cached]
+        logger.debug(f"Identifiziere {len(probe)} Geräte, {len(cached)} aus dem Cache")
+
+        probed = await self.identify_all(probe) if probe else []
+        for result in probed:
+            ip = result["ip"]
+            mac = self.active_macs.get(ip)
+            if result["Device"] == "unknown":
+                # hat der Host überhaupt geantwortet? sonst ist er (vorerst) tot
+                guard.failure(mac or ip, UNKNOWN if ip in self._answered else DEAD, ip=ip)
+                continue
+            guard.success(mac or ip)
+            if mac:
+                cache.store(mac, ip, result, names.get(ip))
+        self._answered.clear()
+        with span("identity_cache.save"):
+            cache.save()
+            guard.save()
+
+        by_ip = dict(cached)
+        by_ip.update((result["ip"], result) for result in probed)
+        return [by_ip[ip] for ip in ips]
 
-    async def run_full_scan(self):
+    async def run_full_scan(self, force=False):
         """Koordiniert beide Schritte."""
-        ips = self.discover_ips()
-        if not ips:
-            return []
-
-        logger.debug(f"Identifiziere {len(ips)} Geräte...")
-        async with httpx.AsyncClient() as client:
-            tasks = [self.identify_device(ip, client) for ip in ips]
-            return await asyncio.gather(*tasks)
-        
-class DevListener(ServiceListener):
-    def __init__(self):
-        self.devinfo = {}
-        self.service = {}
-        self._lock = threading.Lock()
-
-    def add_service(self, zeroconf, service_type, name):
-        info = zeroconf.get_service_info(service_type, name)
-        if info:
-            if not info:
-                logger.debug("mDNS service without info: %s", name)
-                return
-
-            addresses = info.parsed_addresses()
-            if not addresses:
-                logger.debug("mDNS service without address: %s", name)
-                return
-
-            with self._lock:
-                ip = addresses[0]
-                self.devinfo[info.server.replace(".local.", "")] = (ip, info.name)
-                self.service[info.server.replace(".local.", "")] = info
-                logger.info("mDNS found device at %s (%s)", ip, name)
-
-    def update_service(self, zeroconf, service_type, name):
-        logger.debug("### mDNS service updated: ### %s", name)
-        pass
-
-    def remove_service(self, zeroconf, service_type, name):
-        logger.debug("### mDNS service removed ###: %s", name)
-        pass
+        with span("scan", method=self.method, force=force):
+            start = time.perf_counter()
+            with span("discover", method=self.method):
+                if self.method == "SWEEP":
+                    ips = await self.discover_arp_sweep()
+                elif self.method == "STATIC":
+                    ips = self.discover_static()
+                else:
+                    ips = self.discover_ips()
+            DISCOVERY_SECONDS.labels(self.method).observe(time.perf_counter() - start)
+            if not ips:
+                return []
+
+            return await self.identify_changed(ips, force)
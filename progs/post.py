@@ -1,57 +1,308 @@
 #!/usr/bin/env python
+"""
+Push der Messwerte an die Server aus devs.yml (ServerName/ServerPort).
 
-import threading
-import logging
-import shared_files.config as cfg
-import shared_files.DataStore as ds
+- pro Zielserver eine begrenzte Queue und ein Sende-Thread (ThreadManager,
+  Daemon wie früher, damit Skripte ohne stop() nicht beim Beenden hängen;
+  stop() läuft zusätzlich per atexit und sendet bzw. spoolt den Rest)
+- Messwerte werden gesammelt und alle PostSleep Sekunden (oder bei
+  BATCH_SIZE Werten) als ein gzip-komprimiertes JSON gesendet, über die
+  keep-alive Verbindungen des gemeinsamen Transports
+- ist der Server nicht erreichbar, landet der Batch im Spool auf der Platte
+  (begrenzt, die ältesten Dateien fallen zuerst weg) und wird nach der
+  Erholung in der ursprünglichen Reihenfolge nachgeliefert
+- ist die Queue voll, wartet put() bis PUT_TIMEOUT und meldet dann False
+  (Backpressure statt unbegrenztem Wachstum)
 
-import requests
-import time
+Format eines Batches:
+    {"name": <hostname>, "readings": [{"device": ..., "ts": ..., "values": {...}}, ...]}
+"""
+
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
 import socket
+import threading
+import time
+from pathlib import Path
+
+from threadmanager import ThreadManager
+from threadtools import Counters
+from tracing import span, traced
+from transport import get_transport
 
 logger = logging.getLogger(__name__)
 
-# The WEP_Post class is a placeholder for a post on a website.
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+POST_SLEEP = 10.0         # Sekunden zwischen zwei Batches (cfg PostSleep)
+BATCH_SIZE = 500          # Messwerte pro Batch höchstens
+QUEUE_SIZE = 10000        # Messwerte pro Ziel in der Queue höchstens
+PUT_TIMEOUT = 1.0         # so lange wartet put() auf Platz in der Queue
+SPOOL_BYTES = 50 * 2**20  # Spool pro Ziel höchstens (komprimiert)
+REPLAY_PER_TICK = 20      # nachgelieferte Spool-Dateien pro Durchlauf höchstens
+COMPRESS_LEVEL = 6
+HTTP_TIMEOUT = 10.0
+
+
+def load_targets(cfg) -> dict:
+    """{device: URL} aus devs.yml (ServerName/ServerPort)."""
+    import yaml
+    path = os.path.join(cfg['YMLPath'], "devs.yml")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            devs = yaml.safe_load(f) or {}
+    except OSError as exc:
+        logger.warning("Could not read %s: %s", path, exc)
+        return {}
+    return {name: f"http://{entry['ServerName']}:{entry.get('ServerPort', 80)}/"
+            for name, entry in devs.items()
+            if isinstance(entry, dict) and entry.get('ServerName')}
+
+# ---------------------------------------------------------------------------
+# Statistik
+# ---------------------------------------------------------------------------
+
+class PostStats(Counters):
+    __slots__ = ("queued", "rejected", "batches", "readings", "raw_bytes", "sent_bytes",
+                 "failures", "spooled", "replayed", "spool_dropped", "lag_last", "lag_max")
+
+# ---------------------------------------------------------------------------
+# Spool
+# ---------------------------------------------------------------------------
+
+class Spool:
+    """Fertige Batches (gzip) als Dateien <seq>-<anzahl>.json.gz, älteste zuerst."""
+
+    def __init__(self, path, max_bytes: int = SPOOL_BYTES, stats: PostStats = None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stats = stats or PostStats()
+        self.files = sorted(self.path.glob("*.json.gz"))
+        self.size = sum(f.stat().st_size for f in self.files)
+        self._seq = int(self.files[-1].name.split("-")[0]) + 1 if self.files else 0
+
+    def __len__(self):
+        return len(self.files)
+
+    @staticmethod
+    def count(path: Path) -> int:
+        return int(path.name.split("-")[1].split(".")[0])
+
+    def write(self, payload: bytes, count: int) -> None:
+        path = self.path / f"{self._seq:012d}-{count}.json.gz"
+        self._seq += 1
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+        self.files.append(path)
+        self.size += len(payload)
+        self.stats.spooled += count
+        while self.size > self.max_bytes and len(self.files) > 1:
+            oldest = self.files[0]
+            self.stats.spool_dropped += self.count(oldest)
+            logger.warning("Spool %s full, dropping %s", self.path, oldest.name)
+            self.pop(oldest)
+
+    def oldest(self):
+        return self.files[0] if self.files else None
+
+    def pop(self, path: Path) -> None:
+        self.files.remove(path)
+        try:
+            self.size -= path.stat().st_size
+            path.unlink()
+        except OSError as exc:
+            logger.error("Could not remove %s: %s", path, exc)
+
+# ---------------------------------------------------------------------------
+# Push
+# ---------------------------------------------------------------------------
+
+class _Target:
+    def __init__(self, url: str, queue_size: int, spool: Spool, stats: PostStats):
+        self.url = url
+        self.queue = queue.Queue(queue_size)
+        self.spool = spool
+        self.stats = stats
+        self.rep_error = False
+
+
 class WEP_Post:
-  def __init__(self):
-    """
-    The function initializes various variables and starts a thread for posting data to a web URL.
-    """
-    logging.getLogger("requests").setLevel(logging.WARNING)
-    logging.getLogger("urllib3").setLevel(logging.WARNING)
-    self.sleep = cfg.ini["PostSleep"]
-    self.logger = logging.getLogger(__name__)
-    self.info = dict()
-    self.info["name"] = socket.gethostname()
-    self._post = threading.Thread(target=self._postit, daemon=True).start()
-    ds.put("System", ("starttime_app", int(time.time())))
-    self.logger.info("Client posting started, sending to: " + cfg.ini['web_URL'])
-    self.repError = False
-
-  def _postit(self):
-    """
-    The function `_postit` sends data to a server at regular intervals, rounding the values and
-    handling any errors that occur.
-    """
-    while True:
-        for x in ds.DS.ds['WEB']:
-          if x != "Commons":
-            value = ds.DS.ds['WEB'][x]['CURRENT_DATA']
+    def __init__(self, cfg, targets: dict = None, default_url: str = None,
+                 sleep: float = None, batch_size: int = BATCH_SIZE, queue_size: int = QUEUE_SIZE,
+                 spool_path=None, spool_bytes: int = SPOOL_BYTES):
+        """
+        targets: {device: URL}, Default aus devs.yml. Geräte ohne Eintrag gehen
+        an default_url (cfg web_URL bzw. DeSeName:DeSePort).
+        """
+        self.cfg = cfg
+        self.sleep = sleep if sleep is not None else cfg.get("PostSleep", POST_SLEEP)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.spool_bytes = spool_bytes
+        self.targets = load_targets(cfg) if targets is None else dict(targets)
+        if default_url is None:
+            default_url = cfg.get("web_URL") or (
+                f"http://{cfg['DeSeName']}:{cfg['DeSePort']}/" if cfg.get("DeSeName") else None)
+        self.default_url = default_url
+        self.spool_path = Path(spool_path or os.path.join(cfg.get("DataPath", "."), "spool"))
+        self.tm = cfg.get("ThreadManager") or ThreadManager()
+        self.name = socket.gethostname()
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._queues = {}         # URL -> _Target
+        atexit.register(self.stop)
+        logger.info("Client posting started, %d device targets, default %s",
+                    len(self.targets), self.default_url)
+
+    # -- Eingang ------------------------------------------------------------
+
+    def _target(self, url: str) -> _Target:
+        target = self._queues.get(url)
+        if target is None:
+            with self._lock:
+                target = self._queues.get(url)
+                if target is None:
+                    safe = url.split("//", 1)[-1].strip("/").replace(":", "_").replace("/", "_")
+                    stats = PostStats()
+                    spool = Spool(self.spool_path / safe, self.spool_bytes, stats)
+                    target = self._queues[url] = _Target(url, self.queue_size, spool, stats)
+                    self.tm.start(f"post:{url}", target=self._run, args=(target,), daemon=True)
+        return target
+
+    def put(self, device: str, values: dict, ts: float = None) -> bool:
+        """Messwert einreihen; False, wenn die Queue auch nach PUT_TIMEOUT voll ist."""
+        url = self.targets.get(device, self.default_url)
+        if url is None:
+            logger.debug("No post target for %s", device)
+            return False
+        target = self._target(url)
+        item = {"device": device, "ts": time.time() if ts is None else ts, "values": values}
+        try:
+            target.queue.put(item, timeout=PUT_TIMEOUT)
+        except queue.Full:
+            target.stats.rejected += 1
+            return False
+        target.stats.queued += 1
+        return True
+
+    # -- Senden -------------------------------------------------------------
+
+    def _collect(self, target: _Target, stop_event) -> list:
+        batch = []
+        deadline = time.monotonic() + self.sleep
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or stop_event.is_set():
+                break
             try:
-              resstr = str(round(value, 2))
-            except:
-              resstr = str(value)
-            self.info[x] = resstr
+                batch.append(target.queue.get(timeout=min(remaining, 0.5)))
+            except queue.Empty:
+                continue
+            # alles, was schon da ist, ohne Warten mitnehmen
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(target.queue.get_nowait())
+                except queue.Empty:
+                    break
+        return batch
 
+    def _drain(self, target: _Target) -> list:
+        batch = []
+        while True:
+            try:
+                batch.append(target.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _post(self, target: _Target, payload: bytes) -> bool:
         try:
-          #logger.info(f"{ds.DS.ds['EDAG_P_SIM_TX_3']}")
-          #logger.info(f"{self.info}")
-          response = requests.post(f"{cfg.ini['web_URL']}/", json=self.info)
-          if self.repError:
-            self.logger.info("send to server resumed.")
-            self.repError = False
-        except:
-          if not self.repError:
-            self.logger.error("could not post to server!!!")
-            self.repError = True
-        time.sleep(self.sleep)
+            with span("post.http", url=target.url, bytes=len(payload)):
+                # retries=0: ein nicht bestätigter Batch geht in den Spool, nicht doppelt raus
+                resp = get_transport().post(target.url, content=payload, timeout=HTTP_TIMEOUT, retries=0, headers={
+                    "Content-Type": "application/json", "Content-Encoding": "gzip"})
+            ok = resp.is_success
+        except Exception as exc:
+            logger.debug("Post to %s failed: %s", target.url, exc)
+            ok = False
+        if ok:
+            target.stats.sent_bytes += len(payload)
+            if target.rep_error:
+                logger.info("send to %s resumed.", target.url)
+                target.rep_error = False
+        else:
+            target.stats.failures += 1
+            if not target.rep_error:
+                logger.error("could not post to %s!", target.url)
+                target.rep_error = True
+        return ok
+
+    @traced("post.replay")
+    def _replay(self, target: _Target) -> bool:
+        """Spool nachliefern; True, wenn er danach leer ist."""
+        for _ in range(REPLAY_PER_TICK):
+            path = target.spool.oldest()
+            if path is None:
+                return True
+            if not self._post(target, path.read_bytes()):
+                return False
+            count = Spool.count(path)
+            target.stats.replayed += count
+            target.stats.readings += count
+            target.stats.batches += 1
+            target.spool.pop(path)
+        return not target.spool
+
+    @traced("post.send")
+    def _send(self, target: _Target, batch: list) -> None:
+        if batch:
+            raw = json.dumps({"name": self.name, "readings": batch}, separators=(",", ":")).encode()
+            payload = gzip.compress(raw, COMPRESS_LEVEL)
+            target.stats.raw_bytes += len(raw)
+        # erst den Spool, damit die Reihenfolge erhalten bleibt
+        if target.spool and not self._replay(target):
+            if batch:
+                target.spool.write(payload, len(batch))
+            return
+        if not batch:
+            return
+        if self._post(target, payload):
+            target.stats.batches += 1
+            target.stats.readings += len(batch)
+            lag = time.time() - batch[0]["ts"]
+            target.stats.lag_last = lag
+            target.stats.lag_max = max(target.stats.lag_max, lag)
+        else:
+            target.spool.write(payload, len(batch))
+
+    def _run(self, stop_event, target: _Target) -> None:
+        while not stop_event.is_set():
+            self._send(target, self._collect(target, stop_event))
+        # Rest noch senden oder in den Spool legen
+        self._send(target, self._drain(target))
+
+    # -- Verwaltung ---------------------------------------------------------
+
+    def stats(self) -> dict:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        result = {}
+        for url, target in self._queues.items():
+            st = target.stats.as_dict()
+            st["queue"] = target.queue.qsize()
+            st["spool_files"] = len(target.spool)
+            st["readings_per_s"] = st["readings"] / elapsed
+            result[url] = st
+        return result
+
+    def stop(self) -> None:
+        """Sende-Threads beenden; offene Messwerte gehen noch raus oder in den Spool."""
+        for url in list(self._queues):
+            self.tm.stop(f"post:{url}")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Anwesenheit über Heartbeats mit Ablaufzeit.
+
+Jede Meldung eines Geräts (Scan, Discovery, MQTT, Poll) ist ein Heartbeat:
+seen(device). Ein Gerät gilt als offline, wenn es MISSED_CYCLES Takte lang
+nichts gemeldet hat; der Takt kommt pro Gerät aus devs.yml/shelly_devs.yml
+(Cycle/time), sonst DEFAULT_CYCLE.
+
+Die Fristen liegen in einem Min-Heap mit höchstens einem Eintrag pro Gerät.
+Ein Heartbeat schreibt nur die neue Frist ins Dict (O(1)); erst wenn der
+alte Heap-Eintrag fällig wird, wird er mit der aktuellen Frist neu
+eingereiht (lazy invalidation). tick() arbeitet also nur die fälligen
+Einträge ab, nicht die ganze Registry.
+
+Übergänge gehen als PresenceEvent (ONLINE/OFFLINE) an die Abonnenten:
+
+    tracker = PresenceTracker.from_cfg(cfg)
+    tracker.subscribe(lambda ev: print(ev))
+    tracker.seen("shellyplus1-aabbcc")
+    tracker.tick()                                  # oder als Thread: tm.start("presence", tracker.run)
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from threadtools import Counters
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+DEFAULT_CYCLE = 60.0      # Sekunden, für Geräte ohne eigenen Takt (cfg PresenceCycle)
+MISSED_CYCLES = 3         # verpasste Takte bis offline (cfg PresenceMissed)
+TICK_MAX = 5.0            # run() schaut spätestens nach so vielen Sekunden wieder nach
+
+ONLINE, OFFLINE = "online", "offline"
+
+
+class PresenceEvent:
+    __slots__ = ("kind", "device", "ts", "last_seen")
+
+    def __init__(self, kind, device, ts, last_seen):
+        self.kind = kind
+        self.device = device
+        self.ts = ts
+        self.last_seen = last_seen
+
+    def __repr__(self):
+        return f"PresenceEvent({self.kind}, {self.device})"
+
+
+class PresenceStats(Counters):
+    __slots__ = ("heartbeats", "online", "offline", "ticks", "popped", "requeued")
+
+# ---------------------------------------------------------------------------
+# Tracker
+# ---------------------------------------------------------------------------
+
+class PresenceTracker:
+    def __init__(self, cycles: dict = None, default_cycle: float = DEFAULT_CYCLE,
+                 missed: int = MISSED_CYCLES, clock=time.time):
+        """cycles: {device: Takt in Sekunden}; clock liefert die aktuelle Zeit (Tests)."""
+        self.cycles = {k.lower(): float(v) for k, v in (cycles or {}).items()}
+        self.default_cycle = default_cycle
+        self.missed = missed
+        self.clock = clock
+        self.stats = PresenceStats()
+        self.last_seen = {}       # device -> Zeit des letzten Heartbeats
+        self._deadline = {}       # device -> aktuelle Frist (nur Online-Geräte)
+        self._heap = []           # (frist, seq, device), höchstens ein Eintrag pro Gerät
+        self._queued = set()      # Geräte mit Eintrag im Heap
+        self._seq = itertools.count()
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_cfg(cls, cfg, **kwargs) -> "PresenceTracker":
+        """Takte aus den YAML-Dateien im YMLPath, soweit vorhanden."""
+        cycles = {}
+        if cfg.get("YMLPath"):
+            from scheduler import load_poll_config
+            cycles = {name: cycle for name, (cycle, _) in load_poll_config(cfg).items()}
+        kwargs.setdefault("default_cycle", cfg.get("PresenceCycle", DEFAULT_CYCLE))
+        kwargs.setdefault("missed", cfg.get("PresenceMissed", MISSED_CYCLES))
+        return cls(cycles, **kwargs)
+
+    # -- Abonnenten ---------------------------------------------------------
+
+    def subscribe(self, callback) -> None:
+        """callback(PresenceEvent), aufgerufen außerhalb der Sperre."""
+        self._subscribers.append(callback)
+
+    def _publish(self, events: list) -> None:
+        for event in events:
+            logger.info("Presence: %s is %s", event.device, event.kind)
+            for callback in self._subscribers:
+                try:
+                    callback(event)
+                except Exception as exc:
+                    logger.error("Presence subscriber failed on %s: %s", event, exc)
+
+    # -- Heartbeats ---------------------------------------------------------
+
+    def timeout(self, device: str) -> float:
+        return self.cycles.get(device.lower(), self.default_cycle) * self.missed
+
+    def set_cycle(self, device: str, cycle: float) -> None:
+        """Gilt ab dem nächsten Heartbeat; eine schon eingereihte längere Frist läuft noch ab."""
+        self.cycles[device.lower()] = float(cycle)
+
+    def seen(self, device: str, ts: float = None) -> bool:
+        """Heartbeat; True, wenn das Gerät damit (wieder) online ist."""
+        ts = self.clock() if ts is None else ts
+        event = None
+        with self._lock:
+            self.stats.heartbeats += 1
+            if ts < self.last_seen.get(device, ts):
+                return False          # verspätete Meldung, die neuere gilt
+            self.last_seen[device] = ts
+            deadline = ts + self.timeout(device)
+            came_online = device not in self._deadline
+            self._deadline[device] = deadline
+            if device not in self._queued:
+                self._push(deadline, device)
+            if came_online:
+                self.stats.online += 1
+                event = PresenceEvent(ONLINE, device, ts, ts)
+        if event is not None:
+            self._publish([event])
+        return event is not None
+
+    def restore(self, device: str, last_seen: float) -> None:
+        """Gespeicherten Stand übernehmen (Programmstart), ohne ONLINE-Ereignis."""
+        with self._lock:
+            self.last_seen[device] = last_seen
+            self._deadline[device] = deadline = last_seen + self.timeout(device)
+            if device not in self._queued:
+                self._push(deadline, device)
+
+    def seen_many(self, devices, ts: float = None) -> int:
+        """Mehrere Heartbeats mit gleichem Zeitstempel (ein Scan). Liefert die Anzahl neu online."""
+        ts = self.clock() if ts is None else ts
+        return sum(self.seen(device, ts) for device in devices)
+
+    def _push(self, deadline: float, device: str) -> None:
+        heapq.heappush(self._heap, (deadline, next(self._seq), device))
+        self._queued.add(device)
+
+    def drop(self, device: str) -> None:
+        """Gerät ohne Ereignis vergessen (z.B. nach mDNS-Abmeldung oder Löschen)."""
+        with self._lock:
+            self._deadline.pop(device, None)
+            self.last_seen.pop(device, None)
+        # ein verbliebener Heap-Eintrag wird in tick() verworfen
+
+    # -- Ablauf -------------------------------------------------------------
+
+    def tick(self, now: float = None) -> list:
+        """Fällige Geräte auf offline setzen; Aufwand ~ Anzahl fälliger Heap-Einträge."""
+        now = self.clock() if now is None else now
+        events = []
+        with self._lock:
+            self.stats.ticks += 1
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                _, _, device = heapq.heappop(heap)
+                self.stats.popped += 1
+                deadline = self._deadline.get(device)
+                if deadline is None:
+                    self._queued.discard(device)         # gedroppt
+                elif deadline > now:
+                    # inzwischen ein Heartbeat: mit der aktuellen Frist neu einreihen
+                    heapq.heappush(heap, (deadline, next(self._seq), device))
+                    self.stats.requeued += 1
+                else:
+                    self._queued.discard(device)
+                    del self._deadline[device]
+                    self.stats.offline += 1
+                    events.append(PresenceEvent(OFFLINE, device, now, self.last_seen.get(device)))
+        self._publish(events)
+        return events
+
+    def next_deadline(self) -> float | None:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def run(self, stop_event) -> None:
+        """Thread-Ziel für den ThreadManager: tick() jeweils zur nächsten Frist."""
+        while not stop_event.is_set():
+            self.tick()
+            nxt = self.next_deadline()
+            # neue Geräte bekommen eine Frist von mehreren Takten, TICK_MAX reicht als Obergrenze
+            delay = TICK_MAX if nxt is None else min(max(nxt - self.clock(), 0.0), TICK_MAX)
+            stop_event.wait(delay)
+
+    # -- Abfragen -----------------------------------------------------------
+
+    def is_online(self, device: str) -> bool:
+        return device in self._deadline
+
+    def online(self) -> set:
+        with self._lock:
+            return set(self._deadline)
+
+    def __len__(self):
+        return len(self._deadline)
@@ -1,9 +1,13 @@
 import logging
-import yaml
+import threading
 import time
 import os
 from pathlib import Path
 
+from presence import PresenceTracker, ONLINE
+from registry_store import RegistryStore
+from tracing import span, traced
+
 logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
@@ -11,55 +15,141 @@ logger = logging.getLogger(__name__)
 # ---------------------------------------------------------------------------
 
 class registry():
-    def __init__(self, cfg):
+    def __init__(self, cfg, presence: PresenceTracker = None):
         self.cfg = cfg  
         self.regfile = Path(os.path.join(self.cfg['REGPath'], "regfile.yml"))
-        print(f"Registry file path: {self.regfile}") 
+        self.store = RegistryStore(self.regfile)
+        self._lock = threading.Lock()     # Discovery-Ereignisse kommen aus dem zeroconf-Thread
+        # offline erst nach mehreren verpassten Takten, nicht schon beim ersten fehlenden Scan
+        self.presence = presence if presence is not None else PresenceTracker.from_cfg(cfg)
+        for device_id, dev in self.store.devices.items():
+            if dev.get("present"):
+                self.presence.restore(device_id, dev.get("last_seen", 0))
+        self.presence.subscribe(self._on_presence)
+        logger.debug(f"Registry file path: {self.regfile}")
+
     def update_registry(self, devs, service) -> dict:
-        previous = self.load_registry()
-        current = devs
-        updated = previous.copy()
-        
-        for dev in updated.values():
-            dev["present"] = False
+        now = int(time.time())
+        with span("registry.update", devices=len(devs)):
+            with self._lock:
+                current = self._update_registry(devs, now)
+            # Heartbeats und Ablauf außerhalb der Sperre, _on_presence braucht sie
+            with span("presence.tick"):
+                self.presence.seen_many(devs, now)
+                self.presence.tick()
+        return current
+
+    def _update_registry(self, devs, now: int) -> dict:
+        current = self.store.devices
+        changes = {}
 
-        #updated = {}
-        for device_id, data in current.items():
-            if device_id not in updated:
-                updated[device_id] = {}
-                updated[device_id]["data"] = data
-                updated[device_id]['model'] = data[1]   
+        # nicht gefundene Geräte bleiben stehen; offline setzt der PresenceTracker
+        for device_id, data in devs.items():
+            dev = current.get(device_id)
+            if dev is None:
+                dev = {}
                 logger.debug("New device discovered: %s", device_id)
+            dev = dict(dev)
+            dev["data"] = list(data)
+            dev["model"] = data[1]
+            dev["present"] = True
+            dev["last_seen"] = now
+            changes[device_id] = dev
+
+        written = self.store.update(changes)
+        logger.debug("Registry update: %d devices, %d written", len(current), written)
+        return current
+    
+    def apply_discovery(self, event) -> None:
+        """Abonnent für discovery.DiscoveryService: ein Gerät sofort nachführen."""
+        self.apply_discoveries([event])
+
+    @traced("registry.apply_discoveries")
+    def apply_discoveries(self, events) -> int:
+        """
+        Mehrere Discovery-Ereignisse in einem Schreibvorgang übernehmen, z.B.
+        als Handler eines runtime.Channel. Spätere Ereignisse pro Gerät gewinnen.
+        """
+        now = int(time.time())
+        with self._lock:
+            changes = {}
+            for event in events:
+                dev = changes.get(event.host)
+                if dev is None:
+                    dev = dict(self.store.devices.get(event.host, {}))
+                if event.kind == "remove":
+                    if not dev.get("present"):
+                        continue
+                    dev["present"] = False
+                else:
+                    if not dev:
+                        logger.debug("New device discovered: %s", event.host)
+                    dev["data"] = [event.ip, event.name]
+                    dev["model"] = event.name
+                    dev["present"] = True
+                    dev["last_seen"] = now
+                changes[event.host] = dev
+            written = self.store.update(changes) if changes else 0
+        for event in events:
+            if event.kind == "remove":
+                self.presence.drop(event.host)
             else:
-                updated[device_id].update(data)
+                self.presence.seen(event.host, now)
+        return written
 
-            updated[device_id]['present'] = True
-            updated[device_id]["last_seen"] = int(time.time())
+    def _on_presence(self, event) -> None:
+        """Übergang aus dem PresenceTracker in die Registry übernehmen."""
+        online = event.kind == ONLINE
+        with self._lock:
+            dev = self.store.devices.get(event.device)
+            if dev is None or bool(dev.get("present")) == online:
+                return
+            self.store.update({event.device: dict(dev, present=online)})
 
-        self.save_registry(updated)
-        return updated
-    
-    def load_registry(self) -> dict:
-        if self.regfile.exists():
-            try:
-                with self.regfile.open("r", encoding="utf-8") as f:
-                    data = yaml.safe_load(f)
-                    return data if isinstance(data, dict) else {}
-            except Exception as exc:
-                logger.error("Failed to load registry: %s", exc)
-                return {}
-        return {}
+    @traced("registry.mark_presence")
+    def mark_presence(self, presence: dict, source: str = None) -> int:
+        """
+        {device_id: online} aus Telemetrie (z.B. MQTT) in einem Schreibvorgang
+        übernehmen. Unbekannte Geräte werden angelegt.
+        """
+        now = int(time.time())
+        with self._lock:
+            changes = {}
+            for device_id, online in presence.items():
+                dev = self.store.devices.get(device_id)
+                if dev is None:
+                    logger.debug("New device from %s: %s", source, device_id)
+                    dev = {"model": device_id, "source": source}
+                dev = dict(dev, present=bool(online))
+                if online:
+                    dev["last_seen"] = now
+                changes[device_id] = dev
+            written = self.store.update(changes)
+        for device_id, online in presence.items():
+            if online:
+                self.presence.seen(device_id, now)
+            else:
+                self.presence.drop(device_id)
+        return written
 
+    def load_registry(self) -> dict:
+        return self.store.load()
 
     def save_registry(self, registry: dict) -> None:
+        """Übernimmt einen kompletten Stand; geschrieben werden nur die Unterschiede."""
         try:
-            with self.regfile.open("w", encoding="utf-8") as f:
-                yaml.safe_dump(
-                    registry,
-                    f,
-                    sort_keys=True,
-                    default_flow_style=False,
-                    allow_unicode=True 
-                )
+            with span("registry.save", devices=len(registry)), self._lock:
+                for device_id in set(self.store.devices) - set(registry):
+                    self.store.delete(device_id)
+                    self.presence.drop(device_id)
+                self.store.update({k: dict(v) for k, v in registry.items()})
         except Exception as exc:
-            logger.error("Failed to save registry: %s", exc, device_id)
+            logger.error("Failed to save registry: %s", exc)
+
+    def export_yaml(self, path: Path = None) -> Path:
+        """YAML-Snapshot der Registry auf Anforderung."""
+        return self.store.export_yaml(path)
+
+    def close(self) -> None:
+        with self._lock:
+            self.store.close()
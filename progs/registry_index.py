@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registry mit Sekundärindizes.
+
+Statt bei jeder Abfrage über alle Geräte zu laufen, hält RegistryIndex zu
+jedem Gerät (DeviceRecord) Indizes auf MAC, IP, Modell, Kategorie,
+Fähigkeiten und Anwesenheit. Jede Änderung läuft über put/update/remove/
+set_present und zieht die Indizes sofort nach.
+
+    reg = RegistryIndex()
+    reg.put("c8f09e8a1b2c", ip="192.168.2.47", model="SNPL-00112EU",
+            category="PowerSwitch", capabilities=["switch", "meter"], present=True)
+    reg.by_ip("192.168.2.47")                               # O(1)
+    reg.find(model="SNPL-00112EU", present=False)           # alle Plugs offline, O(k)
+
+Nach außen verhält sich RegistryIndex wie ein Dict {device_id: DeviceRecord}
+(len, in, get, values, items); as_dict() liefert das alte Dict-Format.
+"""
+
+import time
+
+# ---------------------------------------------------------------------------
+# Datensatz
+# ---------------------------------------------------------------------------
+
+# indizierte Felder; alles andere landet in DeviceRecord.extra
+FIELDS = ("name", "mac", "ip", "model", "category", "capabilities", "present", "last_seen", "fw")
+
+
+def normalize_mac(mac) -> str | None:
+    """"C8:F0:9E:8A:1B:2C" und "c8f09e8a1b2c" ergeben denselben Schlüssel."""
+    if not mac:
+        return None
+    return str(mac).replace(":", "").replace("-", "").lower()
+
+
+class DeviceRecord:
+    __slots__ = ("id",) + FIELDS + ("extra",)
+
+    def __init__(self, device_id: str, name=None, mac=None, ip=None, model=None, category=None,
+                 capabilities=(), present=False, last_seen=0, fw=None, extra=None):
+        self.id = device_id
+        self.name = name
+        self.mac = normalize_mac(mac)
+        self.ip = ip
+        self.model = model
+        self.category = category
+        self.capabilities = tuple(capabilities or ())
+        self.present = bool(present)
+        self.last_seen = last_seen or 0
+        self.fw = fw
+        self.extra = extra or {}
+
+    @classmethod
+    def from_dict(cls, device_id: str, dev: dict) -> "DeviceRecord":
+        known = {k: dev[k] for k in FIELDS if k in dev}
+        extra = {k: v for k, v in dev.items() if k not in FIELDS}
+        return cls(device_id, extra=extra, **known)
+
+    def as_dict(self) -> dict:
+        dev = dict(self.extra)
+        for key in FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                dev[key] = list(value) if key == "capabilities" else value
+        return dev
+
+    def get(self, key: str, default=None):
+        """Dict-artiger Zugriff für Code, der noch mit dev.get(...) arbeitet."""
+        if key in FIELDS:
+            value = getattr(self, key)
+            if key == "capabilities":
+                return list(value)
+            return default if value is None else value
+        return self.extra.get(key, default)
+
+    def __repr__(self):
+        state = "online" if self.present else "offline"
+        return f"DeviceRecord({self.id}, {self.ip}, {self.model}, {state})"
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+class RegistryIndex:
+    def __init__(self, devices: dict = None):
+        self.records = {}         # device_id -> DeviceRecord
+        self._by_mac = {}         # mac -> device_id
+        self._by_ip = {}          # ip -> device_id
+        self._by_model = {}       # model -> {device_id}
+        self._by_category = {}    # category -> {device_id}
+        self._by_cap = {}         # capability -> {device_id}
+        self._online = set()
+        self._offline = set()
+        for device_id, dev in (devices or {}).items():
+            self.put(device_id, **dev)
+
+    # -- Indexpflege --------------------------------------------------------
+
+    @staticmethod
+    def _add(index: dict, key, device_id: str) -> None:
+        if key is not None:
+            index.setdefault(key, set()).add(device_id)
+
+    @staticmethod
+    def _discard(index: dict, key, device_id: str) -> None:
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(device_id)
+            if not ids:
+                del index[key]
+
+    def _index(self, rec: DeviceRecord) -> None:
+        if rec.mac:
+            self._by_mac[rec.mac] = rec.id
+        if rec.ip:
+            # neue DHCP-Adresse: das Gerät, das sie zuletzt meldet, gewinnt
+            self._by_ip[rec.ip] = rec.id
+        self._add(self._by_model, rec.model, rec.id)
+        self._add(self._by_category, rec.category, rec.id)
+        for cap in rec.capabilities:
+            self._add(self._by_cap, cap, rec.id)
+        (self._online if rec.present else self._offline).add(rec.id)
+
+    def _unindex(self, rec: DeviceRecord) -> None:
+        if rec.mac and self._by_mac.get(rec.mac) == rec.id:
+            del self._by_mac[rec.mac]
+        if rec.ip and self._by_ip.get(rec.ip) == rec.id:
+            del self._by_ip[rec.ip]
+        self._discard(self._by_model, rec.model, rec.id)
+        self._discard(self._by_category, rec.category, rec.id)
+        for cap in rec.capabilities:
+            self._discard(self._by_cap, cap, rec.id)
+        self._online.discard(rec.id)
+        self._offline.discard(rec.id)
+
+    # -- Änderungen ---------------------------------------------------------
+
+    def put(self, device_id: str, **fields) -> DeviceRecord:
+        """Gerät anlegen oder komplett ersetzen."""
+        old = self.records.get(device_id)
+        if old is not None:
+            self._unindex(old)
+        rec = self.records[device_id] = DeviceRecord.from_dict(device_id, fields)
+        self._index(rec)
+        return rec
+
+    def update(self, device_id: str, **fields) -> DeviceRecord:
+        """Einzelne Felder ändern; unbekannte Geräte werden angelegt."""
+        rec = self.records.get(device_id)
+        if rec is None:
+            return self.put(device_id, **fields)
+        self._unindex(rec)
+        for key, value in fields.items():
+            if key == "mac":
+                value = normalize_mac(value)
+            elif key == "capabilities":
+                value = tuple(value or ())
+            elif key == "present":
+                value = bool(value)
+            if key in FIELDS:
+                setattr(rec, key, value)
+            else:
+                rec.extra[key] = value
+        self._index(rec)
+        return rec
+
+    def set_present(self, device_id: str, present: bool, last_seen: float = None) -> bool:
+        """Nur Anwesenheit ändern (häufigster Fall, berührt nur zwei Sets). True bei Wechsel."""
+        rec = self.records[device_id]
+        if last_seen is not None:
+            rec.last_seen = last_seen
+        present = bool(present)
+        if rec.present == present:
+            return False
+        rec.present = present
+        (self._offline if present else self._online).discard(device_id)
+        (self._online if present else self._offline).add(device_id)
+        return True
+
+    def remove(self, device_id: str) -> DeviceRecord | None:
+        rec = self.records.pop(device_id, None)
+        if rec is not None:
+            self._unindex(rec)
+        return rec
+
+    def mark_offline(self, max_age: float, now: float = None) -> list:
+        """Online-Geräte ohne Meldung seit max_age Sekunden auf offline; läuft nur über die Online-Menge."""
+        now = time.time() if now is None else now
+        limit = now - max_age
+        records = self.records
+        stale = [i for i in self._online if records[i].last_seen < limit]
+        for device_id in stale:
+            self.set_present(device_id, False)
+        return stale
+
+    # -- Abfragen -----------------------------------------------------------
+
+    def by_mac(self, mac) -> DeviceRecord | None:
+        device_id = self._by_mac.get(normalize_mac(mac))
+        return self.records.get(device_id) if device_id is not None else None
+
+    def by_ip(self, ip: str) -> DeviceRecord | None:
+        device_id = self._by_ip.get(ip)
+        return self.records.get(device_id) if device_id is not None else None
+
+    def online(self) -> list:
+        return [self.records[i] for i in self._online]
+
+    def offline(self) -> list:
+        return [self.records[i] for i in self._offline]
+
+    def count(self, **criteria) -> int:
+        return len(self._select(**criteria))
+
+    def find(self, model=None, category=None, capability=None, present=None) -> list:
+        """
+        Alle Geräte, die jedes angegebene Kriterium erfüllen. Geschnitten wird
+        von der kleinsten Menge aus, der Aufwand hängt also an der Trefferzahl.
+        """
+        return [self.records[i] for i in self._select(model, category, capability, present)]
+
+    def _select(self, model=None, category=None, capability=None, present=None) -> set:
+        sets = []
+        if model is not None:
+            sets.append(self._by_model.get(model, ()))
+        if category is not None:
+            sets.append(self._by_category.get(category, ()))
+        if capability is not None:
+            sets.append(self._by_cap.get(capability, ()))
+        if present is not None:
+            sets.append(self._online if present else self._offline)
+        if not sets:
+            return set(self.records)
+        sets.sort(key=len)
+        if not sets[0]:
+            return set()
+        # set.intersection läuft über die kleinste Menge
+        return set(sets[0]).intersection(*sets[1:])
+
+    def models(self) -> dict:
+        """{model: Anzahl}"""
+        return {model: len(ids) for model, ids in self._by_model.items()}
+
+    # -- Dict-Verhalten -----------------------------------------------------
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __contains__(self, device_id):
+        return device_id in self.records
+
+    def __getitem__(self, device_id) -> DeviceRecord:
+        return self.records[device_id]
+
+    def get(self, device_id, default=None):
+        return self.records.get(device_id, default)
+
+    def values(self):
+        return self.records.values()
+
+    def items(self):
+        return self.records.items()
+
+    def as_dict(self) -> dict:
+        return {device_id: rec.as_dict() for device_id, rec in self.records.items()}
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registry-Speicher: Index im Speicher + Änderungsprotokoll (append-only).
+
+Dateien (neben regfile.yml im REGPath):
+    regfile.json   letzter kompaktierter Stand (atomar per os.replace geschrieben)
+    regfile.log    eine JSON-Zeile pro Änderung seit dem letzten Snapshot
+
+Pro Änderung wird nur das betroffene Gerät angehängt. Nach COMPACT_EVERY
+Einträgen wird ein neuer Snapshot geschrieben und das Protokoll geleert.
+Eine abgebrochene letzte Zeile (Absturz beim Schreiben) wird beim Laden
+verworfen. YAML gibt es nur noch auf Anforderung über export_yaml().
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from metrics import REGISTRY_DEVICES, REGISTRY_WRITE_SECONDS
+from tracing import span, traced
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+COMPACT_EVERY = 2000      # Protokolleinträge bis zur nächsten Kompaktierung
+VOLATILE_KEYS = ("last_seen",)   # ändern sich bei jedem Lauf, lösen allein keinen Eintrag aus
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class RegistryStore:
+    def __init__(self, regfile: Path, compact_every: int = COMPACT_EVERY):
+        self.regfile = Path(regfile)
+        self.snapfile = self.regfile.with_suffix(".json")
+        self.logfile = self.regfile.with_suffix(".log")
+        self.compact_every = compact_every
+        self.devices: dict = {}
+        self._log_entries = 0
+        self._volatile_dirty = False
+        self._log = None
+        self._size = REGISTRY_DEVICES.labels(self.regfile.stem)
+        self._write_seconds = REGISTRY_WRITE_SECONDS.labels(self.regfile.stem)
+        self.load()
+
+    # -- Laden --------------------------------------------------------------
+
+    def load(self) -> dict:
+        self.devices = {}
+        self._log_entries = 0
+        if self.snapfile.exists():
+            try:
+                with self.snapfile.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.devices = data if isinstance(data, dict) else {}
+            except (OSError, ValueError) as exc:
+                logger.error("Failed to load registry snapshot %s: %s", self.snapfile, exc)
+        elif self.regfile.exists():
+            # einmalige Übernahme der alten YAML-Registry
+            try:
+                import yaml
+                with self.regfile.open("r", encoding="utf-8") as f:
+                    data = yaml.safe_load(f)
+                self.devices = data if isinstance(data, dict) else {}
+                logger.info("Imported %d devices from %s", len(self.devices), self.regfile)
+            except Exception as exc:
+                logger.error("Failed to load registry: %s", exc)
+
+        truncated = False
+        if self.logfile.exists():
+            with self.logfile.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        truncated = True
+                        break
+                    self._apply(entry)
+                    self._log_entries += 1
+        if truncated:
+            # sonst landen neue Einträge hinter der kaputten Zeile
+            logger.warning("Skipping truncated registry log entry, compacting")
+            self.compact()
+        self._size.set(len(self.devices))
+        return self.devices
+
+    def _apply(self, entry: dict) -> None:
+        if entry.get("op") == "put":
+            self.devices[entry["id"]] = entry["dev"]
+        elif entry.get("op") == "del":
+            self.devices.pop(entry["id"], None)
+
+    # -- Schreiben ----------------------------------------------------------
+
+    def _append(self, entries: list) -> None:
+        if not entries:
+            return
+        start = time.perf_counter()
+        with span("registry.write", entries=len(entries)):
+            if self._log is None:
+                self._log = self.logfile.open("a", encoding="utf-8")
+            self._log.write("".join(json.dumps(e, separators=(",", ":")) + "\n" for e in entries))
+            self._log.flush()
+            os.fsync(self._log.fileno())
+        self._write_seconds.observe(time.perf_counter() - start)
+        self._log_entries += len(entries)
+        if self._log_entries >= self.compact_every:
+            self.compact()
+
+    @staticmethod
+    def _differs(old: dict, new: dict) -> bool:
+        if old is None:
+            return True
+        keys = (old.keys() | new.keys()).difference(VOLATILE_KEYS)
+        return any(old.get(k) != new.get(k) for k in keys)
+
+    def update(self, changes: dict) -> int:
+        """
+        Übernimmt {device_id: record}. Nur Geräte, die sich außerhalb der
+        VOLATILE_KEYS geändert haben, landen im Protokoll. Liefert deren Anzahl.
+        Records werden verglichen, also neue Dicts übergeben statt die
+        gespeicherten in-place zu ändern.
+        """
+        entries = []
+        for device_id, dev in changes.items():
+            old = self.devices.get(device_id)
+            if self._differs(old, dev):
+                entries.append({"op": "put", "id": device_id, "dev": dev})
+            elif any(old.get(k) != dev.get(k) for k in VOLATILE_KEYS):
+                self._volatile_dirty = True
+            self.devices[device_id] = dev
+        self._append(entries)
+        self._size.set(len(self.devices))
+        return len(entries)
+
+    def delete(self, device_id: str) -> None:
+        if self.devices.pop(device_id, None) is not None:
+            self._append([{"op": "del", "id": device_id}])
+            self._size.set(len(self.devices))
+
+    @traced("registry.compact")
+    def compact(self) -> None:
+        """Schreibt den kompletten Stand als Snapshot und leert das Protokoll."""
+        _atomic_write(self.snapfile, json.dumps(self.devices, separators=(",", ":"), sort_keys=True))
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        self.logfile.open("w").close()
+        self._log_entries = 0
+        self._volatile_dirty = False
+        logger.debug("Registry compacted: %d devices", len(self.devices))
+
+    def close(self) -> None:
+        if self._log_entries or self._volatile_dirty:
+            self.compact()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    # -- Export -------------------------------------------------------------
+
+    def export_yaml(self, path: Path = None) -> Path:
+        """YAML-Snapshot auf Anforderung (Default: regfile.yml)."""
+        import yaml
+        path = Path(path) if path else self.regfile
+        _atomic_write(path, yaml.safe_dump(self.devices, sort_keys=True,
+                                           default_flow_style=False, allow_unicode=True))
+        return path
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ein langlebiger asyncio-Loop für den ganzen Prozess.
+
+Der Loop läuft in einem eigenen Thread und bleibt bis zum Prozessende
+bestehen; statt asyncio.run() pro Aufruf (jedes Mal ein neuer Loop, neue
+HTTP-Clients, neue Verbindungen) gehen alle Coroutinen an ihn:
+
+    rt = get_runtime()
+    devices = rt.run(scanner.identify_changed(ips))     # aus synchronem Code
+    future = rt.submit(scheduler.run(stop))            # nicht blockierend
+
+Blockierende Arbeit aus Coroutinen geht an den Executor des Loops
+(await rt.to_thread(fn, ...)), niemals direkt in den Loop.
+
+Threads, die Ereignisse liefern (zeroconf-Listener, ThreadManager-Threads),
+reichen sie über einen Channel weiter. put() ist threadsicher und kostet
+nur ein Anhängen an eine Liste; der Loop wird einmal pro Batch geweckt,
+nicht pro Ereignis:
+
+    channel = rt.channel(reg.apply_discoveries)
+    get_discovery_service().subscribe(channel.put)
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from threadtools import Counters
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+EXECUTOR_WORKERS = 8      # Threads für blockierende Arbeit aus dem Loop
+BATCH_MAX = 500           # Ereignisse pro Handler-Aufruf höchstens
+BATCH_DELAY = 0.05        # so lange sammelt ein Channel nach dem ersten Ereignis
+SHUTDOWN_TIMEOUT = 5.0
+
+# ---------------------------------------------------------------------------
+# Channel: Threads -> Loop
+# ---------------------------------------------------------------------------
+
+class ChannelStats(Counters):
+    __slots__ = ("events", "batches", "batch_max", "errors", "handler_time")
+
+
+class Channel:
+    """
+    Sammelt Ereignisse aus beliebigen Threads und ruft handler(batch) im Loop
+    auf. handler darf eine normale Funktion oder eine Coroutine-Funktion sein;
+    eine normale Funktion läuft im Loop und sollte daher kurz sein.
+    """
+
+    def __init__(self, runtime, handler, batch_max: int = BATCH_MAX,
+                 delay: float = BATCH_DELAY, name: str = None):
+        self.runtime = runtime
+        self.handler = handler
+        self.batch_max = batch_max
+        self.delay = delay
+        self.name = name or getattr(handler, "__qualname__", repr(handler))
+        self.stats = ChannelStats()
+        self._items = []
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def put(self, item) -> None:
+        """Threadsicher; weckt den Loop nur für das erste Ereignis eines Batches."""
+        with self._lock:
+            self._items.append(item)
+            if self._scheduled:
+                return
+            self._scheduled = True
+            self._idle.clear()
+        self.runtime.loop.call_soon_threadsafe(self._schedule)
+
+    def _schedule(self) -> None:
+        if self.delay > 0:
+            self.runtime.loop.call_later(self.delay, self._start)
+        else:
+            self._start()
+
+    def _start(self) -> None:
+        asyncio.ensure_future(self._drain())
+
+    async def _drain(self) -> None:
+        while True:
+            with self._lock:
+                batch = self._items[:self.batch_max]
+                del self._items[:self.batch_max]
+                if not batch:
+                    self._scheduled = False
+                    self._idle.set()
+                    return
+            start = time.perf_counter()
+            try:
+                result = self.handler(batch)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as exc:
+                self.stats.errors += 1
+                logger.error("Channel %s handler failed: %s", self.name, exc)
+            self.stats.events += len(batch)
+            self.stats.batches += 1
+            self.stats.batch_max = max(self.stats.batch_max, len(batch))
+            self.stats.handler_time += time.perf_counter() - start
+
+    def flush(self, timeout: float = None) -> bool:
+        """Aus einem anderen Thread: warten, bis alles Eingereichte verarbeitet ist."""
+        return self._idle.wait(timeout)
+
+# ---------------------------------------------------------------------------
+# Runtime
+# ---------------------------------------------------------------------------
+
+class Runtime:
+    def __init__(self, executor_workers: int = EXECUTOR_WORKERS, name: str = "asyncio"):
+        self.name = name
+        self.executor = ThreadPoolExecutor(executor_workers, thread_name_prefix=f"{name}-exec")
+        self.loop = asyncio.new_event_loop()
+        # asyncio.to_thread und run_in_executor(None, ...) nutzen denselben Pool
+        self.loop.set_default_executor(self.executor)
+        self.channels = []
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # -- Lebenszyklus -------------------------------------------------------
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(ready,),
+                                                name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+                logger.debug("Event loop thread %s started", self.name)
+        return self
+
+    def _run(self, ready: threading.Event) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(ready.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            try:
+                tasks = asyncio.all_tasks(self.loop)
+                for task in tasks:
+                    task.cancel()
+                self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+                self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            finally:
+                self.loop.close()
+
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        """Offene Channels abarbeiten, Tasks abbrechen, Loop und Executor beenden."""
+        thread = self._thread
+        if thread is None:
+            return
+        for channel in self.channels:
+            channel.flush(timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning("Event loop thread %s did not terminate cleanly", self.name)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self._thread = None
+
+    def in_loop(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    # -- Coroutinen aus Threads ---------------------------------------------
+
+    def submit(self, coro):
+        """Coroutine im Loop starten; liefert ein concurrent.futures.Future."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float = None):
+        """
+        Ersatz für asyncio.run(): Coroutine im gemeinsamen Loop ausführen und
+        auf das Ergebnis warten. Nicht aus dem Loop selbst aufrufen.
+        """
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError("Runtime.run() called from the event loop, use await instead")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def call_soon(self, fn, *args) -> None:
+        """Funktion threadsicher im Loop ausführen (ohne Ergebnis)."""
+        self.start()
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    # -- Blockierendes aus Coroutinen ---------------------------------------
+
+    async def to_thread(self, fn, *args, **kwargs):
+        """
+        Blockierende Funktion im Executor ausführen. Wie asyncio.to_thread mit
+        dem Kontext des Aufrufers (contextvars), sonst verlieren z.B. Spans
+        ihren Eltern-Span.
+        """
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    # -- Ereignisse aus Threads ---------------------------------------------
+
+    def channel(self, handler, batch_max: int = BATCH_MAX, delay: float = BATCH_DELAY,
+                name: str = None) -> Channel:
+        self.start()
+        channel = Channel(self, handler, batch_max, delay, name)
+        self.channels.append(channel)
+        return channel
+
+    def stats(self) -> dict:
+        return {channel.name: channel.stats.as_dict() for channel in self.channels}
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> Runtime:
+    """Prozessweit gemeinsame Runtime, der Loop-Thread startet beim ersten Aufruf."""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = Runtime().start()
+    return _runtime
+
+
+def run(coro, timeout: float = None):
+    """Kurzform für get_runtime().run(coro)."""
+    return get_runtime().run(coro, timeout)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Polling-Scheduler: jedes Gerät in seinem eigenen Takt.
+
+- Zeitplan als Heap (fällig, seq, name, token), ein Dispatcher schläft bis zum nächsten Termin
+- feste Anzahl asynchroner Worker, zusätzlich globales Limit gleichzeitiger Polls
+- Jitter, damit Geräte mit gleichem Takt nicht gleichzeitig abgefragt werden
+- pro Gerät Retry-Budget (Retry/retry aus der YAML), danach exponentieller Backoff
+- Scheduling-Lag (Start - geplanter Termin) pro Gerät und gesamt
+
+Takte kommen aus yml/devs.yml (Cycle/Retry) und yml/shelly_devs.yml (time/retry).
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+
+import drivers
+from discovery import get_discovery_service, running_discovery_service
+from html_parser import fetch_ESP
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+WORKERS = 16              # asynchrone Worker
+MAX_CONCURRENT = 32       # max. gleichzeitige Polls insgesamt
+JITTER = 0.1              # +- Anteil des Takts
+RETRY_DELAY = 1.0         # Sekunden bis zur Wiederholung innerhalb des Retry-Budgets
+MAX_BACKOFF = 600.0       # Obergrenze für den Backoff unerreichbarer Geräte
+LAG_WARN = 2.0            # Sekunden Lag, ab denen der Poller als "hinterher" zählt
+DEFAULT_RETRY = 3
+
+# ---------------------------------------------------------------------------
+# Job
+# ---------------------------------------------------------------------------
+
+class PollJob:
+    __slots__ = ("name", "cycle", "retry", "poll", "failures", "backoff",
+                 "last_lag", "max_lag", "polls", "errors", "last_result", "token")
+
+    def __init__(self, name: str, cycle: float, retry: int, poll):
+        """poll: async callable(job) -> Ergebnis; eine Exception zählt als Fehlversuch."""
+        self.name = name
+        self.cycle = float(cycle)
+        self.retry = int(retry)
+        self.poll = poll
+        self.failures = 0         # Fehlversuche in Folge
+        self.backoff = 0          # Backoff-Stufe, nachdem das Retry-Budget aufgebraucht ist
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.polls = 0
+        self.errors = 0
+        self.last_result = None
+        self.token = None         # vom Scheduler bei add() vergeben, gilt für seine Heap-Einträge
+
+    def next_delay(self, ok: bool) -> float:
+        if ok:
+            self.failures = 0
+            self.backoff = 0
+            return self.cycle * (1 + random.uniform(-JITTER, JITTER))
+        self.failures += 1
+        if self.failures <= self.retry:
+            return RETRY_DELAY * self.failures
+        self.backoff += 1
+        return min(self.cycle * 2 ** self.backoff, MAX_BACKOFF)
+
+# ---------------------------------------------------------------------------
+# Scheduler
+# ---------------------------------------------------------------------------
+
+class PollScheduler:
+    def __init__(self, workers: int = WORKERS, max_concurrent: int = MAX_CONCURRENT):
+        self.workers = workers
+        self.max_concurrent = max_concurrent
+        self.jobs = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._queue = None
+        self.lag_count = 0
+        self.lag_sum = 0.0
+        self.lag_max = 0.0
+        self.lag_late = 0
+
+    def add(self, job: PollJob) -> None:
+        """Neuer Job; ein vorhandener Job gleichen Namens wird ersetzt."""
+        # neues Token: Heap-Einträge eines früheren add() desselben Namens verfallen
+        job.token = next(self._seq)
+        self.jobs[job.name] = job
+        # erster Termin zufällig innerhalb des Takts -> kein Burst beim Start
+        self._push(time.monotonic() + random.uniform(0, job.cycle), job)
+
+    def remove(self, name: str) -> None:
+        # die Heap-Einträge verfallen beim Herausnehmen (Token passt nicht mehr)
+        self.jobs.pop(name, None)
+
+    def _current(self, name: str, token: int):
+        """Der Job, wenn der Eintrag noch zum aktuellen add() gehört, sonst None."""
+        job = self.jobs.get(name)
+        return job if job is not None and job.token == token else None
+
+    def _push(self, due: float, job: PollJob) -> None:
+        heapq.heappush(self._heap, (due, next(self._seq), job.name, job.token))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _dispatch(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, name, token = heapq.heappop(self._heap)
+                if self._current(name, token) is not None:
+                    self._queue.put_nowait((due, name, token))
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self, sem: asyncio.Semaphore) -> None:
+        while True:
+            due, name, token = await self._queue.get()
+            job = self._current(name, token)
+            if job is None:
+                continue
+            async with sem:
+                start = time.monotonic()
+                self._record_lag(job, start - due)
+                try:
+                    job.last_result = await job.poll(job)
+                    ok = True
+                except Exception as exc:
+                    logger.debug("Poll %s failed (%d): %s", name, job.failures + 1, exc)
+                    job.errors += 1
+                    ok = False
+                job.polls += 1
+            delay = job.next_delay(ok)
+            if self._current(name, token) is not None:
+                self._push(start + delay, job)
+
+    def _record_lag(self, job: PollJob, lag: float) -> None:
+        job.last_lag = lag
+        job.max_lag = max(job.max_lag, lag)
+        self.lag_count += 1
+        self.lag_sum += lag
+        self.lag_max = max(self.lag_max, lag)
+        if lag > LAG_WARN:
+            self.lag_late += 1
+            logger.warning("Poller behind schedule: %s started %.1fs late", job.name, lag)
+
+    async def run(self, stop: asyncio.Event = None) -> None:
+        """Läuft bis stop gesetzt wird (oder für immer)."""
+        self._wakeup = asyncio.Event()
+        self._queue = asyncio.Queue()
+        sem = asyncio.Semaphore(self.max_concurrent)
+        tasks = [asyncio.create_task(self._dispatch())]
+        tasks += [asyncio.create_task(self._worker(sem)) for _ in range(self.workers)]
+        try:
+            if stop is None:
+                await asyncio.gather(*tasks)
+            else:
+                await stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._wakeup = None
+
+    def stats(self) -> dict:
+        return {
+            "jobs": len(self.jobs),
+            "polls": sum(j.polls for j in self.jobs.values()),
+            "errors": sum(j.errors for j in self.jobs.values()),
+            "lag_avg": self.lag_sum / self.lag_count if self.lag_count else 0.0,
+            "lag_max": self.lag_max,
+            "late": self.lag_late,
+            "backing_off": [j.name for j in self.jobs.values() if j.backoff],
+        }
+
+# ---------------------------------------------------------------------------
+# Jobs aus den YAML-Dateien
+# ---------------------------------------------------------------------------
+
+def load_poll_config(cfg) -> dict:
+    """
+    {device: (cycle, retry)} aus devs.yml (Cycle/Retry) und shelly_devs.yml
+    (time/retry). Einträge ohne Takt (z.B. Modell-Prototypen) werden übersprungen.
+    Schlüssel ist der Name in Kleinbuchstaben (wie der mDNS-Hostname); steht
+    ein Gerät in beiden Dateien, gilt shelly_devs.yml, innerhalb einer Datei
+    der erste Eintrag.
+    """
+    import yaml
+    result = {}
+    for filename, cycle_key, retry_key in (("shelly_devs.yml", "time", "retry"),
+                                           ("devs.yml", "Cycle", "Retry")):
+        path = os.path.join(cfg['YMLPath'], filename)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = yaml.safe_load(f) or {}
+        except OSError as exc:
+            logger.warning("Could not read %s: %s", path, exc)
+            continue
+        for name, entry in data.items():
+            key = str(name).lower()
+            if isinstance(entry, dict) and cycle_key in entry and key not in result:
+                result[key] = (float(entry[cycle_key]), int(entry.get(retry_key, DEFAULT_RETRY)))
+    return result
+
+
+_states = {}              # job name -> drivers.DeviceState
+
+
+async def poll_device(job: PollJob):
+    """Standard-Poll: Shellys über drivers.aread (Status, Cache per cfg_rev), sonst die ESP-Statusseite."""
+    svc = running_discovery_service()
+    if svc is None:
+        # erster Start wartet den ersten mDNS-Durchlauf ab (time.sleep), nicht im Loop
+        svc = await asyncio.to_thread(get_discovery_service)
+    entry = svc.lookup(job.name) or svc.lookup(job.name.lower())
+    if entry is None:
+        raise LookupError(f"{job.name} not (yet) discovered")
+    ip = entry[0]
+    if "shelly" in job.name.lower():
+        state = _states.get(job.name)
+        if state is None or state.ip != ip:
+            state = _states[job.name] = drivers.DeviceState(ip)
+        return await drivers.aread(state)
+    return await fetch_ESP(ip)
+
+
+def build_scheduler(cfg, poll=poll_device, **kwargs) -> PollScheduler:
+    """Ein Job pro konfiguriertem Gerät; poll ist für alle Geräte dieselbe Coroutine-Funktion."""
+    scheduler = PollScheduler(**kwargs)
+    for name, (cycle, retry) in load_poll_config(cfg).items():
+        scheduler.add(PollJob(name, cycle, retry, poll))
+    logger.info("Poll scheduler: %d devices", len(scheduler.jobs))
+    return scheduler
@@ -0,0 +1,52 @@
+from typing import Dict, Any
+
+import drivers
+from transport import get_transport
+
+
+class ShellyRPCDevice:
+    """
+    Blockierender Treiber für ein einzelnes Gen2-Gerät. Die Modell-Details
+    stehen im ModelSpec (drivers.MODELS); Unterklassen setzen nur MODEL.
+
+    Mit fast=True (Standard) holt jeder Poll nur Shelly.GetStatus. Device-Info
+    und Config werden gecacht und nur neu gelesen, wenn sich sys.cfg_rev
+    ändert (oder beim ersten Poll). fast=False liest wie früher alles jedes Mal.
+    """
+    MODEL = None
+
+    def __init__(self, ip_address: str, timeout: float = 5.0, store=None, fast: bool = True):
+        self.ip = ip_address
+        self.base_url = f"http://{self.ip}"
+        self.timeout = timeout
+        self.store = store          # optional tsdb.TimeSeriesStore für die Messwerte
+        self.state = drivers.DeviceState(ip_address, self.MODEL, fast)
+
+    @property
+    def stats(self) -> drivers.PollStats:
+        return self.state.stats
+
+    def _get(self, path: str) -> Dict[str, Any]:
+        url = f"{self.base_url}{path}"
+        return get_transport().get_json(url, timeout=self.timeout)
+
+    def get_device_info(self) -> Dict[str, Any]:
+        return self._get("/rpc/Shelly.GetDeviceInfo")
+
+    def get_status(self) -> Dict[str, Any]:
+        return self._get("/rpc/Shelly.GetStatus")
+
+    def get_config(self) -> Dict[str, Any]:
+        return self._get("/rpc/Shelly.GetConfig")
+
+    def _record(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        if self.store is not None:
+            device = (data.get("device_info") or {}).get("id") or self.ip
+            self.store.record_reading(device, data)
+        return data
+
+    def read_all(self) -> Dict[str, Any]:
+        """
+        Liest alle verfügbaren Daten und fasst sie in einem Dictionary zusammen.
+        """
+        return self._record(drivers.read(self.state, self.timeout))
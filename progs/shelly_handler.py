@@ -1,10 +1,13 @@
 import logging
-import requests
 import json
 import time
 from datetime import datetime
 from pprint import pprint
 
+from host_guard import DEAD, get_host_guard
+from tracing import span, traced
+from transport import get_transport
+
 
 from datetime import datetime 
 
@@ -20,20 +23,62 @@ DISCOVERY_TIME = 5.0      # Sekunden für mDNS-Sammlung
 HTTP_TIMEOUT = 2.0       # HTTP-Timeout pro Gerät
 
 # ---------------------------------------------------------------------------
-# Fähigkeits-Erkennung (klassisch: was antwortet, ist da)
+# Fähigkeits-Erkennung (aus den Komponenten-Schlüsseln von Shelly.GetStatus)
 # ---------------------------------------------------------------------------
 
+# Komponententyp ("switch" aus "switch:0") -> Fähigkeit
+COMPONENT_CAPS = {
+    "switch": "relay",
+    "cover": "cover",
+    "em": "em",
+    "pm1": "power_meter",
+    "input": "input",
+    "light": "light",
+}
+
+# (device_id, firmware_id) -> Fähigkeiten; unveränderte Geräte werden nicht erneut geprüft
+_caps_cache: dict[tuple, tuple] = {}
+
+
+def caps_from_components(components: dict) -> list[str]:
+    caps = set()
+    for key, status in components.items():
+        cap = COMPONENT_CAPS.get(key.split(":", 1)[0])
+        if cap is None:
+            continue
+        caps.add(cap)
+        # Schaltausgänge mit integrierter Leistungsmessung (Plug, xPM)
+        if cap == "relay" and isinstance(status, dict) and "apower" in status:
+            caps.add("power_meter")
+    return sorted(caps) or ["generic"]
+
+
+def is_plug_model(model: str) -> bool:
+    """
+    Zwischenstecker laut ModelSpec (drivers.MODELS, plug=True). Ein relay mit
+    power_meter allein ist auch ein Plus 1PM oder 4PM; unbekannte Modelle
+    gelten daher nicht als Plug.
+    """
+    if not model:
+        return False
+    from drivers import MODELS
+    spec = MODELS.get(model)
+    return spec is not None and spec.plug
+
+
 class ShellyHandler():
     def __init__(self, cfg):
         self.cfg = cfg  
+        # nicht antwortende Geräte nicht bei jeder Methode erneut HTTP_TIMEOUT lang abwarten
+        self.guard = get_host_guard(cfg)
 
+    @traced("shelly.query")
     def query_shelly(self, ip: str):
         try:
             logger.debug("Query Shelly at %s", ip)
             
-            r = requests.get(f"http://{ip}/shelly", timeout=HTTP_TIMEOUT)
-            r.raise_for_status()
-            data = r.json()
+            with span("shelly.info", ip=ip):
+                data = get_transport().get_json(f"http://{ip}/shelly", timeout=HTTP_TIMEOUT)
 
             device_id = data.get("name") or data.get("id")
             if not device_id:
@@ -41,7 +86,7 @@ class ShellyHandler():
                 return None
 
             now = datetime.now().isoformat(timespec="seconds")
-            caps = self.detect_capabilities(ip)
+            caps = self.detect_capabilities(ip, device_id, data.get("fw_id"), mac=data.get("mac"))
             return device_id, {
                 "id": data.get("id"),
                 "name": data.get("name"),
@@ -53,7 +98,7 @@ class ShellyHandler():
                 "firmware": data.get("ver"),
                 "firmware_id": data.get("fw_id"),
                 "capabilities": caps,
-                "category": self.derive_category_from_caps(caps),
+                "category": self.derive_category_from_caps(caps, data.get("model") or data.get("type")),
                 "present": True,
                 "last_seen": now,
             }
@@ -61,54 +106,109 @@ class ShellyHandler():
         except Exception as exc:
             logger.warning("Failed to query Shelly at %s: %s", ip, exc)
             return None
-    def _has_rpc(self, ip: str, method: str) -> bool:
+    def _has_rpc(self, ip: str, method: str, mac: str = None) -> bool:
+        # HostGuard-Schlüssel wie im Scanner: MAC, nur ohne MAC die IP
+        key = mac or ip
+        if not self.guard.allow(key):
+            logger.debug("RPC %s on %s skipped, host not responding", method, ip)
+            return False
         try:
-            r = requests.post(
-                f"http://{ip}/rpc/{method}",
-                json={},
-                timeout=HTTP_TIMEOUT
-            )
+            with span("shelly.rpc", ip=ip, method=method):
+                r = get_transport().post(
+                    f"http://{ip}/rpc/{method}",
+                    json={},
+                    timeout=HTTP_TIMEOUT,
+                    retries=0
+                )
             logger.debug("RPC %s on %s -> %s", method, ip, r.status_code)        
-            return r.status_code == 200
         except Exception as exc:
             logger.debug("RPC %s on %s failed: %s", method, ip, exc)        
+            self._rpc_failed(key, ip, exc)
             return False
+        if r.status_code >= 500:
+            self._dead(key, ip)
+            return False
+        self.guard.success(key)
+        return r.status_code == 200
 
+    def _rpc_failed(self, key: str, ip: str, exc: Exception) -> None:
+        """
+        Keine Antwort oder nur 5xx zählt für den HostGuard als DEAD (wie im
+        Scanner), ein 404 oder kaputtes JSON ist eine Antwort.
+        """
+        import httpx    # schon geladen, der Request lief darüber
+        if isinstance(exc, httpx.TransportError) or (
+                isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code >= 500):
+            self._dead(key, ip)
+        else:
+            self.guard.success(key)
 
-    def detect_capabilities(self, ip: str) -> list[str]:
-        caps = []
-
-        if self._has_rpc(ip, "Switch.GetConfig"):
-            caps.append("relay")
-
-        elif self._has_rpc(ip, "Cover.GetConfig"):
-            caps.append("cover")
+    def _dead(self, key: str, ip: str) -> None:
+        if self.guard.failure(key, DEAD, ip=ip):
+            self.guard.save()
 
-        elif self._has_rpc(ip, "EM.GetConfig"):
-            caps.append("em")
 
-        elif self._has_rpc(ip, "PM1.GetConfig"):
-            caps.append("power_meter")
+    def _rpc_result(self, ip: str, method: str, mac: str = None):
+        key = mac or ip
+        if not self.guard.allow(key):
+            logger.debug("RPC %s on %s skipped, host not responding", method, ip)
+            return None
+        try:
+            with span("shelly.rpc", ip=ip, method=method):
+                # retries=0: Wiederholungen übernimmt der HostGuard, ein toter Host kostet einmal HTTP_TIMEOUT
+                result = get_transport().get_json(f"http://{ip}/rpc/{method}", timeout=HTTP_TIMEOUT, retries=0)
+        except Exception as exc:
+            logger.debug("RPC %s on %s failed: %s", method, ip, exc)
+            self._rpc_failed(key, ip, exc)
+            return None
+        self.guard.success(key)
+        return result
 
-        elif self._has_rpc(ip, "Input.GetConfig"):
-            caps.append("input")
-            
-        else:
-            caps.append("generic")
+    def component_keys(self, ip: str, mac: str = None) -> dict | None:
+        """
+        Alle Komponenten eines Gen2-Geräts in einem Round-Trip:
+        {"switch:0": {...status...}, "input:0": {...}, ...}
+        """
+        status = self._rpc_result(ip, "Shelly.GetStatus", mac)
+        if isinstance(status, dict):
+            return status
+
+        # Fallback: GetComponents liefert eine Liste mit "key"/"status"
+        comps = self._rpc_result(ip, "Shelly.GetComponents", mac)
+        if isinstance(comps, dict):
+            return {c["key"]: c.get("status", {}) for c in comps.get("components", []) if "key" in c}
+        return None
+
+    def detect_capabilities(self, ip: str, device_id: str = None, firmware_id: str = None,
+                            mac: str = None) -> list[str]:
+        key = (device_id, firmware_id)
+        if device_id and firmware_id and key in _caps_cache:
+            logger.debug("Capabilities for %s from cache: %s", ip, _caps_cache[key])
+            return list(_caps_cache[key])
+
+        with span("shelly.capabilities", ip=ip):
+            components = self.component_keys(ip, mac)
+            if components is None:
+                caps = ["generic"]
+            else:
+                caps = caps_from_components(components)
+                if device_id and firmware_id:
+                    _caps_cache[key] = tuple(caps)
         logger.debug("Capabilities for %s: %s", ip, caps)
         return caps
 
 
-    def derive_category_from_caps(self, caps: list[str]) -> str:
+    def derive_category_from_caps(self, caps: list[str], model: str = None) -> str:
         """
         Optionale Komfort-Gruppierung.
-        Kein Fakt, nur Ableitung.
+        Kein Fakt, nur Ableitung. "Plug" nur für Zwischenstecker laut Modell,
+        andere Schaltausgänge mit Leistungsmessung (1PM, 4PM) sind "PowerSwitch".
         """
         if "cover" in caps:
             return "Cover"
         if "em" in caps:
             return "EM"
         if "relay" in caps and "power_meter" in caps:
-            return "Plug"
+            return "Plug" if is_plug_model(model) else "PowerSwitch"
         return "Generic"
 
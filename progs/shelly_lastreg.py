@@ -3,10 +3,12 @@
 
 import time
 import json
-import socket
 import logging
-import requests
-from zeroconf import Zeroconf, ServiceBrowser
+
+from transport import get_transport
+from discovery import get_discovery_service
+from presence import PresenceTracker
+from registry_index import RegistryIndex
 
 logger = logging.getLogger(__name__)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
@@ -24,7 +26,7 @@ def rpc_call(ip, method, params=None, timeout=3):
         payload["params"] = params
 
     url = "http://{}/rpc".format(ip)
-    r = requests.post(url, json=payload, timeout=timeout)
+    r = get_transport().post(url, json=payload, timeout=timeout)
     r.raise_for_status()
 
     data = r.json()
@@ -38,33 +40,28 @@ def rpc_call(ip, method, params=None, timeout=3):
 # Capability detection (entscheidend!)
 # ---------------------------------------------------------------------------
 
-def detect_capabilities(ip, logger):
-    capabilities = []
+# Komponententyp aus Shelly.GetStatus ("switch:0" -> "switch") -> Fähigkeit
+STATUS_CAPS = ("switch", "light", "input", "script")
 
-    probes = {
-        "switch": "Switch.GetStatus",
-        "light":  "Light.GetStatus",
-        "input":  "Input.GetStatus",
-        "script": "Script.List",
-    }
 
-    for cap, method in probes.items():
-        try:
-            rpc_call(ip, method)
-            capabilities.append(cap)
-        except Exception:
-            pass
+def detect_capabilities(ip, logger):
+    """Alle Fähigkeiten aus einem einzigen Shelly.GetStatus."""
+    try:
+        status = rpc_call(ip, "Shelly.GetStatus")
+    except Exception as e:
+        logger.debug("%s: Shelly.GetStatus failed (%s)", ip, e)
+        return []
 
-    # Meter ist historisch Teil von Switch
-    if "switch" in capabilities:
-        try:
-            st = rpc_call(ip, "Switch.GetStatus")
-            if "apower" in st or "aenergy" in st:
-                capabilities.append("meter")
-        except Exception:
-            pass
+    capabilities = set()
+    for key, value in status.items():
+        comp = key.split(":", 1)[0]
+        if comp in STATUS_CAPS:
+            capabilities.add(comp)
+        # Meter ist historisch Teil von Switch
+        if comp == "switch" and isinstance(value, dict) and ("apower" in value or "aenergy" in value):
+            capabilities.add("meter")
 
-    return sorted(set(capabilities))
+    return sorted(capabilities)
 
 
 # ---------------------------------------------------------------------------
@@ -98,37 +95,11 @@ def get_device_identity(ip):
     }
 
 
-# ---------------------------------------------------------------------------
-# Zeroconf listener
-# ---------------------------------------------------------------------------
-
-class ShellyListener:
-    def __init__(self):
-        self.found_ips = set()
-
-    def add_service(self, zeroconf, service_type, name):
-        try:
-            info = zeroconf.get_service_info(service_type, name)
-            if not info or not info.addresses:
-                return
-
-            ip = socket.inet_ntoa(info.addresses[0])
-            self.found_ips.add(ip)
-
-            logger.debug("zeroconf: %s -> %s", name, ip)
-
-        except Exception as e:
-            logger.debug("zeroconf error: %s", e)
-
-    def remove_service(self, zeroconf, service_type, name):
-        pass
-
-
 # ---------------------------------------------------------------------------
 # Registry handling
 # ---------------------------------------------------------------------------
 
-def update_registry(registry, ip, logger):
+def update_registry(registry: RegistryIndex, ip, logger, presence: PresenceTracker = None):
     try:
         ident = get_device_identity(ip)
     except Exception as e:
@@ -140,37 +111,50 @@ def update_registry(registry, ip, logger):
         logger.warning("%s: missing MAC", ip)
         return
 
-    dev = registry.setdefault(mac, {})
-
-    dev["ip"] = ip
-    dev["model"] = ident.get("model", "unknown")
-    dev["name"] = ident.get("name", mac)
-    dev["fw"] = ident.get("fw")
-    dev["present"] = True
-    dev["last_seen"] = time.time()
+    fields = {
+        "mac": mac,
+        "ip": ip,
+        "model": ident.get("model", "unknown"),
+        "name": ident.get("name", mac),
+        "present": True,
+        "last_seen": time.time(),
+        "fw": ident.get("fw"),
+    }
 
-    caps = detect_capabilities(ip, logger)
-    dev["capabilities"] = caps
-    dev["category"] = categorize_device(caps)
+    # gleiche Firmware -> Fähigkeiten aus dem letzten Lauf übernehmen
+    dev = registry.get(mac)
+    if dev is None or dev.fw != ident.get("fw") or not dev.capabilities:
+        caps = detect_capabilities(ip, logger)
+        fields["capabilities"] = caps
+        fields["category"] = categorize_device(caps)
+    dev = registry.update(mac, **fields)
+    if presence is not None:
+        presence.seen(mac, fields["last_seen"])
 
     logger.debug(
         "registered %s (%s) caps=%s",
-        dev["name"], mac, ",".join(caps)
+        dev.name, mac, ",".join(dev.capabilities)
     )
 
 
-def mark_offline_devices(registry, max_age=30):
-    now = time.time()
-    for dev in registry.values():
-        if now - dev.get("last_seen", 0) > max_age:
-            dev["present"] = False
+def mark_offline_devices(registry: RegistryIndex, max_age=30, presence: PresenceTracker = None):
+    """
+    Mit PresenceTracker nur die fälligen Geräte (offline nach mehreren
+    verpassten Takten), sonst alle Online-Geräte älter als max_age.
+    """
+    if presence is None:
+        return registry.mark_offline(max_age)
+    return [ev.device for ev in presence.tick()
+            if ev.device in registry and registry.set_present(ev.device, False)]
 
 
 # ---------------------------------------------------------------------------
 # Output
 # ---------------------------------------------------------------------------
 
-def print_registry(registry):
+def print_registry(registry: RegistryIndex, **criteria):
+    """criteria wie RegistryIndex.find, z.B. print_registry(reg, present=False)."""
+    devices = registry.find(**criteria) if criteria else registry.values()
     print(
         "{:<35} {:<7} {:<18} {:<25} {}".format(
             "Name", "State", "Model", "Capabilities", "Category"
@@ -178,17 +162,17 @@ def print_registry(registry):
     )
     print("-" * 100)
 
-    for dev in registry.values():
-        state = "online" if dev.get("present") else "offline"
-        caps = ",".join(dev.get("capabilities", []))
+    for dev in devices:
+        state = "online" if dev.present else "offline"
+        caps = ",".join(dev.capabilities)
 
         print(
             "{:<35} {:<7} {:<18} {:<25} {}".format(
-                dev.get("name", ""),
+                dev.name or "",
                 state,
-                dev.get("model", ""),
+                dev.model or "",
                 caps,
-                dev.get("category", ""),
+                dev.category or "",
             )
         )
 
@@ -200,14 +184,10 @@ def print_registry(registry):
 # ---------------------------------------------------------------------------
 
 def discover_shellys(timeout=5):
-    zeroconf = Zeroconf()
-    listener = ShellyListener()
-
-    ServiceBrowser(zeroconf, "_http._tcp.local.", listener)
-    time.sleep(timeout)
-    zeroconf.close()
-
-    return listener.found_ips
+    """IPs aus dem laufenden mDNS-Dienst; timeout gilt nur für den ersten Durchlauf."""
+    svc = get_discovery_service()
+    svc.wait_settled(timeout)
+    return svc.ips()
 
 
 # ---------------------------------------------------------------------------
@@ -215,13 +195,14 @@ def discover_shellys(timeout=5):
 # ---------------------------------------------------------------------------
 
 if __name__ == "__main__":
-    registry = {}
+    registry = RegistryIndex()
+    presence = PresenceTracker(default_cycle=10, missed=3)
 
     ips = discover_shellys(timeout=5)
     logger.info("found %d IPs", len(ips))
 
     for ip in ips:
-        update_registry(registry, ip, logger)
+        update_registry(registry, ip, logger, presence)
 
-    mark_offline_devices(registry)
+    mark_offline_devices(registry, presence=presence)
     print_registry(registry)
\ No newline at end of file
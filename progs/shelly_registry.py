@@ -9,10 +9,6 @@ Shelly Registry (YAML)
 - Track presence state
 """
 
-from zeroconf import Zeroconf, ServiceBrowser, ServiceListener
-import requests
-import threading
-import time
 import logging
 import yaml
 import os
@@ -22,9 +18,11 @@ from pprint import pprint
 
 import progs.config as config
 from registry import registry as reg
-from ShellyPlus4PM import ShellyPlus4PM
-from ShellyPlus1 import ShellyPlus1
-from ShellyPlusPlug import ShellyPlusPlug
+import drivers
+from transport import get_transport
+from shelly_handler import ShellyHandler
+from discovery import get_discovery_service
+from runtime import get_runtime
 
 logger = logging.getLogger(__name__)
 logging.getLogger('urllib3').setLevel(logging.WARNING)
@@ -35,99 +33,31 @@ logging.getLogger('urllib3').setLevel(logging.WARNING)
 # ---------------------------------------------------------------------------
 
 #cfg['REGFile'] = Path("shelly_registry.yml")
-DISCOVERY_TIME = 5.0      # Sekunden für mDNS-Sammlung
 HTTP_TIMEOUT = 2.0       # HTTP-Timeout pro Gerät
 
 
 # ---------------------------------------------------------------------------
-# mDNS Listener (nur Shelly-Services!)
+# Fähigkeits-Erkennung (ein Shelly.GetStatus pro Gerät, siehe ShellyHandler)
 # ---------------------------------------------------------------------------
 
-class ShellyListener(ServiceListener):
-    def __init__(self):
-        self.ips = set()
-        self._lock = threading.Lock()
+_handler = None          # erst beim ersten Gebrauch, mit dem cfg aus __main__
 
-    def add_service(self, zeroconf, service_type, name):
-        info = zeroconf.get_service_info(service_type, name)
-        if info:
-            if not info:
-                logger.debug("mDNS service without info: %s", name)
-                return
 
-            addresses = info.parsed_addresses()
-            if not addresses:
-                logger.debug("mDNS service without address: %s", name)
-                return
+def _get_handler() -> ShellyHandler:
+    """ShellyHandler mit dem echten cfg: REGPath -> gemeinsamer, gespeicherter HostGuard."""
+    global _handler
+    if _handler is None:
+        _handler = ShellyHandler(globals().get("cfg") or {})
+    return _handler
 
-            with self._lock:
-                ip = addresses[0]
-                self.ips.add(ip)
-                logger.info("mDNS found Shelly at %s (%s)", ip, name)
 
-    def update_service(self, zeroconf, service_type, name):
-        logger.debug("### mDNS service updated: ### %s", name)
-        pass
+def detect_capabilities(ip: str, device_id: str = None, firmware_id: str = None,
+                        mac: str = None) -> list[str]:
+    return _get_handler().detect_capabilities(ip, device_id, firmware_id, mac)
 
-    def remove_service(self, zeroconf, service_type, name):
-        logger.debug("### mDNS service removed ###: %s", name)
-        pass
 
-
-# ---------------------------------------------------------------------------
-# Fähigkeits-Erkennung (klassisch: was antwortet, ist da)
-# ---------------------------------------------------------------------------
-
-def _has_rpc(ip: str, method: str) -> bool:
-    try:
-        r = requests.post(
-            f"http://{ip}/rpc/{method}",
-            json={},
-            timeout=HTTP_TIMEOUT
-        )
-        logger.debug("RPC %s on %s -> %s", method, ip, r.status_code)        
-        return r.status_code == 200
-    except Exception as exc:
-        logger.debug("RPC %s on %s failed: %s", method, ip, exc)        
-        return False
-
-
-def detect_capabilities(ip: str) -> list[str]:
-    caps = []
-
-    if _has_rpc(ip, "Switch.GetConfig"):
-        caps.append("relay")
-
-    elif _has_rpc(ip, "Cover.GetConfig"):
-        caps.append("cover")
-
-    elif _has_rpc(ip, "EM.GetConfig"):
-        caps.append("em")
-
-    elif _has_rpc(ip, "PM1.GetConfig"):
-        caps.append("power_meter")
-
-    elif _has_rpc(ip, "Input.GetConfig"):
-        caps.append("input")
-        
-    else:
-        caps.append("generic")
-    logger.debug("Capabilities for %s: %s", ip, caps)
-    return caps
-
-
-def derive_category_from_caps(caps: list[str]) -> str:
-    """
-    Optionale Komfort-Gruppierung.
-    Kein Fakt, nur Ableitung.
-    """
-    if "cover" in caps:
-        return "Cover"
-    if "em" in caps:
-        return "EM"
-    if "relay" in caps and "power_meter" in caps:
-        return "Plug"
-    return "Generic"
+def derive_category_from_caps(caps: list[str], model: str = None) -> str:
+    return _get_handler().derive_category_from_caps(caps, model)
 
 
 # ---------------------------------------------------------------------------
@@ -138,9 +68,7 @@ def _query_shelly(ip: str):
     try:
         logger.debug("Query Shelly at %s", ip)
         
-        r = requests.get(f"http://{ip}/shelly", timeout=HTTP_TIMEOUT)
-        r.raise_for_status()
-        data = r.json()
+        data = get_transport().get_json(f"http://{ip}/shelly", timeout=HTTP_TIMEOUT)
 
         device_id = data.get("name") or data.get("id")
         if not device_id:
@@ -148,7 +76,7 @@ def _query_shelly(ip: str):
             return None
 
         now = datetime.now().isoformat(timespec="seconds")
-        caps = detect_capabilities(ip)
+        caps = detect_capabilities(ip, device_id, data.get("fw_id"), data.get("mac"))
 
         return device_id, {
             "id": data.get("id"),
@@ -161,7 +89,7 @@ def _query_shelly(ip: str):
             "firmware": data.get("ver"),
             "firmware_id": data.get("fw_id"),
             "capabilities": caps,
-            "category": derive_category_from_caps(caps),
+            "category": derive_category_from_caps(caps, data.get("model") or data.get("type")),
             "present": True,
             "last_seen": now,
         }
@@ -176,18 +104,11 @@ def _query_shelly(ip: str):
 # ---------------------------------------------------------------------------
 
 def discover_devices() -> dict:
-    logger.debug("Starting mDNS discovery")
-
-    zeroconf = Zeroconf()
-    listener = ShellyListener()
-
-    ServiceBrowser(zeroconf, "_http._tcp.local.", listener)
-    time.sleep(DISCOVERY_TIME)
-    zeroconf.close()
+    logger.debug("Reading mDNS discovery service")
 
     found = {}
 
-    for ip in listener.ips:
+    for ip in get_discovery_service().ips():
         result = _query_shelly(ip)
         if result:
             device_id, data = result
@@ -280,14 +201,9 @@ if __name__ == "__main__":
             f"{dev.get('category')}"
         )
         
-    shelly = ShellyPlus4PM("192.168.2.46")
-    data = shelly.read_all()
-    #pprint(data)
-
-    shelly1 = ShellyPlus1("192.168.2.47")
-    data1 = shelly1.read_all()
-    #pprint(data1)
-    
-    shelly2 = ShellyPlusPlug("192.168.2.50")
-    data2 = shelly2.read_all()
-    #pprint(data)
\ No newline at end of file
+    # Messwerte aller erreichbaren Gen2-Geräte, Treiber über das Modell
+    states = [drivers.DeviceState(dev["ip"], dev.get("model"))
+              for dev in registry.values()
+              if dev.get("present") and (dev.get("gen") or 0) >= 2]
+    readings = get_runtime().run(drivers.poll_all(states, timeout=HTTP_TIMEOUT))
+    #pprint(readings)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ereignisgesteuerte Shelly-Zustände über WebSocket (Gen2+, ws://<ip>/rpc).
+
+Pro Gerät eine dauerhafte Verbindung. Nach dem Verbinden holt ein
+Shelly.GetStatus den vollständigen Zustand; danach schickt das Gerät von
+sich aus NotifyStatus (nur die geänderten Felder) und NotifyFullStatus.
+Beides landet im StateCache. Gepollt wird nur, solange die Verbindung
+fehlt; zwischen den Reconnect-Versuchen (exponentieller Backoff, höchstens
+POLL_INTERVAL) gibt es je ein Shelly.GetStatus über HTTP.
+
+    manager = SubscriptionManager()
+    manager.add("192.168.2.47")
+    await manager.run(stop)            # läuft bis stop gesetzt wird
+    manager.cache.get("192.168.2.47")  # aktueller Zustand
+
+Braucht das Paket websockets (wird erst beim Verbinden geladen).
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import socket
+import time
+
+from transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+POLL_INTERVAL = 30.0      # Sekunden zwischen Polls, solange keine Verbindung besteht
+RECONNECT_MIN = 1.0       # erster Reconnect-Versuch nach ...
+OPEN_TIMEOUT = 5.0
+PING_INTERVAL = 30.0      # Keepalive der WebSocket-Verbindung
+
+# ---------------------------------------------------------------------------
+# Zustand
+# ---------------------------------------------------------------------------
+
+def merge(dst: dict, src: dict) -> None:
+    """NotifyStatus-Delta rekursiv in den Zustand übernehmen."""
+    for key, value in src.items():
+        if isinstance(value, dict) and isinstance(dst.get(key), dict):
+            merge(dst[key], value)
+        else:
+            dst[key] = value
+
+
+class StateCache:
+    """
+    Letzter bekannter Zustand pro Gerät (Format wie Shelly.GetStatus).
+    Abonnenten bekommen callback(ip, delta, full) nach jeder Änderung.
+    """
+
+    def __init__(self):
+        self.states = {}          # ip -> status dict
+        self.updated = {}         # ip -> time.time() der letzten Änderung
+        self._subscribers = []
+
+    def subscribe(self, callback) -> None:
+        self._subscribers.append(callback)
+
+    def get(self, ip: str):
+        return self.states.get(ip)
+
+    def replace(self, ip: str, status: dict) -> None:
+        status = dict(status)
+        status.pop("ts", None)
+        self.states[ip] = status
+        self._changed(ip, status, True)
+
+    def apply(self, ip: str, delta: dict) -> None:
+        delta = dict(delta)
+        delta.pop("ts", None)
+        merge(self.states.setdefault(ip, {}), delta)
+        self._changed(ip, delta, False)
+
+    def _changed(self, ip: str, delta: dict, full: bool) -> None:
+        self.updated[ip] = time.time()
+        for callback in self._subscribers:
+            try:
+                callback(ip, delta, full)
+            except Exception as exc:
+                logger.error("State subscriber failed for %s: %s", ip, exc)
+
+# ---------------------------------------------------------------------------
+# Verbindung pro Gerät
+# ---------------------------------------------------------------------------
+
+class Subscription:
+    __slots__ = ("ip", "connected", "notifications", "polls", "poll_errors",
+                 "reconnects", "backoff", "task")
+
+    def __init__(self, ip: str):
+        self.ip = ip
+        self.connected = False
+        self.notifications = 0
+        self.polls = 0
+        self.poll_errors = 0
+        self.reconnects = 0
+        self.backoff = RECONNECT_MIN
+        self.task = None
+
+
+class SubscriptionManager:
+    def __init__(self, cache: StateCache = None, poll_interval: float = POLL_INTERVAL):
+        self.cache = cache or StateCache()
+        self.poll_interval = poll_interval
+        self.src = f"deco-{socket.gethostname()}"     # Absender, an den das Gerät Notify* schickt
+        self.subs = {}
+        self._ids = itertools.count(1)
+        self._loop = None
+
+    # -- Geräte -------------------------------------------------------------
+
+    def add(self, ip: str) -> None:
+        """Darf vor run() oder aus jedem Thread aufgerufen werden."""
+        if ip in self.subs:
+            return
+        sub = self.subs[ip] = Subscription(ip)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._spawn, sub)
+
+    def remove(self, ip: str) -> None:
+        sub = self.subs.pop(ip, None)
+        if sub is not None and sub.task is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(sub.task.cancel)
+
+    def _spawn(self, sub: Subscription) -> None:
+        if sub.task is None and self.subs.get(sub.ip) is sub:
+            sub.task = asyncio.ensure_future(self._device_loop(sub))
+
+    # -- Ablauf pro Gerät ---------------------------------------------------
+
+    def _handle(self, sub: Subscription, msg: dict, request_id: int) -> None:
+        method = msg.get("method")
+        if method == "NotifyStatus":
+            sub.notifications += 1
+            self.cache.apply(sub.ip, msg.get("params") or {})
+        elif method == "NotifyFullStatus":
+            sub.notifications += 1
+            self.cache.replace(sub.ip, msg.get("params") or {})
+        elif msg.get("id") == request_id and "result" in msg:
+            self.cache.replace(sub.ip, msg["result"])
+
+    async def _listen(self, sub: Subscription) -> None:
+        """Eine WebSocket-Sitzung; kehrt zurück, wenn die Verbindung endet."""
+        from websockets.asyncio.client import connect
+
+        async with connect(f"ws://{sub.ip}/rpc", open_timeout=OPEN_TIMEOUT,
+                           ping_interval=PING_INTERVAL, max_size=2**20) as ws:
+            request_id = next(self._ids)
+            # ein Request mit src meldet uns beim Gerät für Notify* an
+            await ws.send(json.dumps({"id": request_id, "src": self.src, "method": "Shelly.GetStatus"}))
+            sub.connected = True
+            sub.backoff = RECONNECT_MIN
+            logger.debug("WebSocket to %s connected", sub.ip)
+            async for raw in ws:
+                try:
+                    msg = json.loads(raw)
+                except ValueError:
+                    logger.debug("Invalid frame from %s", sub.ip)
+                    continue
+                self._handle(sub, msg, request_id)
+
+    async def _poll(self, sub: Subscription) -> None:
+        try:
+            status = await get_transport().aget_json(f"http://{sub.ip}/rpc/Shelly.GetStatus")
+        except Exception as exc:
+            sub.poll_errors += 1
+            logger.debug("Fallback poll of %s failed: %s", sub.ip, exc)
+            return
+        sub.polls += 1
+        self.cache.replace(sub.ip, status)
+
+    async def _device_loop(self, sub: Subscription) -> None:
+        while True:
+            try:
+                await self._listen(sub)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.debug("WebSocket to %s failed: %s", sub.ip, exc)
+            if sub.connected:
+                sub.connected = False
+                sub.reconnects += 1
+                logger.info("WebSocket to %s lost, polling until it is back", sub.ip)
+            # nur ohne Verbindung pollen
+            await self._poll(sub)
+            await asyncio.sleep(sub.backoff)
+            sub.backoff = min(sub.backoff * 2, self.poll_interval)
+
+    # -- Lebenszyklus -------------------------------------------------------
+
+    async def run(self, stop: asyncio.Event = None) -> None:
+        self._loop = asyncio.get_running_loop()
+        for sub in self.subs.values():
+            self._spawn(sub)
+        try:
+            if stop is None:
+                await asyncio.Event().wait()
+            else:
+                await stop.wait()
+        finally:
+            tasks = [sub.task for sub in self.subs.values() if sub.task is not None]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for sub in self.subs.values():
+                sub.task = None
+                sub.connected = False
+            self._loop = None
+
+    def stats(self) -> dict:
+        subs = self.subs.values()
+        return {
+            "devices": len(self.subs),
+            "connected": sum(s.connected for s in subs),
+            "notifications": sum(s.notifications for s in subs),
+            "polls": sum(s.polls for s in subs),
+            "poll_errors": sum(s.poll_errors for s in subs),
+            "reconnects": sum(s.reconnects for s in subs),
+        }
@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fake-Geräte für Benchmarks und Tests ohne echte Hardware.
+
+Jedes simulierte Gerät lauscht auf 127.0.0.1:<eigener Port> und beantwortet
+die Endpunkte, die NetworkScanner.identify_device abfragt. Als "IP" wird
+überall "127.0.0.1:<port>" verwendet, damit URLs wie http://{ip}/shelly
+unverändert funktionieren.
+
+Profile:
+    shelly2   Gen2 RPC (/rpc/Shelly.GetDeviceInfo, GetStatus, GetConfig, WebSocket)
+    shelly1   Gen1 (/shelly, /settings wie in ttt.py, /status)
+    wled      /json/state
+    esp       <div1>-Statusseite unter / und /status
+    none      nur 404
+
+Pro Gerät lassen sich Latenz, Fehlerrate (503) und ein Anteil langsamer
+Antworten einstellen, siehe make_fleet(); loadtest.py nutzt das.
+"""
+
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+SIM_HOST = "127.0.0.1"
+PROFILES = ("shelly2", "shelly1", "wled", "esp", "none")
+SLOW_LATENCY = 2.0        # Sekunden für "langsame" Antworten
+GEN1_FW = "20230913-113610/v1.14.0-gcb84623"
+
+ESP_PAGE = (
+    "<html><body><h1>ESP</h1><div1><h3>{name}</h3>\r\n"
+    "-----> ESPDevice V3.14 (build 2024): ok<br>"
+    "Hostname: {name}<br>"
+    "Type: Temperature<br>"
+    "Hardw: ESP8266<br>"
+    "uptime: 12345<br>"
+    "good Transmissions: 4711<br>"
+    "bad Transmissions: 3<br>"
+    "</div1></body></html>"
+)
+
+# ---------------------------------------------------------------------------
+# Simuliertes Gerät
+# ---------------------------------------------------------------------------
+
+class FakeDevice:
+    def __init__(self, profile: str, name: str, latency: float = 0.0, failure_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_latency: float = SLOW_LATENCY, seed=None):
+        """
+        latency: Verzögerung jeder Antwort; failure_rate: Anteil 503-Antworten;
+        slow_rate: Anteil Antworten, die slow_latency statt latency brauchen.
+        """
+        if profile not in PROFILES:
+            raise ValueError(f"Unbekanntes Profil: {profile}")
+        self.profile = profile
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self._rnd = random.Random(seed if seed is not None else name)
+        self.port = None
+        self.requests = 0
+        self.failures = 0
+        self.slow = 0
+        self.cfg_rev = 7          # hochzählen, um eine Konfigurationsänderung zu simulieren
+        self.websocket = profile == "shelly2"     # ws://<ip>/rpc annehmen
+        self.ws_clients = set()
+        self.status = {
+            "switch:0": {"id": 0, "output": True, "apower": 12.5, "voltage": 230.1,
+                         "current": 0.054, "aenergy": {"total": 1234.5}},
+            "input:0": {"id": 0, "state": False},
+            "sys": {"mac": self.name[-12:].upper(), "cfg_rev": self.cfg_rev, "uptime": 1000}}
+
+    @property
+    def ip(self) -> str:
+        return f"{SIM_HOST}:{self.port}"
+
+    @property
+    def mac(self) -> str:
+        return self.name[-12:].upper()
+
+    def behave(self):
+        """(Verzögerung, fehlschlagen?) für den nächsten Request."""
+        if self.failure_rate and self._rnd.random() < self.failure_rate:
+            self.failures += 1
+            return self.latency, True
+        if self.slow_rate and self._rnd.random() < self.slow_rate:
+            self.slow += 1
+            return self.slow_latency, False
+        return self.latency, False
+
+    def _gen1_settings(self) -> dict:
+        """Auszug aus /settings eines Shelly Plug S (ttt.py)."""
+        host = f"shellyplug-{self.mac}"
+        return {
+            "device": {"type": "SHPLG2-1", "mac": self.mac, "hostname": host,
+                       "num_outputs": 1, "num_meters": 1},
+            "wifi_ap": {"enabled": False, "ssid": host, "key": ""},
+            "wifi_sta": {"enabled": True, "ssid": "DeCo", "ipv4_method": "dhcp", "ip": None},
+            "mqtt": {"enable": False, "server": "192.168.33.3:1883", "id": host,
+                     "keep_alive": 60, "max_qos": 0, "retain": False, "update_period": 30},
+            "coiot": {"enabled": True, "update_period": 15, "peer": ""},
+            "sntp": {"server": "time.google.com", "enabled": True},
+            "login": {"enabled": False, "unprotected": False, "username": "admin"},
+            "name": None,
+            "fw": GEN1_FW,
+            "build_info": {"build_id": GEN1_FW, "build_timestamp": "2023-09-13T11:36:10Z"},
+            "cloud": {"enabled": False, "connected": False},
+            "timezone": "Europe/Berlin", "lat": 52.5, "lng": 13.4,
+            "relays": [{"name": None, "ison": True, "has_timer": False, "default_state": "last",
+                        "auto_on": 0.0, "auto_off": 0.0, "schedule": False, "max_power": 2500}],
+        }
+
+    def route(self, method: str, path: str, body: bytes):
+        """Liefert (status, content_type, payload) für einen Request."""
+        path = path.split("?", 1)[0]
+        p = self.profile
+        if p == "shelly2":
+            if path in ("/rpc/Shelly.GetDeviceInfo", "/shelly"):
+                return 200, "application/json", {
+                    "name": self.name, "id": self.name, "mac": self.name[-12:].upper(),
+                    "model": "SNSW-001X16EU", "gen": 2, "fw_id": "20240101-000000/1.0.0",
+                    "ver": "1.0.0"}
+            if path == "/rpc/Shelly.GetStatus":
+                self.status["sys"]["cfg_rev"] = self.cfg_rev
+                return 200, "application/json", self.status
+            if path == "/rpc/Shelly.GetConfig":
+                return 200, "application/json", {
+                    "ble": {"enable": False}, "cloud": {"enable": True, "server": "shelly-eu.shelly.cloud:6022/jrpc"},
+                    "input:0": {"id": 0, "name": None, "type": "switch", "invert": False},
+                    "mqtt": {"enable": False, "server": None, "topic_prefix": self.name},
+                    "switch:0": {"id": 0, "name": None, "in_mode": "follow", "initial_state": "restore_last",
+                                 "auto_on": False, "auto_off": False, "power_limit": 4480,
+                                 "voltage_limit": 280, "current_limit": 16.0},
+                    "sys": {"device": {"name": self.name, "mac": self.name[-12:].upper(), "fw_id": "20240101-000000/1.0.0"},
+                            "location": {"tz": "Europe/Berlin", "lat": 52.5, "lon": 13.4},
+                            "sntp": {"server": "time.google.com"}, "cfg_rev": self.cfg_rev},
+                    "wifi": {"sta": {"ssid": "DeCo", "is_open": False, "enable": True, "ipv4mode": "dhcp"},
+                             "ap": {"ssid": self.name, "is_open": True, "enable": False}}}
+        elif p == "shelly1":
+            if path == "/shelly":
+                return 200, "application/json", {"type": "SHPLG2-1", "mac": self.mac, "auth": False,
+                                                  "fw": GEN1_FW, "num_outputs": 1, "num_meters": 1}
+            if path == "/settings":
+                return 200, "application/json", self._gen1_settings()
+            if path == "/status":
+                return 200, "application/json", {
+                    "relays": [{"ison": True, "has_timer": False, "overpower": False}],
+                    "meters": [{"power": 12.5, "overpower": 0.0, "is_valid": True,
+                                "counters": [12.1, 12.4, 12.6], "total": 74070}],
+                    "temperature": 31.2, "uptime": 1000, "mac": self.mac}
+        elif p == "wled":
+            if path == "/json/state":
+                return 200, "application/json", {"on": True, "bri": 128}
+        elif p == "esp":
+            if path in ("/", "/status"):
+                return 200, "text/html", ESP_PAGE.format(name=self.name)
+        return 404, "text/plain", "not found"
+
+class HttpSink:
+    """
+    Empfänger für post.WEP_Post: nimmt POSTs an (gzip oder nicht) und merkt
+    sich die Batches. Mit down=True antwortet er mit 503, wie ein Server im
+    Wartungsmodus. Läuft wie ein Gerät in einer FakeFleet.
+    """
+
+    def __init__(self, name: str = "sink", latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.port = None
+        self.requests = 0
+        self.down = False
+        self.batches = []
+
+    @property
+    def ip(self) -> str:
+        return f"{SIM_HOST}:{self.port}"
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.ip}/"
+
+    @property
+    def readings(self) -> list:
+        return [r for batch in self.batches for r in batch.get("readings", ())]
+
+    def route(self, method: str, path: str, body: bytes):
+        if self.down:
+            return 503, "text/plain", "down"
+        if method != "POST":
+            return 404, "text/plain", "not found"
+        if body[:2] == b"\x1f\x8b":
+            body = gzip.decompress(body)
+        self.batches.append(json.loads(body))
+        return 200, "application/json", {"ok": True}
+
+# ---------------------------------------------------------------------------
+# Minimaler HTTP/1.1-Server (keep-alive) pro Gerät
+# ---------------------------------------------------------------------------
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _ws_frame(payload: bytes, opcode: int = 1) -> bytes:
+    """Server-Frame (unmaskiert, nicht fragmentiert)."""
+    n = len(payload)
+    if n < 126:
+        head = bytes((0x80 | opcode, n))
+    elif n < 65536:
+        head = bytes((0x80 | opcode, 126)) + n.to_bytes(2, "big")
+    else:
+        head = bytes((0x80 | opcode, 127)) + n.to_bytes(8, "big")
+    return head + payload
+
+
+async def _ws_read(reader):
+    """(opcode, payload) eines Client-Frames (maskiert)."""
+    b1, b2 = await reader.readexactly(2)
+    n = b2 & 0x7F
+    if n == 126:
+        n = int.from_bytes(await reader.readexactly(2), "big")
+    elif n == 127:
+        n = int.from_bytes(await reader.readexactly(8), "big")
+    mask = await reader.readexactly(4) if b2 & 0x80 else None
+    data = await reader.readexactly(n)
+    if mask:
+        data = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+    return b1 & 0x0F, data
+
+
+async def _serve_websocket(device: FakeDevice, headers: dict, reader, writer):
+    """RPC über WebSocket wie ein Gen2-Shelly: Antworten auf Requests, Notify* an alle."""
+    key = headers.get("sec-websocket-key", "")
+    accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+    writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                  f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+    await writer.drain()
+    device.ws_clients.add(writer)
+    try:
+        while True:
+            opcode, data = await _ws_read(reader)
+            if opcode == 8:                       # close
+                writer.write(_ws_frame(data[:2], 8))
+                await writer.drain()
+                return
+            if opcode == 9:                       # ping
+                writer.write(_ws_frame(data, 10))
+                continue
+            if opcode != 1:
+                continue
+            request = json.loads(data)
+            device.requests += 1
+            status, _, payload = device.route("GET", f"/rpc/{request.get('method')}", b"")
+            reply = {"id": request.get("id"), "src": device.name, "dst": request.get("src")}
+            if status == 200:
+                reply["result"] = payload
+            else:
+                reply["error"] = {"code": 404, "message": "No handler"}
+            writer.write(_ws_frame(json.dumps(reply).encode()))
+            await writer.drain()
+    finally:
+        device.ws_clients.discard(writer)
+
+async def _serve_connection(device: FakeDevice, reader, writer):
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            method, path, _ = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    k, v = line.split(":", 1)
+                    headers[k.strip().lower()] = v.strip()
+            length = int(headers.get("content-length", 0))
+            body = await reader.readexactly(length) if length else b""
+            if (headers.get("upgrade", "").lower() == "websocket"
+                    and path == "/rpc" and getattr(device, "websocket", False)):
+                await _serve_websocket(device, headers, reader, writer)
+                break
+
+            device.requests += 1
+            behave = getattr(device, "behave", None)
+            delay, fail = behave() if behave is not None else (device.latency, False)
+            if delay:
+                await asyncio.sleep(delay)
+            if fail:
+                status, ctype, payload = 503, "text/plain", "busy"
+            else:
+                status, ctype, payload = device.route(method, path, body)
+            if not isinstance(payload, str):
+                payload = json.dumps(payload)
+            data = payload.encode()
+            reason = {200: "OK", 503: "Service Unavailable"}.get(status, "Not Found")
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: {ctype}\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: keep-alive\r\n\r\n".encode() + data)
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close":
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+class FakeFleet:
+    """
+    Startet eine Menge FakeDevices in einem eigenen Thread mit eigenem Event-Loop.
+    Verwendung:
+        with FakeFleet([FakeDevice("shelly2", "shellyplus1-aabbcc")]) as fleet:
+            fleet.hosts  ->  ["127.0.0.1:40123", ...]
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="FakeFleet", daemon=True)
+        self._servers = []
+        self._conns = set()
+
+    @property
+    def hosts(self) -> list:
+        return [d.ip for d in self.devices]
+
+    async def _handle(self, device, reader, writer):
+        self._conns.add(writer)
+        try:
+            await _serve_connection(device, reader, writer)
+        finally:
+            self._conns.discard(writer)
+
+    async def _start_all(self):
+        for device in self.devices:
+            server = await asyncio.start_server(
+                lambda r, w, d=device: self._handle(d, r, w), SIM_HOST, 0)
+            device.port = server.sockets[0].getsockname()[1]
+            self._servers.append(server)
+
+    async def _stop_all(self):
+        for server in self._servers:
+            server.close()
+        self._servers.clear()
+        # offene keep-alive Verbindungen beenden, die Handler laufen dann selbst aus
+        for writer in list(self._conns):
+            writer.close()
+        while self._conns:
+            await asyncio.sleep(0.01)
+
+    # -- Push (WebSocket) -----------------------------------------------------
+
+    @staticmethod
+    def _merge(dst: dict, src: dict) -> None:
+        for key, value in src.items():
+            if isinstance(value, dict) and isinstance(dst.get(key), dict):
+                FakeFleet._merge(dst[key], value)
+            else:
+                dst[key] = value
+
+    async def _notify(self, device, method: str, params: dict) -> None:
+        msg = {"src": device.name, "dst": "*", "method": method, "params": params}
+        frame = _ws_frame(json.dumps(msg).encode())
+        for writer in list(device.ws_clients):
+            writer.write(frame)
+            await writer.drain()
+
+    def push(self, device, delta: dict) -> None:
+        """Zustand ändern und wie ein Shelly NotifyStatus an alle WS-Clients senden."""
+        async def notify():
+            self._merge(device.status, delta)
+            await self._notify(device, "NotifyStatus", dict(delta, ts=time.time()))
+        asyncio.run_coroutine_threadsafe(notify(), self._loop).result()
+
+    def push_full(self, device) -> None:
+        asyncio.run_coroutine_threadsafe(
+            self._notify(device, "NotifyFullStatus", dict(device.status, ts=time.time())), self._loop).result()
+
+    def drop_websockets(self, device) -> None:
+        """Alle WS-Verbindungen eines Geräts hart trennen (Verbindungsabbruch)."""
+        async def drop():
+            for writer in list(device.ws_clients):
+                writer.close()
+        asyncio.run_coroutine_threadsafe(drop(), self._loop).result()
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_all(), self._loop).result()
+        logger.debug("FakeFleet started with %d devices", len(self.devices))
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._stop_all(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def make_fleet(count: int, latency: float = 0.0, failure_rate: float = 0.0,
+               slow_rate: float = 0.0, slow_latency: float = SLOW_LATENCY,
+               profiles=PROFILES, seed: int = 0) -> FakeFleet:
+    """Gemischte Flotte: Profile reihum, inkl. Hosts ohne bekanntes Profil."""
+    devices = [
+        FakeDevice(profiles[i % len(profiles)], f"simdev-{i:012X}", latency,
+                   failure_rate, slow_rate, slow_latency, seed=seed * 1000003 + i)
+        for i in range(count)
+    ]
+    return FakeFleet(devices)
+
+# ---------------------------------------------------------------------------
+# MQTT-Broker im Prozess (für mqtt_ingest.MqttIngest)
+# ---------------------------------------------------------------------------
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """MQTT-Wildcards: + genau eine Ebene, # der Rest."""
+    p, t = pattern.split("/"), topic.split("/")
+    for i, part in enumerate(p):
+        if part == "#":
+            return True
+        if i >= len(t) or (part != "+" and part != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+class StubMessage:
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic: str, payload: bytes):
+        self.topic = topic
+        self.payload = payload
+
+
+class StubClient:
+    """Teilmenge von aiomqtt.Client: async with, subscribe(), messages, publish()."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.patterns = []
+        self._queue = None
+        self._loop = None
+
+    async def __aenter__(self):
+        self._queue = asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+        self.broker.clients.add(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.broker.clients.discard(self)
+
+    async def subscribe(self, pattern: str, qos: int = 0):
+        self.patterns.append(pattern)
+
+    async def publish(self, topic: str, payload=b"", qos: int = 0, retain: bool = False):
+        self.broker.publish(topic, payload)
+
+    def _deliver(self, message: StubMessage):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, message)
+
+    @property
+    def messages(self):
+        return self._iter()
+
+    async def _iter(self):
+        while True:
+            yield await self._queue.get()
+
+
+class StubBroker:
+    """
+    Broker im Prozess, thread-sicher:
+        broker = StubBroker()
+        ingest = MqttIngest(client_factory=broker.client)
+        broker.publish("shellies/shellyplug-aabbcc/relay/0/power", b"12.5")
+    """
+
+    def __init__(self):
+        self.clients = set()
+        self.published = 0
+
+    def client(self) -> StubClient:
+        return StubClient(self)
+
+    def publish(self, topic: str, payload) -> None:
+        if isinstance(payload, str):
+            payload = payload.encode()
+        elif not isinstance(payload, bytes):
+            payload = json.dumps(payload).encode()
+        self.published += 1
+        message = StubMessage(topic, payload)
+        for client in list(self.clients):
+            if any(topic_matches(p, topic) for p in client.patterns):
+                client._deliver(message)
@@ -1,42 +1,107 @@
-from threadtools import StoppableThread    
 import logging
-from threadtools import StoppableThread
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from threadtools import Counters, SupervisedThread, NEVER
 
 logger = logging.getLogger(__name__)
 
+POOL_WORKERS = 16         # Worker für kurze Gerätejobs
+POOL_QUEUE = 256          # wartende Jobs höchstens, dann blockiert submit()
+SHUTDOWN_TIMEOUT = 10.0   # globale Frist für stop_all()
+
+
+class PoolStats(Counters):
+    __slots__ = ("submitted", "completed", "failed", "busy_time", "cpu_time")
+
+
 class ThreadManager:
-    def __init__(self):
+    """
+    Benannte, überwachte Threads für langlaufende Aufgaben (start/stop) und
+    ein begrenzter Worker-Pool für kurze Jobs (submit).
+    """
+
+    def __init__(self, pool_workers: int = POOL_WORKERS, pool_queue: int = POOL_QUEUE):
         self._threads = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._futures = set()     # laufende und wartende Pool-Jobs, für stop_all()
+        self.pool_workers = pool_workers
+        # begrenzt laufende + wartende Jobs
+        self._pool_slots = threading.BoundedSemaphore(pool_workers + pool_queue)
+        self.pool_stats = PoolStats()
 
-    def start(self, name: str, target: callable, args: tuple = (), kwargs: dict = None):
-        if name in self._threads:
-            logger.debug(f"Thread '{name}' already running.")
-            return
+    # -- langlaufende Threads -----------------------------------------------
 
-        t = StoppableThread(target=target, name=name, args=args, kwargs=kwargs)
-        t.start()
-        self._threads[name] = t
-        logger.debug(f"Thread '{name}' started.")
+    def start(self, name: str, target: callable, args: tuple = (), kwargs: dict = None,
+              restart: str = NEVER, max_restarts: int = None, daemon: bool = False):
+        """
+        target(stop_event, *args, **kwargs). restart: NEVER, ON_FAILURE
+        (nach einer Exception) oder ALWAYS (auch nach normalem Ende), jeweils
+        mit exponentiellem Backoff; max_restarts begrenzt die Neustarts.
+        daemon=True: der Thread hält das Programmende nicht auf.
+        """
+        with self._lock:
+            if name in self._threads and self._threads[name].is_alive():
+                logger.debug(f"Thread '{name}' already running.")
+                return
+            t = SupervisedThread(target=target, name=name, args=args, kwargs=kwargs,
+                                 restart=restart, max_restarts=max_restarts, daemon=daemon)
+            t.start()
+            self._threads[name] = t
+        logger.debug(f"Thread '{name}' started (restart={restart}).")
 
-    def stop(self, name: str):
+    def stop(self, name: str, timeout: float = 5.0):
         thread = self._threads.get(name)
         if thread:
             logger.debug(f"Stopping thread '{name}' (externally triggered).")
             thread.stop()
-            thread.join(timeout=5)
+            thread.join(timeout=timeout)
             if thread.is_alive():
                 logger.warning(f"Thread '{name}' did not terminate cleanly..")
             else:
                 logger.debug(f"Thread '{name}' stopped")
-            del self._threads[name]
+            with self._lock:
+                self._threads.pop(name, None)
 
-    def stop_all(self):
+    def stop_all(self, timeout: float = SHUTDOWN_TIMEOUT) -> list:
+        """
+        Alle Threads gleichzeitig anhalten: erst jedem das Stop-Signal geben,
+        dann gemeinsam bis zu einer Frist warten. Liefert die Namen der
+        Threads, die nicht rechtzeitig beendet waren ("pool", wenn noch
+        Pool-Jobs laufen).
+        """
+        deadline = time.monotonic() + timeout
         current = threading.current_thread()
-        for name, thread in list(self._threads.items()):
-            if thread is current:
-                continue
-            self.stop(name)
+        with self._lock:
+            threads = {n: t for n, t in self._threads.items() if t is not current}
+        for thread in threads.values():
+            thread.stop()
+        pool = self._pool
+        if pool is not None:
+            # wartende Jobs verwerfen, laufende unten bis zur Frist abwarten
+            pool.shutdown(wait=False, cancel_futures=True)
+        hanging = []
+        for name, thread in threads.items():
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                hanging.append(name)
+                logger.warning(f"Thread '{name}' did not terminate cleanly..")
+        with self._lock:
+            for name in threads:
+                if name not in hanging:
+                    self._threads.pop(name, None)
+        if pool is not None:
+            with self._lock:
+                futures = set(self._futures)
+            _, running = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+            if running:
+                hanging.append("pool")
+                logger.warning(f"{len(running)} pool jobs still running at shutdown.")
+            self._pool = None
+        logger.debug(f"stop_all: {len(threads) - len(hanging)} stopped, {len(hanging)} hanging")
+        return hanging
 
     def is_alive(self, name: str) -> bool:
         thread = self._threads.get(name)
@@ -46,7 +111,69 @@ class ThreadManager:
         return list(self._threads.keys())
 
     def cleanup_finished(self):
-        finished = [name for name, t in self._threads.items() if not t.is_alive()]
-        for name in finished:
-            logger.debug(f"Thread '{name}' has finished.")
-            del self._threads[name]
\ No newline at end of file
+        with self._lock:
+            finished = [name for name, t in self._threads.items() if not t.is_alive()]
+            for name in finished:
+                t = self._threads.pop(name)
+                logger.debug(f"Thread '{name}' has finished ({t.state}).")
+
+    # -- Worker-Pool --------------------------------------------------------
+
+    def _run_job(self, fn, args, kwargs):
+        wall = time.monotonic()
+        cpu = time.thread_time()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            self.pool_stats.failed += 1
+            raise
+        finally:
+            self.pool_stats.busy_time += time.monotonic() - wall
+            self.pool_stats.cpu_time += time.thread_time() - cpu
+            self.pool_stats.completed += 1
+
+    def submit(self, fn, *args, timeout: float = None, **kwargs):
+        """
+        Kurzen Job im Pool ausführen, liefert ein Future. Ist der Pool voll
+        (POOL_QUEUE wartende Jobs), blockiert der Aufruf bis timeout und
+        wirft dann TimeoutError.
+        """
+        if not self._pool_slots.acquire(timeout=timeout):
+            raise TimeoutError("worker pool is full")
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(self.pool_workers, thread_name_prefix="pool")
+        self.pool_stats.submitted += 1
+        try:
+            future = self._pool.submit(self._run_job, fn, args, kwargs)
+        except RuntimeError:
+            self._pool_slots.release()
+            raise
+        with self._lock:
+            self._futures.add(future)
+        # auch abgebrochene Jobs (stop_all) geben ihren Platz frei
+        future.add_done_callback(self._job_done)
+        return future
+
+    def _job_done(self, future) -> None:
+        with self._lock:
+            self._futures.discard(future)
+        self._pool_slots.release()
+
+    # -- Statistik ----------------------------------------------------------
+
+    def stats(self) -> dict:
+        """Zustand, Neustarts, Laufzeit und CPU-Zeit pro Thread, dazu der Pool."""
+        with self._lock:
+            current = dict(self._threads)
+        threads = {name: {"state": t.state,
+                         "alive": t.is_alive(),
+                         "restarts": t.restarts,
+                         "runtime": t.runtime(),
+                         "cpu": t.cpu_time(),
+                         "last_error": t.last_error}
+                  for name, t in current.items()}
+        pool = self.pool_stats.as_dict()
+        pool["workers"] = self.pool_workers
+        return {"threads": threads, "pool": pool}
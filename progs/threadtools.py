@@ -1,13 +1,40 @@
+import logging
 import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Restart-Policies für SupervisedThread
+NEVER, ON_FAILURE, ALWAYS = "never", "on-failure", "always"
+
+BACKOFF_MIN = 1.0         # Sekunden bis zum ersten Neustart
+BACKOFF_MAX = 300.0
+STABLE_AFTER = 60.0       # so lange ohne Absturz -> Backoff wieder von vorn
+
+
+class Counters:
+    """
+    Basis für Statistik-Zähler: die Unterklasse nennt nur ihre Felder in
+    __slots__, alle starten bei 0, as_dict() liefert sie in dieser Reihenfolge.
+    """
+    __slots__ = ()
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
 
 class StoppableThread(threading.Thread):
-    def __init__(self, target: callable, name=None, args=(), kwargs=None):
-        super().__init__(name=name)
+    def __init__(self, target: callable, name=None, args=(), kwargs=None, daemon: bool = False):
+        super().__init__(name=name, daemon=daemon)
         self._stop_event = threading.Event()
         self._target = target
         self._args = args
         self._kwargs = kwargs or {}
-        
+
     def run(self):
         self._target(self._stop_event, *self._args, **self._kwargs)
 
@@ -15,4 +42,79 @@ class StoppableThread(threading.Thread):
         self._stop_event.set()
 
     def stopped(self) -> bool:
-        return self._stop_event.is_set()
\ No newline at end of file
+        return self._stop_event.is_set()
+
+
+class SupervisedThread(StoppableThread):
+    """
+    StoppableThread, der sein Ziel nach einem Absturz (ON_FAILURE) oder auch
+    nach einem normalen Ende (ALWAYS) im selben Thread neu startet, mit
+    exponentiellem Backoff. Zählt Laufzeit und CPU-Zeit des Threads.
+    """
+
+    def __init__(self, target: callable, name=None, args=(), kwargs=None,
+                 restart: str = NEVER, max_restarts: int = None,
+                 backoff_min: float = BACKOFF_MIN, backoff_max: float = BACKOFF_MAX,
+                 daemon: bool = False):
+        super().__init__(target, name=name, args=args, kwargs=kwargs, daemon=daemon)
+        self.restart = restart
+        self.max_restarts = max_restarts
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.state = "new"
+        self.restarts = 0
+        self.last_error = None
+        self.started_at = None
+        self.ended_at = None
+        self._cpu = 0.0           # CPU-Zeit, festgehalten beim Ende des Threads
+
+    def _should_restart(self, failed: bool) -> bool:
+        if self.stopped() or self.restart == NEVER:
+            return False
+        if self.restart == ON_FAILURE and not failed:
+            return False
+        return self.max_restarts is None or self.restarts < self.max_restarts
+
+    def run(self):
+        self.started_at = time.monotonic()
+        backoff = self.backoff_min
+        try:
+            while True:
+                self.state = "running"
+                began = time.monotonic()
+                failed = False
+                try:
+                    super().run()
+                except Exception as exc:
+                    failed = True
+                    self.last_error = repr(exc)
+                    logger.exception(f"Thread '{self.name}' crashed")
+                if not self._should_restart(failed):
+                    self.state = "failed" if failed and not self.stopped() else "finished"
+                    return
+                if time.monotonic() - began > STABLE_AFTER:
+                    backoff = self.backoff_min
+                self.state = "backoff"
+                self.restarts += 1
+                logger.warning(f"Restarting thread '{self.name}' in {backoff:.1f}s (#{self.restarts})")
+                if self._stop_event.wait(backoff):
+                    self.state = "finished"
+                    return
+                backoff = min(backoff * 2, self.backoff_max)
+        finally:
+            self._cpu = time.thread_time()
+            self.ended_at = time.monotonic()
+
+    def runtime(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.ended_at or time.monotonic()) - self.started_at
+
+    def cpu_time(self) -> float:
+        """CPU-Sekunden des Threads, auch während er läuft (pthread_getcpuclockid)."""
+        if self.ended_at is None and self.is_alive():
+            try:
+                return time.clock_gettime(time.pthread_getcpuclockid(self.ident))
+            except (AttributeError, OSError):
+                return 0.0
+        return self._cpu
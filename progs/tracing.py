@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tracing für die heißen Pfade: Discovery -> Identify -> Registry -> Post.
+
+Spans als Kontextmanager oder Decorator, verschachtelt über contextvars;
+das funktioniert über await, asyncio-Tasks (gather/ensure_future kopieren
+den Kontext) und asyncio.to_thread hinweg:
+
+    import tracing
+    tracing.enable()                                   # oder cfg Trace / DECO_TRACE=1
+    with tracing.span("scan", method="SWEEP"):
+        ...
+    @tracing.traced("registry.update")
+    def update_registry(...): ...
+
+Abgeschlossene Spans landen in einem Ringpuffer (BUFFER_SIZE, die ältesten
+fallen heraus) und lassen sich exportieren:
+
+    tracing.export_chrome("trace.json")    # chrome://tracing bzw. ui.perfetto.dev
+    tracing.export_folded("scan.folded")   # flamegraph.pl / speedscope
+
+Jede Task und jeder Thread bekommt im Chrome-Trace eine eigene Spur, damit
+nebenläufige Spans (z.B. die Proben in identify_device) sich nicht
+überlappen. Abgeschaltet (Default) liefert span() ein gemeinsames
+Nichts-Objekt und traced() ruft die Funktion direkt auf, es bleibt ein
+Test auf ein Modul-Flag.
+"""
+
+import asyncio
+import collections
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+BUFFER_SIZE = 100_000     # Spans im Ringpuffer (cfg TraceBuffer)
+ENV_FLAG = "DECO_TRACE"   # DECO_TRACE=1 schaltet ein, auch ohne cfg Trace
+
+_enabled = False
+_buffer = collections.deque(maxlen=BUFFER_SIZE)
+_ids = itertools.count(1)
+_epoch = time.perf_counter_ns()
+_current = contextvars.ContextVar("deco_span", default=None)
+
+
+def enable(buffer_size: int = None) -> None:
+    global _enabled, _buffer
+    if buffer_size is not None and buffer_size != _buffer.maxlen:
+        _buffer = collections.deque(_buffer, maxlen=buffer_size)
+    _enabled = True
+    logger.info("Tracing enabled, buffer %d spans", _buffer.maxlen)
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def from_cfg(cfg) -> bool:
+    """Einschalten, wenn cfg Trace oder DECO_TRACE gesetzt ist. Liefert den Zustand."""
+    if cfg.get("Trace") or os.environ.get(ENV_FLAG, "") not in ("", "0"):
+        enable(cfg.get("TraceBuffer", BUFFER_SIZE))
+    return _enabled
+
+
+def clear() -> None:
+    _buffer.clear()
+
+# ---------------------------------------------------------------------------
+# Spans
+# ---------------------------------------------------------------------------
+
+class SpanRecord:
+    __slots__ = ("id", "parent", "track", "name", "path", "start", "duration", "thread", "attrs")
+
+    def __init__(self, id, parent, track, name, path, start, duration, thread, attrs):
+        self.id = id
+        self.parent = parent
+        self.track = track
+        self.name = name
+        self.path = path              # Namen von der Wurzel bis hier
+        self.start = start            # ns seit Programmstart
+        self.duration = duration      # ns
+        self.thread = thread
+        self.attrs = attrs
+
+    def __repr__(self):
+        return f"SpanRecord({self.name}, {self.duration / 1e6:.3f} ms)"
+
+
+def _owner():
+    """Thread und asyncio-Task, in denen ein Span läuft."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return threading.get_ident(), id(task) if task is not None else None
+
+
+class Span:
+    __slots__ = ("name", "attrs", "id", "parent", "track", "path", "owner", "start", "_token")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs) -> None:
+        """Attribute nachtragen, z.B. das Ergebnis."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _current.get()
+        self.id = next(_ids)
+        self.owner = _owner()
+        if parent is None:
+            self.parent, self.track, self.path = None, self.id, (self.name,)
+        else:
+            self.parent = parent.id
+            self.path = parent.path + (self.name,)
+            # andere Task oder anderer Thread: eigene Spur, sonst überlappen sich die Spans
+            self.track = parent.track if parent.owner == self.owner else self.id
+        self._token = _current.set(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # in einem anderen Kontext beendet (z.B. Generator über Tasks hinweg)
+            _current.set(None)
+        if exc_type is not None:
+            self.attrs["error"] = "cancelled" if exc_type is asyncio.CancelledError else repr(exc)
+        _buffer.append(SpanRecord(self.id, self.parent, self.track, self.name, self.path,
+                                  self.start - _epoch, end - self.start, self.owner[0], self.attrs))
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+_NOSPAN = _NoSpan()
+
+
+def span(name: str, **attrs):
+    """with span("identify", ip=ip): ... ; abgeschaltet ein gemeinsames Nichts-Objekt."""
+    if not _enabled:
+        return _NOSPAN
+    return Span(name, attrs)
+
+
+def traced(name: str = None):
+    """Decorator für Funktionen und Coroutinen; Name Default: Modul.Funktion."""
+    def decorate(fn):
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await fn(*args, **kwargs)
+                with Span(label, {}):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with Span(label, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def spans() -> list:
+    """Kopie des Ringpuffers, älteste zuerst."""
+    return list(_buffer)
+
+
+def _write(path, text: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    logger.info("Trace written to %s", path)
+
+
+def export_chrome(path=None, records: list = None) -> dict:
+    """Chrome Trace Event Format ("X"-Events, ts/dur in µs); mit path auch als Datei."""
+    records = spans() if records is None else records
+    by_id = {rec.id: rec for rec in records}
+    pid = os.getpid()
+    events = []
+    for rec in records:
+        if rec.id == rec.track:
+            # Spur nach ihrem ersten Span benennen, z.B. "identify ip=10.0.0.5";
+            # ohne eigene Attribute die des Eltern-Spans (Proben -> ip)
+            attrs = rec.attrs or getattr(by_id.get(rec.parent), "attrs", {})
+            label = " ".join([rec.name] + [f"{k}={v}" for k, v in attrs.items() if k != "error"])
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": rec.track,
+                           "args": {"name": label}})
+        events.append({"name": rec.name, "cat": rec.path[0], "ph": "X", "pid": pid, "tid": rec.track,
+                       "ts": rec.start / 1000, "dur": rec.duration / 1000,
+                       "args": dict(rec.attrs, thread=rec.thread)})
+    trace = {"traceEvents": events, "displayTimeUnit": "ms"}
+    if path is not None:
+        _write(path, json.dumps(trace, default=str))
+    return trace
+
+
+def export_folded(path=None, records: list = None) -> str:
+    """
+    Eine Zeile "wurzel;kind;enkel µs" pro Pfad, Wert ist die Eigenzeit
+    (Dauer minus Kinder). Nebenläufige Kinder können die Dauer des Eltern-
+    Spans übersteigen, die Eigenzeit wird dann 0.
+    """
+    records = spans() if records is None else records
+    children = collections.defaultdict(int)
+    for rec in records:
+        if rec.parent is not None:
+            children[rec.parent] += rec.duration
+    folded = collections.defaultdict(int)
+    for rec in records:
+        folded[";".join(rec.path)] += max(rec.duration - children.get(rec.id, 0), 0)
+    text = "".join(f"{stack} {ns // 1000}\n" for stack, ns in sorted(folded.items()) if ns >= 1000)
+    if path is not None:
+        _write(path, text)
+    return text
+
+
+def summary(records: list = None) -> dict:
+    """{name: {"count", "total_ms", "max_ms"}} über den Puffer, größte Summe zuerst."""
+    records = spans() if records is None else records
+    result = {}
+    for rec in records:
+        entry = result.setdefault(rec.name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        ms = rec.duration / 1e6
+        entry["count"] += 1
+        entry["total_ms"] += ms
+        entry["max_ms"] = max(entry["max_ms"], ms)
+    return dict(sorted(result.items(), key=lambda kv: -kv[1]["total_ms"]))
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gemeinsamer HTTP-Transport für alle Gerätetreiber.
+
+- keep-alive Verbindungen, höchstens POOL_SIZE gleichzeitig pro Host
+- Timeouts und Wiederholungen mit exponentiellem Backoff, per Default nur für
+  GET/HEAD (ein POST kann angekommen sein, auch wenn die Antwort fehlt);
+  pro Aufruf überschreibbar mit retries=, z.B. retries=0
+- sync (httpx.Client) und async (httpx.AsyncClient pro Event-Loop), jeweils
+  ein Client pro Host: der Pool von httpcore sucht bei jedem Request über
+  alle Verbindungen, mit hunderten Geräten in einem Pool wird das quadratisch
+- Statistik pro Host: Requests, neu aufgebaute Verbindungen, Wiederverwendung,
+  Timeouts; Latenz pro Versuch als Histogramm (metrics.HTTP_REQUEST_SECONDS)
+
+Verwendung:
+    from transport import get_transport
+    data = get_transport().get_json(f"http://{ip}/rpc/Shelly.GetStatus")
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from metrics import HTTP_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("httpcore").setLevel(logging.WARNING)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+POOL_SIZE = 2             # max. gleichzeitige Verbindungen pro Host (Shellys haben wenige Sockets)
+HTTP_TIMEOUT = 5.0        # Default-Timeout pro Request
+RETRIES = 2               # Wiederholungen nach dem ersten Versuch
+BACKOFF = 0.2             # Sekunden, verdoppelt sich pro Wiederholung
+KEEPALIVE_EXPIRY = 30.0   # Sekunden, die eine freie Verbindung offen bleibt
+RETRY_STATUS = (502, 503, 504)
+IDEMPOTENT = ("GET", "HEAD")   # nur diese Methoden werden per Default wiederholt
+
+# httpx wird erst beim ersten Request geladen (Startzeit von Einmal-Läufen)
+httpx = None
+
+
+def _load_httpx():
+    global httpx
+    if httpx is None:
+        import httpx as module
+        httpx = module
+    return httpx
+
+# ---------------------------------------------------------------------------
+# Statistik
+# ---------------------------------------------------------------------------
+
+class HostStats:
+    __slots__ = ("requests", "connections", "retries", "timeouts", "errors", "latency")
+
+    def __init__(self, host: str):
+        self.requests = 0
+        self.connections = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.latency = HTTP_REQUEST_SECONDS.labels(host)   # einmal pro Host nachgeschlagen
+
+    def as_dict(self) -> dict:
+        reused = max(self.requests - self.connections, 0)
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "reused": reused,
+            "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+        }
+
+# ---------------------------------------------------------------------------
+# Transport
+# ---------------------------------------------------------------------------
+
+class Transport:
+    def __init__(self, pool_size: int = POOL_SIZE, timeout: float = HTTP_TIMEOUT,
+                 retries: int = RETRIES, backoff: float = BACKOFF):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._ssl = None             # ein SSLContext für alle Clients (Aufbau kostet ~40 ms)
+        self._clients = {}           # host -> httpx.Client
+        self._aclients = {}          # loop -> {host: (AsyncClient, asyncio.Semaphore)}
+        self._host_sems = {}         # host -> threading.BoundedSemaphore
+        self._stats = {}             # host -> HostStats
+
+    # -- intern -------------------------------------------------------------
+
+    def _host_stats(self, host: str) -> HostStats:
+        st = self._stats.get(host)
+        if st is None:
+            with self._lock:
+                st = self._stats.setdefault(host, HostStats(host))
+        return st
+
+    def _client_kwargs(self) -> dict:
+        _load_httpx()
+        if self._ssl is None:
+            import ssl
+            self._ssl = ssl.create_default_context()
+        # ein Client pro Host, der Semaphor begrenzt zusätzlich die gleichzeitigen Requests
+        limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size,
+                              keepalive_expiry=KEEPALIVE_EXPIRY)
+        return {"limits": limits, "timeout": self.timeout, "verify": self._ssl}
+
+    def _sync_client(self, host: str) -> httpx.Client:
+        client = self._clients.get(host)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(host)
+                if client is None:
+                    kwargs = self._client_kwargs()
+                    client = self._clients[host] = httpx.Client(**kwargs)
+        return client
+
+    def _sync_semaphore(self, host: str) -> threading.BoundedSemaphore:
+        sem = self._host_sems.get(host)
+        if sem is None:
+            with self._lock:
+                sem = self._host_sems.setdefault(host, threading.BoundedSemaphore(self.pool_size))
+        return sem
+
+    def _async_client(self, host: str):
+        loop = asyncio.get_running_loop()
+        clients = self._aclients.get(loop)
+        if clients is None:
+            # Clients gestorbener Loops verwerfen (mit runtime.get_runtime() gibt es nur einen,
+            # asyncio.run() in Tests und Benchmarks erzeugt aber jedes Mal einen neuen)
+            for old in [lp for lp in self._aclients if lp.is_closed()]:
+                del self._aclients[old]
+            clients = self._aclients[loop] = {}
+        entry = clients.get(host)
+        if entry is None:
+            kwargs = self._client_kwargs()
+            entry = clients[host] = (httpx.AsyncClient(**kwargs), asyncio.Semaphore(self.pool_size))
+        return entry
+
+    def _retries(self, method: str, retries: int | None) -> int:
+        if retries is not None:
+            return retries
+        return self.retries if method.upper() in IDEMPOTENT else 0
+
+    @staticmethod
+    def _should_retry(attempt: int, retries: int, resp=None) -> bool:
+        if attempt >= retries:
+            return False
+        return resp is None or resp.status_code in RETRY_STATUS
+
+    # -- sync ---------------------------------------------------------------
+
+    def request(self, method: str, url: str, retries: int = None, **kwargs) -> httpx.Response:
+        """retries: Wiederholungen für diesen Aufruf, Default RETRIES bei GET/HEAD, sonst 0."""
+        retries = self._retries(method, retries)
+        host = urlsplit(url).netloc
+        st = self._host_stats(host)
+
+        def trace(event, info):
+            if event == "connection.connect_tcp.started":
+                st.connections += 1
+
+        kwargs.setdefault("extensions", {})["trace"] = trace
+        client = self._sync_client(host)
+        attempt = 0
+        while True:
+            st.requests += 1
+            try:
+                with self._sync_semaphore(host):
+                    start = time.perf_counter()
+                    resp = client.request(method, url, **kwargs)
+                st.latency.observe(time.perf_counter() - start)
+            except httpx.TransportError as exc:
+                if isinstance(exc, httpx.TimeoutException):
+                    st.timeouts += 1
+                if not self._should_retry(attempt, retries):
+                    st.errors += 1
+                    raise
+                logger.debug("%s %s failed (%s), retry %d", method, url, exc, attempt + 1)
+            else:
+                if not self._should_retry(attempt, retries, resp):
+                    return resp
+            st.retries += 1
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get_json(self, url: str, **kwargs):
+        resp = self.get(url, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
+    # -- async --------------------------------------------------------------
+
+    async def arequest(self, method: str, url: str, retries: int = None, **kwargs) -> httpx.Response:
+        retries = self._retries(method, retries)
+        host = urlsplit(url).netloc
+        st = self._host_stats(host)
+
+        async def trace(event, info):
+            if event == "connection.connect_tcp.started":
+                st.connections += 1
+
+        kwargs.setdefault("extensions", {})["trace"] = trace
+        client, sem = self._async_client(host)
+        attempt = 0
+        while True:
+            st.requests += 1
+            try:
+                async with sem:
+                    start = time.perf_counter()
+                    resp = await client.request(method, url, **kwargs)
+                st.latency.observe(time.perf_counter() - start)
+            except httpx.TransportError as exc:
+                if isinstance(exc, httpx.TimeoutException):
+                    st.timeouts += 1
+                if not self._should_retry(attempt, retries):
+                    st.errors += 1
+                    raise
+                logger.debug("%s %s failed (%s), retry %d", method, url, exc, attempt + 1)
+            else:
+                if not self._should_retry(attempt, retries, resp):
+                    return resp
+            st.retries += 1
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    async def aget(self, url: str, **kwargs) -> httpx.Response:
+        return await self.arequest("GET", url, **kwargs)
+
+    async def apost(self, url: str, **kwargs) -> httpx.Response:
+        return await self.arequest("POST", url, **kwargs)
+
+    async def aget_json(self, url: str, **kwargs):
+        resp = await self.aget(url, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
+    # -- Verwaltung ---------------------------------------------------------
+
+    def stats(self) -> dict:
+        """Statistik pro Host ("ip:port"), u.a. wie viele Requests keinen Handshake brauchten."""
+        return {host: st.as_dict() for host, st in list(self._stats.items())}
+
+    def close(self) -> None:
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        for client in clients.values():
+            client.close()
+
+    async def aclose(self) -> None:
+        clients = self._aclients.pop(asyncio.get_running_loop(), None) or {}
+        for client, _ in clients.values():
+            await client.aclose()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> Transport:
+    """Prozessweit gemeinsamer Transport."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = Transport()
+    return _transport
+
+
+def configure_transport(**kwargs) -> Transport:
+    """Ersetzt den gemeinsamen Transport, z.B. configure_transport(pool_size=1, retries=3)."""
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            _transport.close()
+        _transport = Transport(**kwargs)
+    return _transport
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Eingebetteter Zeitreihen-Speicher für Shelly-Messwerte (apower, voltage, ...).
+
+Pro Gerät und Kanal gibt es drei Ringpuffer (Stufen), jeder als eigene,
+per mmap eingeblendete Datei unter RRDPath/<device>/<channel>.<stufe>
+(unter Windows unzulässige Zeichen wie ":" als %XX, z.B. switch%3A0.apower.raw):
+
+    raw   1 s     Zeitstempel + Wert
+    1m    60 s    Zeitstempel, Anzahl, Summe, Min, Max
+    1h    3600 s  wie 1m
+
+Der Slot ergibt sich direkt aus dem Zeitstempel (bucket % capacity), die
+Spalten liegen hintereinander (columnar). Der Speicherbedarf im Prozess
+bleibt konstant, die Daten liegen im Page-Cache des Betriebssystems.
+Abfragen und Aggregationen arbeiten auf ganzen Spalten-Slices; ist numpy
+installiert, vektorisiert, sonst mit den eingebauten Funktionen.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:       # optional, nur für schnellere Abfragen
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Konfiguration
+# ---------------------------------------------------------------------------
+
+# (Name, Schrittweite in s, Anzahl Slots)
+TIERS = (
+    ("raw", 1, 7 * 86400),           # 7 Tage Sekundenwerte
+    ("1m", 60, 400 * 1440),          # gut 13 Monate Minutenwerte
+    ("1h", 3600, 10 * 365 * 24),     # 10 Jahre Stundenwerte
+)
+
+# Spalten (Name, array-Typcode); 8-Byte-Spalten zuerst wegen der Ausrichtung
+# Werte als double: Energiezähler (aenergy.total) brauchen mehr als 7 Stellen
+RAW_COLUMNS = (("v", "d"), ("t", "I"))
+AGG_COLUMNS = (("sum", "d"), ("min", "d"), ("max", "d"), ("t", "I"), ("n", "I"))
+
+MAGIC = b"DECOTS1\0"
+HEADER = struct.Struct("<8sIIQ")          # magic, step, capacity, reserved
+HEADER_SIZE = 32
+ITEMSIZE = {"I": 4, "d": 8}
+
+# in Dateinamen unter Windows unzulässig -> %XX ("/" wird wie bisher zu "_")
+UNSAFE_CHARS = str.maketrans({c: f"%{ord(c):02X}" for c in '<>:"\\|?*'})
+
+# Felder aus den read_all()-Daten -> Kanalname
+FIELDS = ("apower", "voltage", "current", "aenergy", "temperature")
+
+# ---------------------------------------------------------------------------
+# Ringpuffer (eine Datei)
+# ---------------------------------------------------------------------------
+
+class Ring:
+    def __init__(self, path: Path, step: int, capacity: int, columns):
+        self.path = path
+        self.step = step
+        self.capacity = capacity
+        self.aggregated = columns is AGG_COLUMNS
+        size = HEADER_SIZE + capacity * sum(ITEMSIZE[c] for _, c in columns)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not path.exists() or os.path.getsize(path) != size:
+            if path.exists():
+                logger.warning("Resetting %s (layout changed)", path)
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, step, capacity, 0))
+                f.truncate(size)
+        with open(path, "r+b") as f:
+            # das mmap bleibt gültig, auch wenn die Datei wieder geschlossen ist
+            self._mm = mmap.mmap(f.fileno(), size)
+
+        magic, fstep, fcap, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or fstep != step or fcap != capacity:
+            raise ValueError(f"{path}: unexpected header")
+
+        self.cols = {}
+        offset = HEADER_SIZE
+        view = memoryview(self._mm)
+        for name, code in columns:
+            length = capacity * ITEMSIZE[code]
+            self.cols[name] = view[offset:offset + length].cast(code)
+            offset += length
+
+    def put(self, ts: float, value: float) -> None:
+        bucket = int(ts) // self.step
+        slot = bucket % self.capacity
+        c = self.cols
+        if not self.aggregated:
+            c["t"][slot] = bucket
+            c["v"][slot] = value
+        elif c["t"][slot] != bucket:
+            c["t"][slot] = bucket
+            c["n"][slot] = 1
+            c["sum"][slot] = value
+            c["min"][slot] = value
+            c["max"][slot] = value
+        else:
+            c["n"][slot] += 1
+            c["sum"][slot] += value
+            if value < c["min"][slot]:
+                c["min"][slot] = value
+            if value > c["max"][slot]:
+                c["max"][slot] = value
+
+    def _slices(self, start: float, end: float):
+        """Zusammenhängende Slot-Bereiche [(erster bucket, slot_a, slot_b)] für [start, end]."""
+        b1 = int(end) // self.step
+        b0 = max(int(start) // self.step, b1 - self.capacity + 1)
+        if b0 > b1:
+            return []
+        s0 = b0 % self.capacity
+        count = b1 - b0 + 1
+        if s0 + count <= self.capacity:
+            return [(b0, s0, s0 + count)]
+        first = self.capacity - s0
+        return [(b0, s0, self.capacity), (b0 + first, 0, count - first)]
+
+    def select(self, start: float, end: float, column: str = "avg"):
+        """
+        (Zeitstempel, Werte) aller gültigen Slots im Bereich. column: "v" (raw),
+        "avg", "min", "max" oder "n" (aggregierte Stufen).
+        """
+        src = "sum" if column == "avg" else column
+        ts_out, val_out = [], []
+        for bucket, a, b in self._slices(start, end):
+            t = self.cols["t"][a:b]
+            v = self.cols[src][a:b]
+            if np is not None:
+                t = np.frombuffer(t, dtype=np.uint32)
+                mask = t == np.arange(bucket, bucket + (b - a), dtype=np.uint32)
+                vals = np.frombuffer(v, dtype=v.format)[mask].astype(np.float64)
+                if column == "avg":
+                    vals /= np.frombuffer(self.cols["n"][a:b], dtype=np.uint32)[mask]
+                ts_out.extend((t[mask].astype(np.int64) * self.step).tolist())
+                val_out.extend(vals.tolist())
+            else:
+                n = self.cols["n"][a:b] if column == "avg" else None
+                for i, (tb, tv) in enumerate(zip(t, v)):
+                    if tb == bucket + i:
+                        ts_out.append(tb * self.step)
+                        val_out.append(tv / n[i] if n is not None else tv)
+        return ts_out, val_out
+
+    def close(self) -> None:
+        for col in self.cols.values():
+            col.release()
+        self.cols = {}
+        self._mm.close()
+
+# ---------------------------------------------------------------------------
+# Store
+# ---------------------------------------------------------------------------
+
+class TimeSeriesStore:
+    def __init__(self, path, tiers=TIERS):
+        self.path = Path(path)
+        self.tiers = tiers
+        self._series = {}          # (device, channel) -> [Ring pro Stufe]
+
+    @staticmethod
+    def _safe(name: str) -> str:
+        return str(name).replace("/", "_").replace(os.sep, "_").translate(UNSAFE_CHARS)
+
+    @staticmethod
+    def _legacy(name: str) -> str:
+        """Dateiname vor dem Escaping von ":" usw."""
+        return str(name).replace("/", "_").replace(os.sep, "_")
+
+    def _file(self, device: str, channel: str, tier: str) -> Path:
+        path = self.path / self._safe(device) / f"{self._safe(channel)}.{tier}"
+        old = self.path / self._legacy(device) / f"{self._legacy(channel)}.{tier}"
+        if old != path and not path.exists() and old.exists():
+            # Datei aus einer älteren Version übernehmen statt neu anzulegen
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(old, path)
+            logger.info("Renamed %s to %s", old, path)
+        return path
+
+    def _rings(self, device: str, channel: str) -> list:
+        key = (device, channel)
+        rings = self._series.get(key)
+        if rings is None:
+            rings = self._series[key] = [
+                Ring(self._file(device, channel, name), step, capacity,
+                     RAW_COLUMNS if i == 0 else AGG_COLUMNS)
+                for i, (name, step, capacity) in enumerate(self.tiers)
+            ]
+        return rings
+
+    def record(self, device: str, channel: str, value, ts: float = None) -> None:
+        if value is None:
+            return
+        ts = time.time() if ts is None else ts
+        for ring in self._rings(device, channel):
+            ring.put(ts, float(value))
+
+    def record_reading(self, device: str, data: dict, ts: float = None) -> int:
+        """
+        Übernimmt die Messwerte aus read_all(): "switch" (ein Kanal) oder
+        "switches" ({idx: {...}}). Kanalnamen: "switch:<idx>.<feld>".
+        """
+        ts = time.time() if ts is None else ts
+        switches = data.get("switches") or {"0": data.get("switch") or {}}
+        count = 0
+        for idx, values in switches.items():
+            for fld in FIELDS:
+                value = values.get(fld)
+                if isinstance(value, dict):     # aenergy: {"total": ...}, temperature: {"tC": ...}
+                    value = value.get("total", value.get("tC"))
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.record(device, f"switch:{idx}.{fld}", value, ts)
+                    count += 1
+        return count
+
+    def _tier_for(self, start: float, now: float) -> int:
+        """Feinste Stufe, die bis start zurückreicht."""
+        for i, (_, step, capacity) in enumerate(self.tiers):
+            if now - start <= step * capacity:
+                return i
+        return len(self.tiers) - 1
+
+    def _select(self, device: str, channel: str, start: float, end: float, tier: str):
+        """(Ring, Stufenindex, end) für die Abfrage."""
+        now = time.time()
+        end = now if end is None else end
+        if tier is None:
+            idx = self._tier_for(start, now)
+        else:
+            idx = [name for name, _, _ in self.tiers].index(tier)
+        return self._rings(device, channel)[idx], idx, end
+
+    def query(self, device: str, channel: str, start: float, end: float = None,
+              tier: str = None, column: str = "avg"):
+        """
+        (Zeitstempel, Werte) im Bereich. column gilt für die aggregierten Stufen:
+        "avg", "min", "max", "sum", "n"; in der raw-Stufe gibt es nur den Wert.
+        """
+        ring, idx, end = self._select(device, channel, start, end, tier)
+        return ring.select(start, end, "v" if idx == 0 else column)
+
+    def aggregate(self, device: str, channel: str, start: float, end: float = None,
+                  fn: str = "avg", tier: str = None):
+        """
+        avg/min/max/sum/count über den Bereich, None wenn keine Daten. In den
+        aggregierten Stufen zählen die Einzelwerte: avg = Σsum / Σn,
+        sum = Σsum, count = Σn (nicht der Mittelwert der Bucket-Mittel).
+        """
+        ring, idx, end = self._select(device, channel, start, end, tier)
+        if idx > 0 and fn in ("avg", "sum", "count"):
+            _, sums = ring.select(start, end, "sum")
+            if not sums:
+                return None
+            _, counts = ring.select(start, end, "n")
+            if np is not None:
+                total, n = float(np.sum(sums)), int(np.sum(counts))
+            else:
+                total, n = sum(sums), int(sum(counts))
+            return {"avg": total / n if n else None, "sum": total, "count": n}[fn]
+        _, values = ring.select(start, end, "v" if idx == 0 else fn)
+        if not values:
+            return None
+        if fn == "count":
+            return len(values)
+        if np is not None:
+            arr = np.asarray(values)
+            return float({"avg": arr.mean, "min": arr.min, "max": arr.max, "sum": arr.sum}[fn]())
+        return {"avg": lambda v: sum(v) / len(v), "min": min, "max": max, "sum": sum}[fn](values)
+
+    def flush(self) -> None:
+        for rings in self._series.values():
+            for ring in rings:
+                ring._mm.flush()
+
+    def close(self) -> None:
+        for rings in self._series.values():
+            for ring in rings:
+                ring.close()
+        self._series.clear()